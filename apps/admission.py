@@ -0,0 +1,208 @@
+"""Admission control: limit the requests of each class a worker process handles at the same time.
+
+Requests are classed by their URL name and method, see `classify`. Every class has a number of slots, the limits
+    only apply once the worker is saturated though: while it handles fewer than `ADMISSION_CAPACITY` requests
+    (its threads) a request without a slot of its class borrows a free one. Once it is saturated a request waits
+    for a slot of its class, up to the timeout of its class: writes and uploads wait, the background location polls
+    and search don't. A request that doesn't get a slot is shed with a fast `429 Too Many Requests` and a
+    `Retry-After`, a poll gets the last payload the user polled instead when there is one, so the map doesn't lose
+    its markers.
+
+The limits are set with the `ADMISSION_CLASSES` setting. Per class the `metrics` counters `admission.<class>.admitted`,
+    `.borrowed` (admitted without a slot of its class), `.queued` (had to wait for a slot), `.wait_ms` (the total
+    time waited), `.shed` and `.stale` are kept.
+"""
+import hashlib
+import threading
+import time
+from typing import AsyncIterator, Callable, Iterator, NamedTuple, Optional, Union
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.urls import Resolver404, resolve
+
+from apps import metrics
+
+POLL = "poll"
+SEARCH = "search"
+PAGE = "page"
+WRITE = "write"
+UPLOAD = "upload"
+
+# The classes of requests that can't be told apart by their method, other requests are pages or writes.
+VIEWS = {
+    "campaigns:maps:locations:list": POLL,
+    "full-search": SEARCH,
+    "create-upload": UPLOAD,
+    "receive-upload": UPLOAD,
+    "receive-chunk": UPLOAD,
+}
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+STALE_TIMEOUT = 60 * 10
+
+metrics.register(
+    *(
+        f"admission.{name}.{counter}"
+        for name in (POLL, SEARCH, PAGE, WRITE, UPLOAD)
+        for counter in ("admitted", "borrowed", "queued", "wait_ms", "shed", "stale")
+    )
+)
+
+_semaphores: dict[tuple[str, int], threading.BoundedSemaphore] = {}
+_semaphores_lock = threading.Lock()
+# The requests the worker process handles, admitted by `acquire` and not released yet.
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+Release = Callable[[], None]
+
+
+class AdmissionClass(NamedTuple):
+    name: str
+    # The number of requests a worker process handles at the same time.
+    limit: int
+    # The seconds a request may wait for a slot.
+    timeout: float
+    retry_after: int
+    # Serve the last response of the user to a shed request.
+    stale: bool = False
+
+
+def get_class(name: str) -> AdmissionClass:
+    return AdmissionClass(name, **settings.ADMISSION_CLASSES[name])
+
+
+def classify(request: HttpRequest) -> str:
+    try:
+        view_name = resolve(request.path_info).view_name
+    except Resolver404:
+        view_name = None
+    if view_name in VIEWS:
+        return VIEWS[view_name]
+    if request.method in SAFE_METHODS:
+        return PAGE
+    return WRITE
+
+
+def get_semaphore(admission_class: AdmissionClass) -> threading.BoundedSemaphore:
+    key = (admission_class.name, admission_class.limit)
+    with _semaphores_lock:
+        if key not in _semaphores:
+            _semaphores[key] = threading.BoundedSemaphore(admission_class.limit)
+        return _semaphores[key]
+
+
+def admit(
+    admission_class: AdmissionClass, semaphore: Optional[threading.BoundedSemaphore]
+) -> Release:
+    """Count the request in flight, returns the function that releases it and its slot, once."""
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += 1
+    released = threading.Event()
+
+    def release() -> None:
+        global _in_flight
+        with _in_flight_lock:
+            if released.is_set():
+                return
+            released.set()
+            _in_flight -= 1
+        if semaphore is not None:
+            semaphore.release()
+
+    metrics.increment(f"admission.{admission_class.name}.admitted")
+    return release
+
+
+def is_saturated() -> bool:
+    """Whether the worker handles as many requests as it has threads, this request included."""
+    return _in_flight + 1 >= settings.ADMISSION_CAPACITY
+
+
+def acquire(admission_class: AdmissionClass) -> Optional[Release]:
+    """Admit the request, returns the function that releases it or None when the request is to be shed.
+
+    This blocks while the request waits for a slot, don't call it on the event loop.
+    """
+    semaphore = get_semaphore(admission_class)
+    if semaphore.acquire(blocking=False):
+        return admit(admission_class, semaphore)
+    if not is_saturated():
+        metrics.increment(f"admission.{admission_class.name}.borrowed")
+        return admit(admission_class, None)
+    if admission_class.timeout <= 0:
+        return None
+    metrics.increment(f"admission.{admission_class.name}.queued")
+    start = time.monotonic()
+    acquired = semaphore.acquire(timeout=admission_class.timeout)
+    metrics.increment(
+        f"admission.{admission_class.name}.wait_ms",
+        round((time.monotonic() - start) * 1000),
+    )
+    if acquired:
+        return admit(admission_class, semaphore)
+    return None
+
+
+class ReleasingContent:
+    """The content of a streaming response, which releases the request when the server closes the response."""
+
+    def __init__(self, content: Iterator[bytes], release: Release) -> None:
+        self.content = content
+        self.close = release
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(self.content)
+
+
+class AsyncReleasingContent(ReleasingContent):
+    content: AsyncIterator[bytes]  # type: ignore[assignment]
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return aiter(self.content)
+
+
+def release_after(
+    response: Union[HttpResponse, StreamingHttpResponse], release: Release
+) -> None:
+    """Release the request once the response is sent. A stream is produced after the view returns."""
+    if not response.streaming:
+        release()
+    elif response.is_async:
+        response.streaming_content = AsyncReleasingContent(
+            response.streaming_content, release
+        )
+    else:
+        response.streaming_content = ReleasingContent(
+            response.streaming_content, release
+        )
+
+
+def get_stale_key(request: HttpRequest) -> str:
+    path = hashlib.md5(request.get_full_path().encode(), usedforsecurity=False)
+    return f"admission.stale.{request.user.pk}.{path.hexdigest()}"
+
+
+def keep_stale(request: HttpRequest, response: HttpResponse) -> None:
+    if (
+        request.method == "GET"
+        and response.status_code == 200
+        and not response.streaming
+        and request.user.is_authenticated
+    ):
+        cache.set(get_stale_key(request), response.content, STALE_TIMEOUT)
+
+
+def shed(request: HttpRequest, admission_class: AdmissionClass) -> HttpResponse:
+    """The response to a request that didn't get a slot."""
+    if admission_class.stale and request.user.is_authenticated:
+        content = cache.get(get_stale_key(request))
+        if content is not None:
+            metrics.increment(f"admission.{admission_class.name}.stale")
+            return HttpResponse(content)
+    metrics.increment(f"admission.{admission_class.name}.shed")
+    return HttpResponse(
+        status=429, headers={"Retry-After": str(admission_class.retry_after)}
+    )
@@ -0,0 +1,264 @@
+"""Export a Campaign with its Maps, Locations, NPC's and images to a zip archive and restore it again.
+
+The archive holds a `manifest.json` with the Campaign's data and a `media/` directory with its images,
+    stored under their storage names. Images are streamed through in chunks in both directions, so memory use
+    doesn't depend on the size of the Campaign's map art.
+"""
+import json
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any, Iterator
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Model
+from django.forms import modelform_factory
+
+from apps.campaigns.models import Campaign
+from apps.characters.models import Character
+from apps.locations.models import Location
+from apps.maps.models import Map
+from apps.storage import delete_unreferenced, lock_until_commit
+from apps.users.models import User
+
+VERSION = 1
+CHUNK_SIZE = 1024 * 1024
+MEDIA_UPLOAD_WORKERS = 8
+MANIFEST = "manifest.json"
+MEDIA_DIR = "media/"
+CAMPAIGN_FIELDS = ["name", "description", "image"]
+MAP_FIELDS = ["name", "description", "image", "resolution_width", "resolution_height"]
+LOCATION_FIELDS = ["name", "description", "image", "longitude", "latitude", "hidden"]
+CHARACTER_FIELDS = ["name", "description", "image", "is_npc"]
+
+
+def build_manifest(campaign: Campaign) -> dict:
+    """The Campaign's data with the storage names of its images."""
+    locations = defaultdict(list)
+    for location in (
+        Location.objects.filter(map__campaign=campaign)
+        .order_by("pk")
+        .values("map_id", *LOCATION_FIELDS)
+        .iterator()
+    ):
+        locations[location.pop("map_id")].append(location)
+
+    maps = []
+    for map in campaign.maps.order_by("pk").values("id", *MAP_FIELDS).iterator():
+        map["locations"] = locations[map.pop("id")]
+        maps.append(map)
+
+    return {
+        "version": VERSION,
+        "campaign": {
+            "name": campaign.name,
+            "description": campaign.description,
+            "image": campaign.image.name,
+        },
+        "maps": maps,
+        "characters": list(
+            campaign.characters.order_by("pk").values(*CHARACTER_FIELDS)
+        ),
+    }
+
+
+def get_media(manifest: dict) -> list[str]:
+    """The storage names of all images referenced in the manifest, without duplicates."""
+    names = [manifest["campaign"]["image"]]
+    for map in manifest["maps"]:
+        names.append(map["image"])
+        names += [location["image"] for location in map["locations"]]
+    names += [character["image"] for character in manifest["characters"]]
+    return list(dict.fromkeys(name for name in names if name))
+
+
+class StreamBuffer:
+    """A write-only file-like object that hands the written bytes back to be yielded.
+
+    Because it isn't seekable the `zipfile` module writes the archive sequentially, with data descriptors after
+        each member, which is what makes streaming it possible.
+    """
+
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def pop(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def stream_archive(campaign: Campaign) -> Iterator[bytes]:
+    """Yield the zip archive of a Campaign, reading the images from storage in chunks."""
+    manifest = build_manifest(campaign)
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, mode="w") as archive:
+        archive.writestr(
+            MANIFEST, json.dumps(manifest), compress_type=zipfile.ZIP_DEFLATED
+        )
+        yield buffer.pop()
+        for name in get_media(manifest):
+            if not default_storage.exists(name):
+                continue
+            # Images are compressed already, so they are stored as is.
+            with default_storage.open(name) as source, archive.open(
+                MEDIA_DIR + name, mode="w", force_zip64=True
+            ) as target:
+                for chunk in source.chunks(CHUNK_SIZE):
+                    target.write(chunk)
+                    yield buffer.pop()
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+def clean_object(data: Any, model: type[Model], names: list[str], label: str) -> dict:
+    """The fields of an object of the manifest, validated like the form of the model would.
+
+    Raises ValidationError when the object is missing or one of its fields is invalid.
+    """
+    if not isinstance(data, dict):
+        raise ValidationError(f"The manifest has an invalid {label}.")
+    image = data.get("image") or ""
+    if not isinstance(image, str):
+        raise ValidationError(f"The manifest has a {label} with an invalid image.")
+    form_class = modelform_factory(
+        model, fields=[name for name in names if name != "image"]
+    )
+    form = form_class(data=data)
+    for name, field in form.fields.items():
+        # Like the resolution of a Map, which is read from the image when it's missing.
+        if model._meta.get_field(name).null:
+            field.required = False
+    if not form.is_valid():
+        errors = "; ".join(
+            f"{field}: {' '.join(messages)}" for field, messages in form.errors.items()
+        )
+        raise ValidationError(f"The manifest has an invalid {label}, {errors}")
+    return {**form.cleaned_data, "image": image}
+
+
+def clean_list(data: Any, label: str) -> list:
+    if not isinstance(data, list):
+        raise ValidationError(f"The manifest has invalid {label}.")
+    return data
+
+
+def read_manifest(archive: zipfile.ZipFile) -> dict:
+    """The manifest of the archive with its objects validated, see `clean_object`."""
+    try:
+        manifest = json.loads(archive.read(MANIFEST))
+    except (KeyError, ValueError):
+        raise ValidationError("The archive does not contain a valid manifest.")
+    if not isinstance(manifest, dict):
+        raise ValidationError("The archive does not contain a valid manifest.")
+    if manifest.get("version") != VERSION:
+        raise ValidationError("The archive was made by an unsupported version.")
+    maps = []
+    for data in clean_list(manifest.get("maps"), "maps"):
+        map = clean_object(data, Map, MAP_FIELDS, "map")
+        map["locations"] = [
+            clean_object(location, Location, LOCATION_FIELDS, "location")
+            for location in clean_list(data.get("locations"), "locations")
+        ]
+        maps.append(map)
+    return {
+        "version": VERSION,
+        "campaign": clean_object(
+            manifest.get("campaign"), Campaign, CAMPAIGN_FIELDS, "campaign"
+        ),
+        "maps": maps,
+        "characters": [
+            clean_object(character, Character, CHARACTER_FIELDS, "character")
+            for character in clean_list(manifest.get("characters"), "characters")
+        ],
+    }
+
+
+def upload_media(archive: zipfile.ZipFile, names: list[str]) -> dict[str, str]:
+    """Save the archived images to storage in parallel.
+
+    Return the mapping of archived to saved storage names, as storage names files after their content.
+    """
+    members = set(archive.namelist())
+
+    def upload(name: str) -> str:
+        with archive.open(MEDIA_DIR + name) as member:
+            file = File(member, name=name)
+            file.size = archive.getinfo(MEDIA_DIR + name).file_size
+            return default_storage.save(name, file)
+
+    names = [name for name in names if MEDIA_DIR + name in members]
+    with ThreadPoolExecutor(max_workers=MEDIA_UPLOAD_WORKERS) as executor:
+        return dict(zip(names, executor.map(upload, names)))
+
+
+def restore_archive(file: IO[bytes], dm: User) -> Campaign:
+    """Restore a Campaign from an archive as a new Campaign with the given DM.
+
+    The images are uploaded first, then all rows are inserted in bulk. Player Characters belong to their Players,
+        who can join the restored Campaign with its new invite code, so only NPC's are restored.
+    """
+    try:
+        archive = zipfile.ZipFile(file)
+    except zipfile.BadZipFile:
+        raise ValidationError("The file is not a zip archive.")
+    with archive:
+        manifest = read_manifest(archive)
+        media = upload_media(archive, get_media(manifest))
+        try:
+            return create_campaign(manifest, media=media, dm=dm)
+        except Exception:
+            # Identical images are stored once, leave the ones that are in use already.
+            for name in media.values():
+                delete_unreferenced(name)
+            raise
+
+
+@transaction.atomic
+def create_campaign(manifest: dict, media: dict[str, str], dm: User) -> Campaign:
+    def fields(data: dict, names: list[str]) -> dict:
+        values = {name: data[name] for name in names if name in data}
+        values["image"] = media.get(data.get("image") or "", "")
+        return values
+
+    # The images were saved by other threads, keep them from being deleted until the rows are committed. Sorted,
+    # so concurrent imports lock them in the same order.
+    for name in sorted(set(media.values())):
+        lock_until_commit(name)
+        if not default_storage.exists(name):
+            raise ValidationError("The images couldn't be stored, please try again.")
+    campaign = Campaign(dm=dm, **fields(manifest["campaign"], CAMPAIGN_FIELDS))
+    campaign.save()
+    maps = Map.objects.bulk_create(
+        [Map(campaign=campaign, **fields(map, MAP_FIELDS)) for map in manifest["maps"]]
+    )
+    Location.objects.bulk_create(
+        [
+            Location(map=map, **fields(location, LOCATION_FIELDS))
+            for map, data in zip(maps, manifest["maps"])
+            for location in data["locations"]
+        ]
+    )
+    Character.objects.bulk_create(
+        [
+            Character(
+                campaign=campaign,
+                creator=dm,
+                player=None,
+                **fields(character, CHARACTER_FIELDS),
+            )
+            for character in manifest["characters"]
+            if character.get("is_npc")
+        ]
+    )
+    return campaign
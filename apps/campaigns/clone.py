@@ -0,0 +1,72 @@
+"""Clone a Campaign with its Maps, Locations and NPC's, e.g. to run the same adventure for another group."""
+from django.db import connection, transaction
+from django.db.models import Model
+
+from apps.campaigns.models import Campaign
+from apps.characters.models import Character
+from apps.locations.models import Location
+from apps.maps.models import Map
+from apps.users.models import User
+
+
+def get_columns(model: type[Model], exclude: set[str]) -> list[str]:
+    """The columns copied as is from the original rows."""
+    return [
+        field.column
+        for field in model._meta.concrete_fields
+        if field.name not in {"id", "created", "modified"} | exclude
+    ]
+
+
+def clone_campaign(campaign: Campaign, dm: User, name: str = "") -> Campaign:
+    """Copy the Campaign and its content set based in the database, instead of row by row through the ORM.
+
+    The image files are shared with the original rather than copied, the `keep_shared_files` signal handler
+        makes sure they are only deleted once no clone uses them anymore.
+    The clone gets its own invite code.
+    """
+    map_table = Map._meta.db_table
+    map_columns = get_columns(Map, exclude={"campaign"})
+    location_columns = get_columns(Location, exclude={"map"})
+    character_columns = get_columns(
+        Character, exclude={"campaign", "player", "creator"}
+    )
+
+    with transaction.atomic():
+        clone = Campaign(
+            name=name or campaign.name,
+            description=campaign.description,
+            image=campaign.image.name,
+            dm=dm,
+        )
+        clone.save()
+        with connection.cursor() as cursor:
+            # The new Map ids are taken from the sequence up front so the Locations can be linked to them in the
+            #   same statement. The Location foreign key is deferred, so it is checked at commit.
+            cursor.execute(
+                f"""
+                WITH map_ids AS MATERIALIZED (
+                    SELECT id AS old_id, nextval(pg_get_serial_sequence('{map_table}', 'id')) AS new_id
+                    FROM {map_table}
+                    WHERE campaign_id = %(campaign)s
+                ), maps AS (
+                    INSERT INTO {map_table} (id, created, modified, campaign_id, {", ".join(map_columns)})
+                    SELECT map_ids.new_id, now(), now(), %(clone)s, {", ".join(f"source_map.{column}" for column in map_columns)}
+                    FROM {map_table} source_map JOIN map_ids ON source_map.id = map_ids.old_id
+                )
+                INSERT INTO {Location._meta.db_table} (created, modified, map_id, {", ".join(location_columns)})
+                SELECT now(), now(), map_ids.new_id, {", ".join(f"source_location.{column}" for column in location_columns)}
+                FROM {Location._meta.db_table} source_location JOIN map_ids ON source_location.map_id = map_ids.old_id
+                """,
+                {"campaign": campaign.pk, "clone": clone.pk},
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO {Character._meta.db_table} (created, modified, campaign_id, creator_id, player_id, {", ".join(character_columns)})
+                SELECT now(), now(), %(clone)s, %(dm)s, NULL, {", ".join(character_columns)}
+                FROM {Character._meta.db_table}
+                WHERE campaign_id = %(campaign)s AND is_npc
+                """,
+                {"campaign": campaign.pk, "clone": clone.pk, "dm": dm.pk},
+            )
+    return clone
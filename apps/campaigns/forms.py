@@ -0,0 +1,7 @@
+from django import forms
+
+
+class CampaignImportForm(forms.Form):
+    file = forms.FileField(
+        help_text="A campaign archive exported from Campaign Alchemy."
+    )
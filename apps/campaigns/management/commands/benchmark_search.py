@@ -0,0 +1,58 @@
+import time
+from typing import Callable
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db.models import QuerySet
+from django.template import engines
+
+from apps.search import get_matches, get_search_query, parse, rank, search
+from apps.users.models import User
+
+# How the results were rendered before the snippets: every match, its description cleaned and truncated in Python.
+TEMPLATE_PATH = """{% load bleach_tags %}{% for result in results %}
+<a href="{{ result.get_absolute_url }}">{{ result.name }}</a>
+{% if result.description %}<p>{{ result.description|bleach|truncatewords_html:25 }}</p>{% endif %}
+{% endfor %}"""
+
+
+def render_template_path(queryset: QuerySet) -> str:
+    template = engines["django"].from_string(TEMPLATE_PATH)
+    return template.render({"results": list(queryset)})
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the time it takes to render the search results of a User with the snippets of the top ranked "
+        "results and with the template path, which bleaches and truncates the description of every match."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("username", help="The User who searches.")
+        parser.add_argument("query", help="The search query.")
+        parser.add_argument(
+            "--repeat", type=int, default=10, help="The number of searches to time."
+        )
+
+    def handle(self, *args, **options) -> None:
+        user = User.objects.filter(username=options["username"]).first()
+        if not user:
+            raise CommandError(f"User {options['username']} does not exist.")
+        parsed = parse(options["query"])
+        search_query = get_search_query(parsed)
+        matches = get_matches(user.pk, search_query, parsed.types)
+        paths: list[tuple[str, Callable[[QuerySet], object], list[QuerySet]]] = [
+            (
+                "snippets",
+                search,
+                [rank(queryset, search_query) for queryset in matches],
+            ),
+            ("template path", render_template_path, matches),
+        ]
+        for name, render, querysets in paths:
+            start = time.perf_counter()
+            for _ in range(options["repeat"]):
+                for queryset in querysets:
+                    # A new queryset every time, so the results aren't cached.
+                    render(queryset.all())
+            elapsed = (time.perf_counter() - start) / options["repeat"]
+            self.stdout.write(f"{name}: {elapsed * 1000:.1f}ms per search")
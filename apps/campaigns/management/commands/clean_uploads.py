@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.uploads import clean_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the chunks of abandoned chunked uploads and the storage names of completed uploads that were "
+        "never submitted, once their token has expired. Run it periodically, e.g. hourly from cron."
+    )
+
+    def handle(self, *args, **options) -> None:
+        deleted = clean_expired()
+        self.stdout.write(f"Deleted {deleted} expired upload files.")
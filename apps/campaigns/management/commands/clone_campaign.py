@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from apps.campaigns.clone import clone_campaign
+from apps.campaigns.models import Campaign
+from apps.users.models import User
+
+
+class Command(BaseCommand):
+    help = "Clone a Campaign with its Maps, Locations and NPC's, sharing their images with the original."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("campaign", type=int, help="The pk of the Campaign.")
+        parser.add_argument(
+            "--dm", help="Username of the DM of the clone, defaults to the original DM."
+        )
+        parser.add_argument("--name", default="", help="The name of the clone.")
+
+    def handle(self, *args, **options) -> None:
+        campaign = (
+            Campaign.objects.select_related("dm").filter(pk=options["campaign"]).first()
+        )
+        if not campaign:
+            raise CommandError(f"Campaign {options['campaign']} does not exist.")
+        dm = campaign.dm
+        if options["dm"]:
+            dm = User.objects.filter(username=options["dm"]).first()
+            if not dm:
+                raise CommandError(f"User {options['dm']} does not exist.")
+        clone = clone_campaign(campaign, dm=dm, name=options["name"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Cloned {campaign} to pk {clone.pk} with invite code {clone.invite_code}."
+            )
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from apps.campaigns.archive import stream_archive
+from apps.campaigns.models import Campaign
+
+
+class Command(BaseCommand):
+    help = (
+        "Export a Campaign with its Maps, Locations, NPC's and images to a zip archive."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("campaign", type=int, help="The pk of the Campaign.")
+        parser.add_argument("path", help="The zip archive to write.")
+
+    def handle(self, *args, **options) -> None:
+        campaign = Campaign.objects.filter(pk=options["campaign"]).first()
+        if not campaign:
+            raise CommandError(f"Campaign {options['campaign']} does not exist.")
+        with open(options["path"], "wb") as file:
+            for chunk in stream_archive(campaign):
+                file.write(chunk)
+        self.stdout.write(
+            self.style.SUCCESS(f"Exported {campaign} to {options['path']}.")
+        )
@@ -0,0 +1,26 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from apps.campaigns.archive import restore_archive
+from apps.users.models import User
+
+
+class Command(BaseCommand):
+    help = "Restore a Campaign from a zip archive made by export_campaign as a new Campaign."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("path", help="The zip archive to restore.")
+        parser.add_argument("dm", help="Username of the DM of the restored Campaign.")
+
+    def handle(self, *args, **options) -> None:
+        dm = User.objects.filter(username=options["dm"]).first()
+        if not dm:
+            raise CommandError(f"User {options['dm']} does not exist.")
+        try:
+            with open(options["path"], "rb") as file:
+                campaign = restore_archive(file, dm=dm)
+        except ValidationError as error:
+            raise CommandError("\n".join(error.messages))
+        self.stdout.write(
+            self.style.SUCCESS(f"Restored {campaign} with pk {campaign.pk}.")
+        )
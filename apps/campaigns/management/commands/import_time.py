@@ -0,0 +1,71 @@
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+SETUP = "import django; django.setup(); import {modules}"
+
+
+def parse_importtime(output: str) -> list[tuple[str, int, int]]:
+    """The `(module, self, cumulative)` import times in microseconds from `python -X importtime` output."""
+    times = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_time, cumulative, module = line.removeprefix("import time:").split("|")
+        times.append((module.strip(), int(self_time), int(cumulative)))
+    return times
+
+
+class Command(BaseCommand):
+    help = "Report which modules take the most time to import when Django starts, using `python -X importtime`."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "modules",
+            nargs="*",
+            help="Modules to import after setting up Django, defaults to the URLconf and so all the views.",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=25, help="The number of modules to show."
+        )
+        parser.add_argument(
+            "--packages",
+            action="store_true",
+            help="Sum the times per top level package instead of showing single modules.",
+        )
+
+    def handle(self, *args, **options) -> None:
+        modules = options["modules"] or [settings.ROOT_URLCONF]
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-X",
+                "importtime",
+                "-c",
+                SETUP.format(modules=", ".join(modules)),
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode:
+            raise CommandError(result.stderr.splitlines()[-1])
+        times = parse_importtime(result.stderr)
+
+        if options["packages"]:
+            packages: dict[str, int] = {}
+            for module, self_time, _ in times:
+                package = module.split(".")[0]
+                packages[package] = packages.get(package, 0) + self_time
+            rows = sorted(packages.items(), key=lambda row: row[1], reverse=True)
+        else:
+            rows = sorted(
+                ((module, cumulative) for module, _, cumulative in times),
+                key=lambda row: row[1],
+                reverse=True,
+            )
+        total = sum(self_time for _, self_time, _ in times)
+        self.stdout.write(f"Imported {len(times)} modules in {total / 1000:.0f}ms.")
+        for name, microseconds in rows[: options["limit"]]:
+            self.stdout.write(f"{microseconds / 1000:8.1f}ms  {name}")
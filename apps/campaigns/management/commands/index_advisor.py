@@ -0,0 +1,177 @@
+import re
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection
+from django.db.models import Count, Q, QuerySet
+
+from apps.campaigns.models import Campaign
+from apps.characters.models import Character
+from apps.locations.models import Location
+from apps.maps.models import Map
+from apps.users.models import User
+
+SEQ_SCAN = re.compile(r"Seq Scan on (\w+)")
+INDEX_SCAN = re.compile(
+    r"(?:Index (?:Only )?Scan (?:Backward )?using|Bitmap Index Scan on) (\w+)"
+)
+EXECUTION_TIME = re.compile(r"Execution Time: ([\d.]+) ms")
+
+
+def get_workload(
+    campaign: Campaign, map: Map | None, dm: User, player: User | None
+) -> dict[str, list[QuerySet]]:
+    """The queries the hot views run, keyed by their url name.
+
+    Keep these in sync with the `get_queryset`/`get_object` methods of the views.
+    """
+    user = player or dm
+    term = campaign.name.split()[0] if campaign.name.split() else "campaign"
+    workload = {
+        "campaigns:list": [
+            Campaign.objects.filter(Q(dm=user) | Q(characters__player=user)).distinct()
+        ],
+        "campaigns:detail": [campaign.characters.values_list("player", flat=True)],
+        "campaigns:characters:list": [
+            Character.objects.select_related("campaign").filter(
+                campaign=campaign, is_npc=False
+            )
+        ],
+        "campaigns:characters:npcs": [
+            Character.objects.select_related("campaign").filter(
+                campaign=campaign, is_npc=True
+            )
+        ],
+        "characters:list": [
+            Character.objects.select_related("player")
+            .filter(Q(player=user) | Q(creator=user))
+            .distinct()
+        ],
+        "campaigns:maps:list": [Map.objects.filter(campaign=campaign)],
+        "has_read_access_to_campaign": [
+            user.player_characters.values_list("player_id").union(
+                user.creator_characters.values_list("player_id")
+            ),
+            campaign.characters.values_list("player_id"),
+        ],
+        "full-search": [
+            Character.objects.filter(vector_column=term)
+            .filter(
+                Q(player=user)
+                | Q(creator=user)
+                | Q(campaign__dm=user)
+                | Q(campaign__characters__player=user)
+            )
+            .distinct(),
+            Campaign.objects.filter(vector_column=term)
+            .filter(Q(dm=user) | Q(characters__player=user))
+            .distinct(),
+            Map.objects.filter(vector_column=term)
+            .filter(Q(campaign__dm=user) | Q(campaign__characters__player=user))
+            .distinct(),
+            Location.objects.filter(vector_column=term)
+            .filter(
+                Q(map__campaign__dm=user) | Q(map__campaign__characters__player=user)
+            )
+            .distinct(),
+        ],
+    }
+    if map:
+        locations = Location.objects.select_related("map", "map__campaign").filter(
+            map__campaign=campaign, map=map
+        )
+        workload["campaigns:maps:locations:list"] = [
+            locations,
+            locations.exclude(hidden=True),
+        ]
+    return workload
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay the queries of the hot views under EXPLAIN (ANALYZE, BUFFERS) and report the sequential scans "
+        "per view and the indexes that were not used by any of them. "
+        "Run this against a database with production-like volumes, on small tables Postgres rightly prefers "
+        "sequential scans."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--campaign",
+            type=int,
+            help="The Campaign to replay the workload for, defaults to the one with the most Locations.",
+        )
+        parser.add_argument(
+            "--plans", action="store_true", help="Print the full query plans."
+        )
+
+    def handle(self, *args, **options) -> None:
+        campaigns = Campaign.objects.select_related("dm").annotate(
+            location_count=Count("maps__locations")
+        )
+        if options["campaign"]:
+            campaign = campaigns.filter(pk=options["campaign"]).first()
+        else:
+            campaign = campaigns.order_by("-location_count").first()
+        if not campaign:
+            raise CommandError("There is no Campaign to replay the workload for.")
+
+        map = (
+            campaign.maps.annotate(count=Count("locations")).order_by("-count").first()
+        )
+        character = (
+            campaign.characters.select_related("player")
+            .filter(player__isnull=False)
+            .first()
+        )
+        player = character.player if character else None
+        workload = get_workload(
+            campaign=campaign, map=map, dm=campaign.dm, player=player
+        )
+
+        used_indexes = set()
+        for view, querysets in workload.items():
+            seq_scans = Counter()
+            execution_time = 0.0
+            for queryset in querysets:
+                plan = queryset.explain(analyze=True, buffers=True)
+                seq_scans.update(SEQ_SCAN.findall(plan))
+                used_indexes.update(INDEX_SCAN.findall(plan))
+                execution_time += sum(
+                    float(milliseconds) for milliseconds in EXECUTION_TIME.findall(plan)
+                )
+                if options["plans"]:
+                    self.stdout.write(plan)
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(f"{view} ({execution_time:.2f} ms)")
+            )
+            for table, count in sorted(seq_scans.items()):
+                self.stdout.write(self.style.WARNING(f"  Seq Scan on {table} x{count}"))
+            if not seq_scans:
+                self.stdout.write("  No sequential scans")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Unused indexes"))
+        unused_indexes = [
+            (table, index)
+            for table, index in self.get_indexes()
+            if index not in used_indexes
+        ]
+        for table, index in unused_indexes:
+            self.stdout.write(self.style.WARNING(f"  {index} on {table}"))
+        if not unused_indexes:
+            self.stdout.write("  All indexes were used")
+
+    @staticmethod
+    def get_indexes() -> list[tuple[str, str]]:
+        """All non primary key indexes on the tables of the workload."""
+        indexes = []
+        with connection.cursor() as cursor:
+            for model in (Campaign, Character, Map, Location):
+                table = model._meta.db_table
+                constraints = connection.introspection.get_constraints(cursor, table)
+                indexes += [
+                    (table, name)
+                    for name, constraint in sorted(constraints.items())
+                    if constraint["index"] and not constraint["primary_key"]
+                ]
+        return indexes
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandParser
+
+# The modules register their counters when they are imported.
+from apps import admission, fragments, metrics, search  # noqa F401
+
+
+class Command(BaseCommand):
+    help = "Show the counters kept in the shared cache and the hit rate of the template fragment caches."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--prefix", default="", help="Only show counters starting with the prefix."
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset the counters after showing them.",
+        )
+
+    def handle(self, *args, **options) -> None:
+        counters = metrics.get_counters(options["prefix"])
+        for name, value in counters.items():
+            self.stdout.write(f"{name}: {value}")
+
+        hit_rates: dict[str, dict[str, int]] = {}
+        for name, value in counters.items():
+            if name.startswith("fragment_cache."):
+                fragment, outcome = name.removeprefix("fragment_cache.").rsplit(".", 1)
+                hit_rates.setdefault(fragment, {"hit": 0, "miss": 0})[outcome] = value
+        for fragment, outcomes in sorted(hit_rates.items()):
+            total = outcomes["hit"] + outcomes["miss"]
+            self.stdout.write(
+                f"fragment {fragment}: {outcomes['hit']}/{total} hits "
+                f"({outcomes['hit'] / total:.0%})"
+            )
+
+        if options["reset"]:
+            metrics.reset(options["prefix"])
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import transaction
+from django.db.models import Max, Min, Model
+
+from apps.campaigns.models import Campaign
+from apps.characters.models import Character
+from apps.locations.models import Location
+from apps.maps.models import Map
+
+MODELS: dict[str, type[Model]] = {
+    "campaigns": Campaign,
+    "characters": Character,
+    "locations": Location,
+    "maps": Map,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the search vectors after a change of the `vector_column` triggers, in batches of pk ranges. "
+        "Every batch is a transaction of its own, so rows are only locked for the duration of a batch."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "models",
+            nargs="*",
+            help=f"The models to rebuild, all of them by default: {', '.join(MODELS)}.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="The size of the pk ranges."
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.1,
+            help="Seconds to pause between batches, to leave room for other queries.",
+        )
+
+    def handle(self, *args, **options) -> None:
+        unknown = set(options["models"]) - set(MODELS)
+        if unknown:
+            raise CommandError(f"Unknown models: {', '.join(sorted(unknown))}.")
+        for name in options["models"] or MODELS:
+            model = MODELS[name]
+            bounds = model.objects.aggregate(first=Min("pk"), last=Max("pk"))
+            if bounds["first"] is None:
+                continue
+            rebuilt = 0
+            for start in range(
+                bounds["first"], bounds["last"] + 1, options["batch_size"]
+            ):
+                with transaction.atomic():
+                    # The trigger computes the vector of every row that is updated.
+                    rebuilt += model.objects.filter(
+                        pk__gte=start, pk__lt=start + options["batch_size"]
+                    ).update(vector_column=None)
+                time.sleep(options["sleep"])
+            self.stdout.write(f"Rebuilt {rebuilt} search vectors of {name}.")
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.warmup import warm_templates
+
+
+class Command(BaseCommand):
+    help = "Compile every project and app template, to check they compile and to time the warm-up of a worker."
+
+    def handle(self, *args, **options) -> None:
+        start = time.perf_counter()
+        compiled, failed = warm_templates()
+        for name in failed:
+            self.stderr.write(f"Failed to compile {name}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Compiled {compiled} templates in {time.perf_counter() - start:.2f}s."
+            )
+        )
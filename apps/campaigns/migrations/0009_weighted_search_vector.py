@@ -0,0 +1,60 @@
+# Generated by Django 4.2.3 on 2026-10-19 10:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0008_alter_campaign_description'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='''
+              -- The text of TinyMCE HTML, without the tags and character references.
+              CREATE OR REPLACE FUNCTION search_strip_html(html text) RETURNS text AS $$
+                SELECT regexp_replace(
+                  regexp_replace(coalesce(html, ''), '<[^>]*>', ' ', 'g'),
+                  '&#?[A-Za-z0-9]+;', ' ', 'g'
+                )
+              $$ LANGUAGE sql IMMUTABLE;
+
+              -- The name weighs A and the description B. The text search configuration is the argument of the
+              -- trigger, English by default.
+              CREATE OR REPLACE FUNCTION search_vector_update() RETURNS trigger AS $$
+              DECLARE
+                config regconfig := coalesce(TG_ARGV[0], 'pg_catalog.english')::regconfig;
+              BEGIN
+                NEW.vector_column :=
+                  setweight(to_tsvector(config, coalesce(NEW.name, '')), 'A') ||
+                  setweight(to_tsvector(config, search_strip_html(NEW.description)), 'B');
+                RETURN NEW;
+              END
+              $$ LANGUAGE plpgsql;
+
+              DROP TRIGGER IF EXISTS vector_column_trigger ON campaigns_campaign;
+              CREATE TRIGGER vector_column_trigger
+              BEFORE INSERT OR UPDATE OF name, description, vector_column
+              ON campaigns_campaign
+              FOR EACH ROW EXECUTE PROCEDURE
+              search_vector_update('pg_catalog.english');
+
+              -- Existing rows are rebuilt in batches by the `rebuild_search_vectors` command.
+            ''',
+
+            reverse_sql='''
+              DROP TRIGGER IF EXISTS vector_column_trigger ON campaigns_campaign;
+              CREATE TRIGGER vector_column_trigger
+              BEFORE INSERT OR UPDATE OF name, description, vector_column
+              ON campaigns_campaign
+              FOR EACH ROW EXECUTE PROCEDURE
+              tsvector_update_trigger(
+                vector_column, 'pg_catalog.english', name, description
+              );
+
+              DROP FUNCTION IF EXISTS search_vector_update();
+              DROP FUNCTION IF EXISTS search_strip_html(text);
+            '''
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 4.2.3 on 2026-10-19 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("campaigns", "0009_weighted_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="campaign",
+            index=models.Index(fields=["image"], name="campaigns_c_image_f7ba44_idx"),
+        ),
+    ]
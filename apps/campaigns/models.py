@@ -39,7 +39,12 @@ class Campaign(TimeStampedModel):
     class Meta:
         verbose_name = "Campaign"
         verbose_name_plural = "Campaigns"
-        indexes = (GinIndex(fields=["vector_column"]), models.Index(fields=["name"]))
+        indexes = (
+            GinIndex(fields=["vector_column"]),
+            models.Index(fields=["name"]),
+            # The rows that reference a stored file, see `apps.storage.is_referenced`.
+            models.Index(fields=["image"]),
+        )
 
     def save(self, *args, **kwargs) -> None:
         """Set the invite code if it doesn't exist yet."""
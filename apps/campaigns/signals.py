@@ -0,0 +1,44 @@
+from django.db.models import Model
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django_cleanup.signals import cleanup_post_delete, cleanup_pre_delete
+
+from apps import search
+from apps.campaigns.models import Campaign
+from apps.characters.models import Character
+from apps.locations.models import Location
+from apps.maps.models import Map
+from apps.storage import is_referenced, lock, unlock
+
+
+@receiver(cleanup_pre_delete)
+def keep_shared_files(sender: type[Model], file: FieldFile, **kwargs) -> None:
+    """Media is content addressed and shared by identical uploads and cloned Campaigns, only delete a file once
+    no row of any model references it anymore.
+
+    django_cleanup has no way to cancel a deletion, but it deletes a detached copy of the FieldFile and
+        `FieldFile.delete` does nothing without a name. The name is locked until the file is deleted, see
+        `apps.storage.lock_until_commit`.
+    """
+    lock(file.name)
+    if is_referenced(file.name):
+        file.name = None
+
+
+@receiver(cleanup_post_delete)
+def unlock_shared_file(sender: type[Model], file_name: str, **kwargs) -> None:
+    unlock(file_name)
+
+
+@receiver(post_save, sender=Campaign)
+@receiver(post_save, sender=Character)
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=Map)
+@receiver(post_delete, sender=Campaign)
+@receiver(post_delete, sender=Character)
+@receiver(post_delete, sender=Location)
+@receiver(post_delete, sender=Map)
+def invalidate_search(sender: type[Model], instance: Model, **kwargs) -> None:
+    """Drop the cached searches the instance could be a result of."""
+    search.invalidate(instance)
@@ -0,0 +1,57 @@
+import posixpath
+
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+from django.utils.safestring import SafeString, mark_safe
+
+register = template.Library()
+
+# The `as` of a preload hint by the extension of the asset, the browser ignores a hint without a valid one.
+DESTINATIONS = {
+    ".js": "script",
+    ".css": "style",
+    ".woff2": "font",
+    ".png": "image",
+    ".jpg": "image",
+    ".jpeg": "image",
+    ".webp": "image",
+    ".svg": "image",
+}
+
+
+def get_hint(path: str) -> tuple[str, str, SafeString]:
+    """The rel, as and the extra attributes of the preload hint for a static asset."""
+    extension = posixpath.splitext(path)[1].lower()
+    if extension == ".mjs":
+        return "modulepreload", "script", mark_safe("")
+    try:
+        destination = DESTINATIONS[extension]
+    except KeyError:
+        raise template.TemplateSyntaxError(f"Can't preload {path}, unknown type.")
+    # Fonts are always fetched in CORS mode, a hint without crossorigin is fetched twice.
+    return (
+        "preload",
+        destination,
+        mark_safe(" crossorigin" if destination == "font" else ""),
+    )
+
+
+@register.simple_tag
+def preload(*paths: str) -> SafeString:
+    """Hint the browser to fetch the static assets right away, in parallel.
+
+    The URLs come from `static`, in production they are the hashed names from the manifest, the same
+        URLs the page loads the assets from.
+
+    Usage: {% preload "js/leaflet.js" "css/leaflet.css" %}
+    """
+    return format_html_join(
+        "\n",
+        '<link rel="{}" href="{}" as="{}"{}>',
+        (
+            (rel, static(path), destination, extra)
+            for path in paths
+            for rel, destination, extra in [get_hint(path)]
+        ),
+    )
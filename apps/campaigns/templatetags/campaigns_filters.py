@@ -1,4 +1,8 @@
 from django import template
+from django.utils.html import escape
+from django.utils.safestring import SafeString, mark_safe
+
+from apps.search import START_SEL, STOP_SEL
 
 register = template.Library()
 
@@ -10,3 +14,14 @@ def to_class_name(value):
     Used in the `search_results.html` template.
     """
     return value.__class__.__name__
+
+
+@register.filter
+def highlight(snippet: str) -> SafeString:
+    """Escape a `ts_headline` snippet of a search result and mark the words that matched the search.
+
+    Used in the `search_results.html` template.
+    """
+    return mark_safe(
+        escape(snippet).replace(START_SEL, "<mark>").replace(STOP_SEL, "</mark>")
+    )
@@ -0,0 +1,57 @@
+from django import template
+from django.core.cache import cache
+from django.template.base import FilterExpression, NodeList, Parser, Token
+
+from apps import metrics
+from apps.fragments import NAMES, TIMEOUT, get_viewer_role, make_key
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(
+        self, nodelist: NodeList, name: str, vary_on: list[FilterExpression]
+    ) -> None:
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context: template.Context) -> str:
+        vary_on = [value.resolve(context) for value in self.vary_on]
+        request = context.get("request")
+        role = get_viewer_role(getattr(request, "user", None), vary_on[0])
+        key = make_key(self.name, vary_on=vary_on, role=role)
+        content = cache.get(key)
+        if content is None:
+            metrics.increment(f"fragment_cache.{self.name}.miss")
+            content = self.nodelist.render(context)
+            cache.set(key, content, TIMEOUT)
+        else:
+            metrics.increment(f"fragment_cache.{self.name}.hit")
+        return content
+
+
+@register.tag
+def fragment_cache(parser: Parser, token: Token) -> FragmentCacheNode:
+    """Cache the enclosed fragment per object `modified` and viewer role.
+
+    Usage: `{% fragment_cache "name" object [vary_on ...] %} ... {% endfragment_cache %}`
+
+    The first value is the object the viewer's role is determined for. Any further model instances vary on their
+        `modified` as well, other values vary on their value.
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' tag requires a name and at least one object to vary on."
+        )
+    name = bits[1].strip("\"'")
+    if name not in NAMES:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' tag requires a fragment name of apps.fragments.NAMES."
+        )
+    nodelist = parser.parse(("endfragment_cache",))
+    parser.delete_first_token()
+    return FragmentCacheNode(
+        nodelist, name=name, vary_on=[parser.compile_filter(bit) for bit in bits[2:]]
+    )
@@ -1,17 +1,48 @@
+import gzip
+import html
+import io
+import json
+import re
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import nullcontext as does_not_raise
-from typing import Callable
+from functools import partial
+from io import StringIO
+from typing import AsyncIterator, Callable, Iterator
 
+import brotli
 import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
-from django.test.client import Client, RequestFactory
+from django.core.files.base import ContentFile
+from django.core.files.images import ImageFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpRequest, StreamingHttpResponse
+from django.template import Context, Template, TemplateSyntaxError, engines
+from django.test.client import AsyncClient, Client, RequestFactory
 from django.urls import reverse
+from model_bakery import baker
 
+from apps import admission, memoize, metrics, parallel, ratelimit, search
+from apps.campaigns.clone import clone_campaign
 from apps.campaigns.models import Campaign
 from apps.campaigns.views import (
     CampaignDeleteView,
     CampaignDetailView,
     CampaignUpdateView,
 )
+from apps.characters.models import Character
+from apps.locations.models import Location
+from apps.maps.models import Map
+from apps.middleware import AdmissionControlMiddleware, CompressionMiddleware
+from apps.storage.static import PrecompressedCompressorStorage
 from apps.users.models import User
 
 
@@ -134,3 +165,1096 @@ def test_campaign_create(user: User, status_code: int, client: Client) -> None:
     assert response.status_code == status_code
     if response.status_code == 204:
         assert Campaign.objects.filter(name="Test").exists()
+
+
+@pytest.mark.django_db
+def test_campaign_update_fragments(
+    campaign1: Campaign, dm: User, client: Client
+) -> None:
+    """The changed fragments on the page come along with the response, other fragments aren't rendered."""
+    client.force_login(dm)
+    fragments = [
+        {
+            "name": "campaign-detail",
+            "target": "campaign-detail",
+            "url": reverse("campaigns:detail", kwargs={"campaign_pk": campaign1.pk}),
+        },
+        {
+            "name": "campaign-list",
+            "target": "campaign-list",
+            "url": reverse("campaigns:list"),
+        },
+    ]
+    response = client.post(
+        reverse("campaigns:update", kwargs={"campaign_pk": campaign1.pk}),
+        data={"name": "Renamed"},
+        headers={"HX-Request": "true", "HX-Fragments": json.dumps(fragments)},
+    )
+    assert response.status_code == 200
+    assert response["HX-Trigger"] == "campaignChanged"
+    assert response["HX-Reswap"] == "none"
+    content = response.content.decode()
+    assert content.startswith('<div hx-swap-oob="innerHTML:#campaign-detail">')
+    assert "Renamed" in content
+    assert "#campaign-list" not in content
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "fragments",
+    [
+        "not json",
+        [
+            {
+                "name": "campaign-detail",
+                "target": "campaign-detail",
+                "url": "https://example.com/",
+            }
+        ],
+        [{"name": "campaign-detail", "target": "a b", "url": "/campaigns/"}],
+        [
+            {
+                "name": "campaign-detail",
+                "target": "campaign-detail",
+                "url": "/not-found/",
+            }
+        ],
+    ],
+)
+def test_campaign_update_invalid_fragments(
+    fragments: list | str, campaign1: Campaign, dm: User, client: Client
+) -> None:
+    """Fragments that aren't pages of the site are left out."""
+    client.force_login(dm)
+    response = client.post(
+        reverse("campaigns:update", kwargs={"campaign_pk": campaign1.pk}),
+        data={"name": "Renamed"},
+        headers={"HX-Request": "true", "HX-Fragments": json.dumps(fragments)},
+    )
+    assert response.status_code == 204
+
+
+@pytest.mark.django_db
+def test_fragment_views_registered(
+    campaign1: Campaign, character1: Character, dm: User, client: Client
+) -> None:
+    """Only the views registered for a fragment are run, a GET that changes something isn't."""
+    client.force_login(dm)
+    fragments = [
+        {
+            "name": "campaign-detail",
+            "target": "campaign-detail",
+            "url": reverse("characters:remove", kwargs={"character_pk": character1.pk}),
+        }
+    ]
+    response = client.post(
+        reverse("campaigns:update", kwargs={"campaign_pk": campaign1.pk}),
+        data={"name": "Renamed"},
+        headers={"HX-Request": "true", "HX-Fragments": json.dumps(fragments)},
+    )
+    assert response.status_code == 204
+    character1.refresh_from_db()
+    assert character1.campaign == campaign1
+
+
+@pytest.mark.django_db
+def test_fragment_failure_keeps_change(
+    campaign1: Campaign, dm: User, client: Client, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """A fragment that fails to render is left out, the change is kept."""
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("Fragment failed.")
+
+    monkeypatch.setattr(CampaignDetailView, "get", fail)
+    client.force_login(dm)
+    fragments = [
+        {
+            "name": "campaign-detail",
+            "target": "campaign-detail",
+            "url": reverse("campaigns:detail", kwargs={"campaign_pk": campaign1.pk}),
+        }
+    ]
+    response = client.post(
+        reverse("campaigns:update", kwargs={"campaign_pk": campaign1.pk}),
+        data={"name": "Renamed"},
+        headers={"HX-Request": "true", "HX-Fragments": json.dumps(fragments)},
+    )
+    assert response.status_code == 204
+    campaign1.refresh_from_db()
+    assert campaign1.name == "Renamed"
+
+
+@pytest.mark.django_db
+def test_character_create_fragments(
+    campaign1: Campaign, dm: User, player1: User, client: Client
+) -> None:
+    """A target is refreshed once, fragments the User can't see are left out."""
+    client.force_login(player1)
+    other_campaign = baker.make(Campaign, dm=dm)
+    fragments = [
+        {
+            "name": "character-list",
+            "target": "hx-target",
+            "url": reverse("characters:list"),
+        },
+        {
+            "name": "campaign-characters",
+            "target": "hx-target",
+            "url": reverse(
+                "campaigns:characters:list", kwargs={"campaign_pk": campaign1.pk}
+            ),
+        },
+        {
+            "name": "campaign-npcs",
+            "target": "npcs",
+            "url": reverse(
+                "campaigns:characters:npcs", kwargs={"campaign_pk": other_campaign.pk}
+            ),
+        },
+    ]
+    response = client.post(
+        reverse("characters:create"),
+        data={"name": "Innkeeper"},
+        headers={"HX-Request": "true", "HX-Fragments": json.dumps(fragments)},
+    )
+    assert response.status_code == 200
+    content = response.content.decode()
+    assert content.count("hx-swap-oob") == 1
+    assert "Innkeeper" in content
+
+
+@pytest.mark.django_db
+def test_index_advisor(location: Location) -> None:
+    """Every view of the workload is explained and the indexes are reported on."""
+    out = StringIO()
+    call_command("index_advisor", stdout=out, no_color=True)
+    output = out.getvalue()
+    assert "campaigns:maps:locations:list" in output
+    assert "full-search" in output
+    assert "Unused indexes" in output
+
+
+@pytest.mark.django_db
+def test_index_advisor_without_campaign() -> None:
+    with pytest.raises(CommandError):
+        call_command("index_advisor", stdout=StringIO())
+
+
+@pytest.fixture
+def campaign_with_media(campaign1: Campaign, mock_image: ImageFile) -> Campaign:
+    """A Campaign with an image on every object that has one."""
+    campaign1.image = ImageFile(mock_image.file, name="campaign.png")
+    campaign1.save()
+    map = baker.make(
+        Map, campaign=campaign1, image=ImageFile(mock_image.file, name="map.png")
+    )
+    baker.make(Location, map=map, name="Tavern", image="")
+    baker.make(Location, map=map, name="Lair", hidden=True, image=map.image.name)
+    baker.make(
+        Character,
+        campaign=campaign1,
+        is_npc=True,
+        name="Innkeeper",
+        image=ImageFile(mock_image.file, name="npc.png"),
+    )
+    return campaign1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "user,status_code",
+    [
+        (pytest.lazy_fixture("dm"), 200),
+        (pytest.lazy_fixture("player1"), 403),
+        (pytest.lazy_fixture("player2"), 403),
+    ],
+)
+def test_campaign_export(
+    user: User, status_code: int, campaign_with_media: Campaign, client: Client
+) -> None:
+    """Only the DM can export a Campaign, as a zip with a manifest and the images."""
+    client.force_login(user)
+    response = client.get(
+        reverse("campaigns:export", kwargs={"campaign_pk": campaign_with_media.pk})
+    )
+    assert response.status_code == status_code
+    if status_code == 200:
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        manifest = json.loads(archive.read("manifest.json"))
+        assert len(manifest["maps"]) == 1
+        assert len(manifest["maps"][0]["locations"]) == 2
+        assert sorted(archive.namelist()) == [
+            "manifest.json",
+            f"media/{campaign_with_media.image.name}",
+            f"media/{campaign_with_media.characters.get(is_npc=True).image.name}",
+            f"media/{campaign_with_media.maps.get().image.name}",
+        ]
+
+
+@pytest.mark.django_db
+def test_campaign_import(
+    campaign_with_media: Campaign, dm: User, player2: User, client: Client
+) -> None:
+    """An exported Campaign is restored as a new Campaign with the importing User as DM."""
+    client.force_login(dm)
+    response = client.get(
+        reverse("campaigns:export", kwargs={"campaign_pk": campaign_with_media.pk})
+    )
+    archive = b"".join(response.streaming_content)
+
+    client.force_login(player2)
+    response = client.post(
+        reverse("campaigns:import"),
+        data={"file": SimpleUploadedFile("campaign.zip", archive)},
+    )
+    assert response.status_code == 204
+    campaign = Campaign.objects.get(dm=player2)
+    assert campaign.name == campaign_with_media.name
+    assert campaign.invite_code != campaign_with_media.invite_code
+    map = campaign.maps.get()
+    assert (map.resolution_width, map.resolution_height) == (50, 50)
+    assert default_storage.exists(map.image.name)
+    # Identical images are stored once.
+    assert map.image.name == campaign_with_media.maps.get().image.name
+    assert list(map.locations.order_by("name").values_list("name", "hidden")) == [
+        ("Lair", True),
+        ("Tavern", False),
+    ]
+    assert map.locations.get(name="Lair").image.name == map.image.name
+    # Only the NPC's are restored, Player Characters belong to their Players.
+    assert list(campaign.characters.values_list("name", "is_npc", "player")) == [
+        ("Innkeeper", True, None)
+    ]
+
+
+@pytest.mark.django_db
+def test_campaign_import_invalid_archive(dm: User, client: Client) -> None:
+    client.force_login(dm)
+    response = client.post(
+        reverse("campaigns:import"),
+        data={"file": SimpleUploadedFile("campaign.zip", b"not a zip")},
+    )
+    assert response.status_code == 200
+    assert not Campaign.objects.exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "manifest,error",
+    [
+        ({"version": 1}, "The manifest has invalid maps."),
+        ({"version": 1, "maps": [], "characters": []}, "invalid campaign"),
+        (
+            {"version": 1, "campaign": {"name": "Test"}, "maps": [{"name": "Map"}]},
+            "The manifest has invalid locations.",
+        ),
+        (
+            {
+                "version": 1,
+                "campaign": {"name": "Test"},
+                "maps": [],
+                "characters": [{"name": "x" * 300, "is_npc": True}],
+            },
+            "invalid character, name:",
+        ),
+        (
+            {
+                "version": 1,
+                "campaign": {"name": "Test", "image": 12},
+                "maps": [],
+                "characters": [],
+            },
+            "invalid image",
+        ),
+        ([1], "does not contain a valid manifest"),
+    ],
+)
+def test_campaign_import_invalid_manifest(
+    manifest: dict | list, error: str, dm: User, client: Client
+) -> None:
+    """A truncated or mistyped manifest is rejected with a validation error."""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, mode="w") as zip_file:
+        zip_file.writestr("manifest.json", json.dumps(manifest))
+    client.force_login(dm)
+    response = client.post(
+        reverse("campaigns:import"),
+        data={"file": SimpleUploadedFile("campaign.zip", archive.getvalue())},
+    )
+    assert response.status_code == 200
+    assert error in html.unescape(response.content.decode())
+    assert not Campaign.objects.exists()
+
+
+@pytest.mark.django_db
+def test_campaign_export_and_import_commands(
+    campaign_with_media: Campaign, player2: User, tmp_path
+) -> None:
+    path = str(tmp_path / "campaign.zip")
+    call_command("export_campaign", campaign_with_media.pk, path, stdout=StringIO())
+    call_command("import_campaign", path, player2.username, stdout=StringIO())
+    campaign = Campaign.objects.get(dm=player2)
+    assert campaign.maps.get().locations.count() == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "user,status_code",
+    [
+        (pytest.lazy_fixture("dm"), 200),
+        (pytest.lazy_fixture("player1"), 403),
+    ],
+)
+def test_campaign_clone(
+    user: User,
+    status_code: int,
+    campaign_with_media: Campaign,
+    client: Client,
+    django_assert_max_num_queries: Callable,
+) -> None:
+    """Only the DM can clone a Campaign, the clone shares the images and has its own invite code."""
+    map = campaign_with_media.maps.get()
+    baker.make(Location, map=map, _quantity=100)
+    client.force_login(user)
+    with django_assert_max_num_queries(15):
+        response = client.post(
+            reverse("campaigns:clone", kwargs={"campaign_pk": campaign_with_media.pk})
+        )
+    assert response.status_code == status_code
+    if status_code == 200:
+        clone = Campaign.objects.exclude(pk=campaign_with_media.pk).get()
+        assert response.headers["HX-Redirect"] == clone.get_absolute_url()
+        assert clone.dm == user
+        assert clone.invite_code != campaign_with_media.invite_code
+        assert clone.image.name == campaign_with_media.image.name
+        cloned_map = clone.maps.get()
+        assert cloned_map.pk != map.pk
+        assert cloned_map.image.name == map.image.name
+        assert cloned_map.locations.count() == 102
+        assert map.locations.count() == 102
+        assert cloned_map.locations.filter(vector_column__isnull=False).exists()
+        assert list(clone.characters.values_list("name", "creator")) == [
+            ("Innkeeper", user.pk)
+        ]
+
+
+@pytest.mark.django_db
+def test_campaign_clone_keeps_shared_files(
+    campaign_with_media: Campaign,
+    django_capture_on_commit_callbacks: Callable,
+) -> None:
+    """Deleting a clone doesn't delete the images the original still uses."""
+    clone = clone_campaign(campaign_with_media, dm=campaign_with_media.dm)
+    name = campaign_with_media.maps.get().image.name
+    with django_capture_on_commit_callbacks(execute=True):
+        clone.maps.get().delete()
+    assert default_storage.exists(name)
+    with django_capture_on_commit_callbacks(execute=True):
+        campaign_with_media.maps.get().delete()
+    assert not default_storage.exists(name)
+
+
+@pytest.mark.django_db
+def test_campaign_clone_command(campaign_with_media: Campaign, player2: User) -> None:
+    call_command(
+        "clone_campaign",
+        campaign_with_media.pk,
+        dm=player2.username,
+        name="Second group",
+        stdout=StringIO(),
+    )
+    clone = Campaign.objects.get(dm=player2, name="Second group")
+    assert clone.maps.get().locations.count() == 2
+
+
+@pytest.fixture
+def fragment_template() -> Template:
+    return Template(
+        '{% load fragment_cache %}{% fragment_cache "card_item" object %}'
+        "{{ object.name }} {{ request.user }}{% endfragment_cache %}"
+    )
+
+
+@pytest.mark.django_db
+def test_fragment_cache(
+    fragment_template: Template,
+    character1: Character,
+    campaign1: Campaign,
+    player1: User,
+    dm: User,
+    rf: RequestFactory,
+) -> None:
+    """Fragments are cached per viewer role and dropped once the object changes."""
+    character1.name = "Jarl"
+    character1.save()
+    cache.clear()
+    request = rf.get("/")
+    request.user = player1
+    assert (
+        fragment_template.render(Context({"object": character1, "request": request}))
+        == f"Jarl {player1}"
+    )
+    character1.refresh_from_db()
+    assert (
+        fragment_template.render(Context({"object": character1, "request": request}))
+        == f"Jarl {player1}"
+    )
+    request.user = dm
+    assert (
+        fragment_template.render(Context({"object": character1, "request": request}))
+        == f"Jarl {dm}"
+    )
+
+    Character.objects.filter(pk=character1.pk).update(name="Olaf")
+    character1.refresh_from_db()
+    assert (
+        fragment_template.render(Context({"object": character1, "request": request}))
+        == f"Jarl {dm}"
+    )
+    character1.save()
+    assert (
+        fragment_template.render(Context({"object": character1, "request": request}))
+        == f"Olaf {dm}"
+    )
+    assert metrics.get_counters("fragment_cache.card_item") == {
+        "fragment_cache.card_item.hit": 2,
+        "fragment_cache.card_item.miss": 3,
+    }
+
+    out = StringIO()
+    call_command("metrics", prefix="fragment_cache.card_item", reset=True, stdout=out)
+    assert "fragment card_item: 2/5 hits (40%)" in out.getvalue()
+    assert metrics.get_counters("fragment_cache.card_item") == {}
+
+
+def test_fragment_cache_registered() -> None:
+    """Fragments and counters have to be registered, so their names are known to the `metrics` command."""
+    with pytest.raises(TemplateSyntaxError):
+        Template(
+            '{% load fragment_cache %}{% fragment_cache "unknown" object %}{% endfragment_cache %}'
+        )
+    with pytest.raises(ValueError):
+        metrics.increment("unknown")
+
+
+@pytest.mark.django_db
+def test_fragment_cache_campaign_list(
+    dm: User, campaign1: Campaign, client: Client
+) -> None:
+    """Renaming a Campaign shows up in the cached cards."""
+    client.force_login(dm)
+    url = reverse("campaigns:list")
+    assert campaign1.name in client.get(url).content.decode()
+    campaign1.name = "Renamed campaign"
+    campaign1.save()
+    assert "Renamed campaign" in client.get(url).content.decode()
+
+
+def test_warm_templates() -> None:
+    """Every template compiles and ends up in the cached loader."""
+    engine = engines["django"].engine
+    engine.template_loaders[0].reset()
+    out, err = StringIO(), StringIO()
+    call_command("warm_templates", stdout=out, stderr=err)
+    assert err.getvalue() == ""
+    assert "components/_card_item.html" in engine.template_loaders[0].get_template_cache
+    assert "bootstrap5/field.html" in engine.template_loaders[0].get_template_cache
+
+
+def test_import_time() -> None:
+    """Optional subsystems aren't imported when Django starts."""
+    out = StringIO()
+    call_command("import_time", "django", limit=2000, stdout=out)
+    modules = {line.split()[-1] for line in out.getvalue().splitlines()[1:]}
+    assert "django.apps.registry" in modules
+    assert not {"PIL", "boto3", "storages", "anymail", "requests"} & modules
+
+
+def test_preload() -> None:
+    """Preload hints point at the static URLs and have the right type."""
+    rendered = Template(
+        '{% load assets %}{% preload "js/leaflet.js" "css/leaflet.css" "fonts/a.woff2" "js/app.mjs" %}'
+    ).render(Context())
+    assert rendered.splitlines() == [
+        '<link rel="preload" href="/static/js/leaflet.js" as="script">',
+        '<link rel="preload" href="/static/css/leaflet.css" as="style">',
+        '<link rel="preload" href="/static/fonts/a.woff2" as="font" crossorigin>',
+        '<link rel="modulepreload" href="/static/js/app.mjs" as="script">',
+    ]
+    with pytest.raises(TemplateSyntaxError):
+        Template('{% load assets %}{% preload "js/leaflet.js.map" %}').render(Context())
+
+
+@pytest.mark.parametrize(
+    "accept_encoding,decompressor",
+    [
+        ("br", lambda: brotli.Decompressor().process),
+        ("gzip", lambda: zlib.decompressobj(wbits=31).decompress),
+    ],
+)
+@pytest.mark.parametrize("is_async", [False, True])
+def test_compressed_stream_flushed(
+    accept_encoding: str, decompressor: Callable, is_async: bool, rf: RequestFactory
+) -> None:
+    """Every chunk of a compressed stream is flushed, so it is sent before the stream ends."""
+    finished = []
+
+    def stream() -> Iterator[bytes]:
+        yield b"<p>The first results</p>"
+        yield b"<p>The last results</p>"
+        finished.append(True)
+
+    async def astream() -> AsyncIterator[bytes]:
+        for chunk in stream():
+            yield chunk
+
+    response = StreamingHttpResponse(
+        astream() if is_async else stream(), content_type="text/html"
+    )
+    request = rf.get("/", headers={"Accept-Encoding": accept_encoding})
+    response = CompressionMiddleware(lambda request: response)(request)
+    assert response["Content-Encoding"] == accept_encoding
+    if is_async:
+        chunks = aiter(response.streaming_content)
+        first = async_to_sync(anext)(chunks)
+    else:
+        first = next(iter(response.streaming_content))
+    decompress = decompressor()
+    assert decompress(first) == b"<p>The first results</p>"
+    assert not finished
+
+
+def test_precompressed_compressor_storage(tmpdir) -> None:
+    """The output of django-compressor is stored with a gzip and a brotli variant."""
+    storage = PrecompressedCompressorStorage(location=str(tmpdir))
+    content = b"const a = 1;" * 100
+    name = storage.save("CACHE/js/output.0123456789ab.js", ContentFile(content))
+    assert gzip.decompress(tmpdir.join(f"{name}.gz").read_binary()) == content
+    assert brotli.decompress(tmpdir.join(f"{name}.br").read_binary()) == content
+
+
+def test_memoize_single_flight() -> None:
+    """Concurrent misses compute the value once, the other threads wait for it."""
+    calls = []
+
+    def compute() -> bool:
+        calls.append(1)
+        time.sleep(0.1)
+        return False
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(
+            executor.map(
+                lambda _: memoize.get_or_compute(
+                    "test.single_flight", compute, timeout=60, negative_timeout=5
+                ),
+                range(4),
+            )
+        )
+    assert results == [False] * 4
+    assert len(calls) == 1
+    value, _, expiry = cache.get("test.single_flight")
+    assert value is False
+    assert expiry == pytest.approx(time.time() + 5, abs=1)
+    memoize.invalidate("test.single_flight")
+
+
+def test_memoize_early_refresh() -> None:
+    """An entry about to expire is refreshed by one thread, the others keep using the cached value."""
+    key = "test.early_refresh"
+    # Computing took long compared to the time left, so a refresh is all but certain.
+    cache.set(key, ("stale", 100.0, time.time() + 1), 60)
+    cache.add(memoize.get_lock_key(key), True)
+    assert memoize.get_or_compute(key, lambda: "fresh", timeout=60) == "stale"
+    cache.delete(memoize.get_lock_key(key))
+    assert memoize.get_or_compute(key, lambda: "fresh", timeout=60) == "fresh"
+    assert memoize.get_or_compute(key, lambda: "fresher", timeout=60) == "fresh"
+    memoize.invalidate(key)
+
+
+@pytest.mark.django_db
+def test_identical_images_are_stored_once(
+    campaign1: Campaign,
+    mock_image: ImageFile,
+    dm: User,
+    django_capture_on_commit_callbacks: Callable,
+) -> None:
+    """Identical uploads share a content addressed file, which is deleted with its last reference."""
+    other = baker.make(Campaign, dm=dm)
+    maps = [
+        Map.objects.create(
+            name="Test", campaign=campaign, image=ImageFile(mock_image, name="map.png")
+        )
+        for campaign in (campaign1, other)
+    ]
+    name = maps[0].image.name
+    assert maps[1].image.name == name
+    assert len(name) == len("maps/") + 64 + len(".png")
+    location = baker.make(Location, map=maps[0], image=name)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        maps[1].delete()
+    assert default_storage.exists(name)
+    with django_capture_on_commit_callbacks(execute=True):
+        location.delete()
+        maps[0].delete()
+    assert not default_storage.exists(name)
+
+
+@pytest.mark.parametrize(
+    "method,path,content_type,expected",
+    [
+        ("get", "/campaigns/1/maps/2/locations/list/", None, admission.POLL),
+        ("get", "/search/", None, admission.SEARCH),
+        ("get", "/campaigns/1/", None, admission.PAGE),
+        ("get", "/does-not-exist/", None, admission.PAGE),
+        (
+            "post",
+            "/campaigns/1/maps/2/locations/create/",
+            "application/x-www-form-urlencoded",
+            admission.WRITE,
+        ),
+        (
+            "post",
+            "/campaigns/1/maps/create/",
+            "multipart/form-data; boundary=x",
+            admission.WRITE,
+        ),
+        ("post", "/uploads/", "multipart/form-data; boundary=x", admission.UPLOAD),
+        ("put", "/uploads/token/chunks/", "application/octet-stream", admission.UPLOAD),
+    ],
+)
+def test_admission_classify(
+    method: str, path: str, content_type: str, expected: str, rf: RequestFactory
+) -> None:
+    kwargs = {"content_type": content_type} if content_type else {}
+    request = getattr(rf, method)(path, **kwargs)
+    assert admission.classify(request) == expected
+
+
+@pytest.mark.django_db
+def test_admission_sheds_polls(
+    dm: User, client: Client, location: Location, settings
+) -> None:
+    """A poll without a slot in a saturated worker gets the last payload of the User, or a 429 without one."""
+    settings.ADMISSION_CAPACITY = 1
+    metrics.reset("admission.")
+    client.force_login(dm)
+    url = reverse(
+        "campaigns:maps:locations:list",
+        kwargs={"campaign_pk": location.map.campaign_id, "map_pk": location.map_id},
+    )
+    poll = admission.get_class(admission.POLL)
+    semaphore = admission.get_semaphore(poll)
+    response = client.get(url)
+    payload = response.content
+
+    for _ in range(poll.limit):
+        semaphore.acquire()
+    try:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.content == payload
+        response = client.get(f"{url}?active_location={location.id}")
+        assert response.status_code == 429
+        assert response["Retry-After"] == str(poll.retry_after)
+    finally:
+        for _ in range(poll.limit):
+            semaphore.release()
+
+    assert client.get(url).status_code == 200
+    assert metrics.get_counters("admission.poll.") == {
+        "admission.poll.admitted": 2,
+        "admission.poll.shed": 1,
+        "admission.poll.stale": 1,
+    }
+
+
+@pytest.mark.django_db
+def test_admission_borrows_free_threads(
+    dm: User, client: Client, location: Location, settings
+) -> None:
+    """A poll without a slot is admitted while the worker has free threads."""
+    settings.ADMISSION_CAPACITY = 4
+    metrics.reset("admission.")
+    client.force_login(dm)
+    poll = admission.get_class(admission.POLL)
+    semaphore = admission.get_semaphore(poll)
+    for _ in range(poll.limit):
+        semaphore.acquire()
+    try:
+        response = client.get(
+            reverse(
+                "campaigns:maps:locations:list",
+                kwargs={
+                    "campaign_pk": location.map.campaign_id,
+                    "map_pk": location.map_id,
+                },
+            )
+        )
+    finally:
+        for _ in range(poll.limit):
+            semaphore.release()
+    assert response.status_code == 200
+    assert metrics.get_counters("admission.poll.") == {
+        "admission.poll.admitted": 1,
+        "admission.poll.borrowed": 1,
+    }
+    assert admission._in_flight == 0
+
+
+@pytest.mark.parametrize("is_async", [False, True])
+def test_admission_releases_streams(is_async: bool, rf: RequestFactory) -> None:
+    """A streaming response keeps its slot until the server closes it, under WSGI and ASGI alike."""
+
+    async def astream() -> AsyncIterator[bytes]:
+        yield b"results"
+
+    def get_response(request: HttpRequest) -> StreamingHttpResponse:
+        return StreamingHttpResponse(iter([b"results"]))
+
+    async def aget_response(request: HttpRequest) -> StreamingHttpResponse:
+        return StreamingHttpResponse(astream())
+
+    async def consume(response: StreamingHttpResponse) -> bytes:
+        return b"".join([chunk async for chunk in response])
+
+    request = rf.get(reverse("full-search"))
+    request.user = AnonymousUser()
+    if is_async:
+        middleware = AdmissionControlMiddleware(aget_response)
+        assert iscoroutinefunction(middleware)
+        response = async_to_sync(middleware)(request)
+    else:
+        response = AdmissionControlMiddleware(get_response)(request)
+    assert admission._in_flight == 1
+    assert (async_to_sync(consume)(response) if is_async else b"".join(response)) == (
+        b"results"
+    )
+    assert admission._in_flight == 1
+    response.close()
+    assert admission._in_flight == 0
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize(
+    "user,expected_names",
+    [
+        (pytest.lazy_fixture("dm"), {"Dragon peak", "Dragon lair", "Dragon hoard"}),
+        (pytest.lazy_fixture("player1"), {"Dragon peak", "Dragon lair"}),
+        (pytest.lazy_fixture("player2"), set()),
+    ],
+)
+def test_search_all(user: User, expected_names: set[str], map: Map) -> None:
+    """The models are searched at the same time and streamed, over WSGI and ASGI alike.
+
+    Hidden Locations are only found by the DM of their Campaign.
+    """
+    Campaign.objects.filter(pk=map.campaign_id).update(name="Dragon peak")
+    baker.make(Location, map=map, name="Dragon lair")
+    baker.make(Location, map=map, name="Dragon hoard", hidden=True)
+    url = f"{reverse('full-search')}?search=dragon"
+
+    client = Client()
+    client.force_login(user)
+    response = client.get(url)
+    assert response.streaming
+    content = b"".join(response.streaming_content).decode()
+
+    async_client = AsyncClient()
+    async_client.force_login(user)
+    response = async_to_sync(async_client.get)(url)
+
+    async def consume() -> str:
+        return b"".join([chunk async for chunk in response.streaming_content]).decode()
+
+    for content in (content, async_to_sync(consume)()):
+        found = {
+            name
+            for name in ("Dragon peak", "Dragon lair", "Dragon hoard")
+            if f">{name}</a>" in content
+        }
+        assert found == expected_names
+        assert ("You search in vain" in content) is not expected_names
+
+
+@pytest.mark.django_db
+def test_search_vector_weighted_without_html(campaign1: Campaign) -> None:
+    """The search vector has the weighted words of the name and description, not the HTML markup."""
+    campaign1.name = "Dragon peak"
+    campaign1.description = (
+        '<p><strong class="lead">Ancient</strong> <a href="#">ruins</a>&nbsp;</p>'
+    )
+    campaign1.save()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT vector_column::text FROM campaigns_campaign WHERE id = %s",
+            [campaign1.pk],
+        )
+        vector = cursor.fetchone()[0]
+    assert vector == "'ancient':3B 'dragon':1A 'peak':2A 'ruin':4B"
+
+    # A vector of the previous trigger, the current one recomputes every update.
+    with connection.cursor() as cursor:
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(
+            "ALTER TABLE campaigns_campaign DISABLE TRIGGER vector_column_trigger"
+        )
+        Campaign.objects.filter(pk=campaign1.pk).update(
+            description="<em>plain</em>", vector_column="em"
+        )
+        cursor.execute(
+            "ALTER TABLE campaigns_campaign ENABLE TRIGGER vector_column_trigger"
+        )
+    out = StringIO()
+    call_command("rebuild_search_vectors", "campaigns", "--sleep", "0", stdout=out)
+    assert "search vectors of campaigns" in out.getvalue()
+    campaign1.refresh_from_db()
+    assert campaign1.vector_column == "'dragon':1A 'peak':2A 'plain':3B"
+    with pytest.raises(CommandError):
+        call_command("rebuild_search_vectors", "spells")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_search_snippets(dm: User, campaign1: Campaign) -> None:
+    """Results are ranked by their weights and show a snippet of the text, the matched words marked."""
+    campaign1.description = "<p>Beware the <strong>red</strong> dragon & its hoard.</p>"
+    campaign1.save()
+    baker.make(Campaign, dm=dm, name="Dragon peak", description="")
+
+    client = Client()
+    client.force_login(dm)
+    response = client.get(f"{reverse('full-search')}?search=dragon")
+    content = b"".join(response.streaming_content).decode()
+    # The name weighs more than the description.
+    assert content.index(">Dragon peak</a>") < content.index(f">{campaign1.name}</a>")
+    assert "red  <mark>dragon</mark> &amp; its hoard" in content
+    assert "strong" not in content
+
+    out = StringIO()
+    call_command("benchmark_search", dm.username, "dragon", repeat=1, stdout=out)
+    assert "snippets: " in out.getvalue()
+    assert "template path: " in out.getvalue()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_search_cache(dm: User, map: Map, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Repeated searches fetch the cached results by their pks, until something in the Campaign changes."""
+    location = baker.make(Location, map=map, name="Dragon lair")
+    client = Client()
+    client.force_login(dm)
+    url = f"{reverse('full-search')}?search=Dragon++LAIR"
+
+    def get_links() -> set[str]:
+        content = b"".join(client.get(url).streaming_content).decode()
+        return set(re.findall(r'<a href="[^"]+">[^<]+</a>', content))
+
+    links = get_links()
+    assert any(">Dragon lair</a>" in link for link in links)
+
+    def fail(*args, **kwargs) -> None:
+        raise AssertionError("The search should be cached.")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(search, "get_querysets", fail)
+        assert get_links() == links
+        assert search.get_hits_key(dm.pk, "dragon lair", 1) == search.get_hits_key(
+            dm.pk, " Dragon  Lair", 1
+        )
+
+    # A new Location in the Campaign invalidates the search.
+    baker.make(Location, map=map, name="Dragon lair entrance")
+    links = get_links()
+    assert any(">Dragon lair entrance</a>" in link for link in links)
+    location.delete()
+    assert not any(">Dragon lair</a>" in link for link in get_links())
+
+
+@pytest.mark.django_db(transaction=True)
+def test_search_cache_access(
+    player1: User, map: Map, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Cached results are only shown while the User still has access to them."""
+    location = baker.make(Location, map=map, name="Dragon lair")
+    client = Client()
+    client.force_login(player1)
+    url = f"{reverse('full-search')}?search=dragon"
+
+    def get_content() -> str:
+        return b"".join(client.get(url).streaming_content).decode()
+
+    assert ">Dragon lair</a>" in get_content()
+    # Changed without signals, like by another worker process the versions of this one don't know about.
+    Location.objects.filter(pk=location.pk).update(hidden=True)
+    with monkeypatch.context() as patch:
+        patch.setattr(search, "get_querysets", lambda *args: [])
+        assert ">Dragon lair</a>" not in get_content()
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        ("dragon", search.ParsedQuery("dragon", frozenset(), ())),
+        (
+            '"red dragon" -lair type:NPCs',
+            search.ParsedQuery('"red dragon" -lair', frozenset({"npc"}), ()),
+        ),
+        (
+            'type:map dragon in:"Curse of Strahd" in:12 type:location',
+            search.ParsedQuery(
+                "dragon", frozenset({"map", "location"}), ("Curse of Strahd", "12")
+            ),
+        ),
+        ("intype:map", search.ParsedQuery("intype:map", frozenset(), ())),
+        (
+            "type:bogus dragon type:maps",
+            search.ParsedQuery("dragon", frozenset({"map"}), (), ("bogus",)),
+        ),
+    ],
+)
+def test_search_parse(query: str, expected: search.ParsedQuery) -> None:
+    assert search.parse(query) == expected
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize(
+    "query,expected_names",
+    [
+        ("dragon", {"Dragon priest", "Dragon lair", "Dragon peak"}),
+        ('"dragon priest"', {"Dragon priest"}),
+        ("dragon -lair", {"Dragon priest", "Dragon peak"}),
+        ("dragon type:npc", {"Dragon priest"}),
+        ("dragon type:character", set()),
+        ("dragon type:location type:campaign", {"Dragon lair", "Dragon peak"}),
+        ('dragon in:"dragon PEAK"', {"Dragon peak"}),
+        ("dragon in:Elsewhere", {"Dragon priest", "Dragon lair"}),
+        ("dragon in:Unknown", set()),
+        ("type:npc", set()),
+    ],
+)
+def test_search_grammar(
+    query: str, expected_names: set[str], dm: User, player2: User, map: Map
+) -> None:
+    """Phrases, exclusions, `type:` and `in:` filters narrow the search."""
+    baker.make(Campaign, dm=dm, name="Dragon peak")
+    baker.make(Campaign, dm=player2, name="Unknown")
+    Campaign.objects.filter(pk=map.campaign_id).update(name="Elsewhere")
+    baker.make(Location, map=map, name="Dragon lair")
+    baker.make(
+        Character, campaign=map.campaign, creator=dm, is_npc=True, name="Dragon priest"
+    )
+
+    client = Client()
+    client.force_login(dm)
+    response = client.get(reverse("full-search"), {"search": query})
+    content = b"".join(response.streaming_content).decode()
+    found = set(re.findall(r'<a href="[^"]+">([^<]+)</a>', content))
+    assert found == expected_names
+
+
+@pytest.mark.django_db
+def test_search_unknown_type(dm: User, client: Client, settings) -> None:
+    """A search with an unknown type isn't run or charged, the User is told the types instead."""
+    settings.SEARCH_RATE_LIMIT = {"capacity": 1, "rate": 0.001}
+    client.force_login(dm)
+    for _ in range(2):
+        response = client.get(reverse("full-search"), {"search": "type:bogus dragon"})
+        assert response.status_code == 200
+        assert "There is no type bogus" in response.content.decode()
+    assert cache.get(f"ratelimit.search.user.{dm.pk}") is None
+
+
+@pytest.mark.parametrize(
+    "query,cached,expected",
+    [
+        ("dragon", True, 1),
+        ("dragon", False, 8),
+        ("dr", False, 16),
+        ("dragon type:npc", False, 2),
+        ("dragon type:npc type:character in:1", False, 1),
+        ("type:map", False, 1),
+    ],
+)
+def test_search_cost(query: str, cached: bool, expected: int) -> None:
+    assert search.get_cost(search.parse(query), cached) == expected
+
+
+@pytest.mark.django_db
+def test_search_rate_limited(dm: User, client: Client, settings) -> None:
+    """Searches take tokens from the buckets of the User and IP address, broad searches take more."""
+    settings.SEARCH_RATE_LIMIT = {"capacity": 10, "rate": 0.5}
+    metrics.reset("search.")
+    client.force_login(dm)
+    url = reverse("full-search")
+    response = client.get(url, {"search": "dragon"})
+    assert response.status_code == 200
+    b"".join(response.streaming_content)
+
+    # The cached search costs 1 token, a different one 8.
+    response = client.get(url, {"search": "dragon"})
+    assert response.status_code == 200
+    b"".join(response.streaming_content)
+    response = client.get(url, {"search": "dragon lair"})
+    assert response.status_code == 429
+    assert int(response["Retry-After"]) == 14
+    assert metrics.get_counters("search.") == {"search.rate_limited": 1}
+
+
+@pytest.mark.django_db
+def test_search_rate_limited_behind_proxy(dm: User, player1: User, settings) -> None:
+    """Behind a proxy the IP address of the client is the hop the proxy appended to X-Forwarded-For."""
+    settings.SEARCH_RATE_LIMIT = {"capacity": 10, "rate": 0.5}
+    settings.CLIENT_IP_HEADER = "HTTP_X_FORWARDED_FOR"
+    url = reverse("full-search")
+    clients = {}
+    for user, ip in ((dm, "203.0.113.1"), (player1, "203.0.113.2")):
+        clients[ip] = Client(
+            REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR=f"198.51.100.9, {ip}"
+        )
+        clients[ip].force_login(user)
+
+    response = clients["203.0.113.1"].get(url, {"search": "dragon"})
+    assert response.status_code == 200
+    b"".join(response.streaming_content)
+    response = clients["203.0.113.1"].get(url, {"search": "dragon lair"})
+    assert response.status_code == 429
+    # The other client behind the same proxy has a bucket of its own.
+    response = clients["203.0.113.2"].get(url, {"search": "dragon"})
+    assert response.status_code == 200
+    b"".join(response.streaming_content)
+    assert cache.get("ratelimit.search.ip.203.0.113.2")
+    assert cache.get("ratelimit.search.ip.10.0.0.1") is None
+    assert cache.get("ratelimit.search.ip.198.51.100.9") is None
+
+
+def test_ratelimit_refill(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = 1000.0
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now)
+    bucket = ratelimit.Bucket(capacity=4, rate=2)
+    assert ratelimit.take("test.refill", bucket, 3) == 0
+    assert ratelimit.take("test.refill", bucket, 3) == 1
+    now += 1
+    assert ratelimit.take("test.refill", bucket, 3) == 0
+    # More than the capacity is taken from a full bucket.
+    now += 10
+    assert ratelimit.take("test.refill", bucket, 10) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_search_statement_timeout(settings) -> None:
+    """A query cancelled by the statement timeout leaves the model out of the results instead of failing."""
+    settings.SEARCH_STATEMENT_TIMEOUT = 10
+    metrics.reset("search.")
+
+    def sleep() -> search.Result:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_sleep(1)")
+        return "maps.Map", [], "results"
+
+    [future] = parallel.submit([partial(search.guard, sleep, "maps.Map")])
+    assert future.result() == ("maps.Map", None, "")
+    assert metrics.get_counters("search.") == {"search.timeout": 1}
+    footer = search.render_footer({"maps.Map": None}, key="test.timed_out")
+    assert "took too long" in footer
+    assert cache.get("test.timed_out") is None
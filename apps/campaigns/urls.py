@@ -1,21 +1,38 @@
 from django.urls import include, path
 
 from apps.campaigns.views import (
+    CampaignCloneView,
     CampaignCreateView,
     CampaignDeleteView,
     CampaignDetailView,
+    CampaignExportView,
+    CampaignImportView,
     CampaignListView,
     CampaignUpdateView,
 )
+from apps.characters.views import export_characters, import_characters
 
 app_name = "campaigns"
 urlpatterns = [
     path("", view=CampaignListView.as_view(), name="list"),
     path("create/", view=CampaignCreateView.as_view(), name="create"),
+    path("import/", view=CampaignImportView.as_view(), name="import"),
     path("update/<int:campaign_pk>/", view=CampaignUpdateView.as_view(), name="update"),
     path("<int:campaign_pk>/", view=CampaignDetailView.as_view(), name="detail"),
     path("<int:campaign_pk>/delete/", view=CampaignDeleteView.as_view(), name="delete"),
+    path("<int:campaign_pk>/export/", view=CampaignExportView.as_view(), name="export"),
+    path("<int:campaign_pk>/clone/", view=CampaignCloneView.as_view(), name="clone"),
     path("<int:campaign_pk>/maps/", include("apps.maps.urls", namespace="maps")),
+    path(
+        "<int:campaign_pk>/characters/import/",
+        view=import_characters,
+        name="import-characters",
+    ),
+    path(
+        "<int:campaign_pk>/characters/export/",
+        view=export_characters,
+        name="export-characters",
+    ),
     path(
         "<int:campaign_pk>/characters/",
         include("apps.characters.urls", namespace="characters"),
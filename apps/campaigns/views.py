@@ -1,20 +1,30 @@
 from typing import Optional
 
-from django.core.exceptions import PermissionDenied
+from django.contrib import messages
+from django.contrib.messages import SUCCESS
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.db.models import Q, QuerySet
 from django.forms import BaseForm
-from django.http import HttpResponse
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
 from django.urls import reverse
 from django.views.generic import (
     CreateView,
     DeleteView,
     DetailView,
+    FormView,
     ListView,
     UpdateView,
+    View,
 )
+from django.views.generic.detail import SingleObjectMixin
+from django_htmx.http import HttpResponseClientRedirect
 
+from apps.campaigns.archive import restore_archive, stream_archive
+from apps.campaigns.clone import clone_campaign
+from apps.campaigns.forms import CampaignImportForm
 from apps.campaigns.models import Campaign
 from apps.mixins import CanCreateCampaignMixin, CanCreateMixin
+from apps.oob import changed
 
 
 class CampaignListView(CanCreateMixin, ListView):
@@ -81,11 +91,11 @@ class CampaignCreateView(CanCreateCampaignMixin, CreateView):
     def form_valid(self, form: BaseForm) -> HttpResponse:
         """Set the creator as DM.
 
-        Return a No-Content and set the HTMX trigger so the modal will be closed and the campaign list refreshed.
+        Respond with the changed fragments and set the HTMX trigger so the modal will be closed and the campaign list refreshed.
         """
         form.instance.dm = self.request.user
         self.object = form.save()
-        return HttpResponse(status=204, headers={"HX-Trigger": "campaignListChanged"})
+        return changed(self.request, "campaignListChanged")
 
 
 class CampaignUpdateView(CanCreateMixin, UpdateView):
@@ -105,11 +115,11 @@ class CampaignUpdateView(CanCreateMixin, UpdateView):
         raise PermissionDenied
 
     def form_valid(self, form: BaseForm) -> HttpResponse:
-        """Return a No-Content and set the HTMX trigger so the modal will be closed
+        """Respond with the changed fragments and set the HTMX trigger so the modal will be closed
         and the campaign detail page refreshed.
         """
         self.object = form.save()
-        return HttpResponse(status=204, headers={"HX-Trigger": "campaignChanged"})
+        return changed(self.request, "campaignChanged")
 
 
 class CampaignDeleteView(CanCreateMixin, DeleteView):
@@ -128,3 +138,69 @@ class CampaignDeleteView(CanCreateMixin, DeleteView):
 
     def get_success_url(self) -> str:
         return reverse("campaigns:list")
+
+
+class CampaignExportView(CanCreateMixin, SingleObjectMixin, View):
+    """Download a Campaign with its Maps, Locations, NPC's and images as a zip archive."""
+
+    model = Campaign
+    pk_url_kwarg = "campaign_pk"
+
+    def get_object(self, queryset: Optional[QuerySet] = None) -> Campaign:
+        """Acceptance criteria:
+        - Only the DM can export a Campaign
+        """
+        campaign = super().get_object(queryset)
+        if self.request.user == campaign.dm:
+            return campaign
+        raise PermissionDenied
+
+    def get(self, request: HttpRequest, *args, **kwargs) -> StreamingHttpResponse:
+        """Stream the archive so neither the images nor the archive are held in memory."""
+        campaign = self.get_object()
+        return StreamingHttpResponse(
+            stream_archive(campaign),
+            content_type="application/zip",
+            headers={
+                "Content-Disposition": f'attachment; filename="campaign-{campaign.pk}.zip"'
+            },
+        )
+
+
+class CampaignImportView(CanCreateCampaignMixin, FormView):
+    """Restore a Campaign from an archive, the importing User becomes its DM."""
+
+    form_class = CampaignImportForm
+    template_name = "campaigns/campaign_import_form.html"
+
+    def form_valid(self, form: CampaignImportForm) -> HttpResponse:
+        """Respond with the changed fragments and set the HTMX trigger so the modal will be closed and the campaign list refreshed."""
+        try:
+            restore_archive(form.cleaned_data["file"], dm=self.request.user)
+        except ValidationError as error:
+            form.add_error("file", error)
+            return self.form_invalid(form)
+        return changed(self.request, "campaignListChanged")
+
+
+class CampaignCloneView(CanCreateCampaignMixin, SingleObjectMixin, View):
+    """Clone a Campaign with its Maps, Locations and NPC's to run it for another group."""
+
+    model = Campaign
+    pk_url_kwarg = "campaign_pk"
+    http_method_names = ["post"]
+
+    def get_object(self, queryset: Optional[QuerySet] = None) -> Campaign:
+        """Acceptance criteria:
+        - Only the DM can clone a Campaign
+        """
+        campaign = super().get_object(queryset)
+        if self.request.user == campaign.dm:
+            return campaign
+        raise PermissionDenied
+
+    def post(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        """Redirect to the clone so the DM can share its invite code."""
+        clone = clone_campaign(self.get_object(), dm=request.user)
+        messages.add_message(request, SUCCESS, "Campaign cloned.")
+        return HttpResponseClientRedirect(clone.get_absolute_url())
@@ -0,0 +1,124 @@
+"""Bulk import and (streaming) export of a Campaign's Characters."""
+import codecs
+import csv
+import json
+from typing import IO, Any, Iterator
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.forms import modelform_factory
+
+from apps import search
+from apps.campaigns.models import Campaign
+from apps.characters.models import Character
+from apps.users.models import User
+
+BATCH_SIZE = 250
+FORMATS = ["csv", "json"]
+IMPORT_FIELDS = ["name", "description"]
+EXPORT_FIELDS = ["name", "description", "is_npc", "player"]
+
+CharacterRowForm = modelform_factory(Character, fields=IMPORT_FIELDS)
+
+
+def read_rows(file: IO[bytes], format: str) -> list[Any]:
+    """Read the rows from a CSV file with a header row or from a JSON list of objects."""
+    if format not in FORMATS:
+        raise ValidationError(f"Only {' and '.join(FORMATS)} files can be imported.")
+    try:
+        if format == "json":
+            rows = json.load(file)
+            if not isinstance(rows, list):
+                raise ValidationError("A JSON import must be a list of objects.")
+            return rows
+        return list(csv.DictReader(codecs.iterdecode(file, "utf-8-sig")))
+    except (csv.Error, UnicodeDecodeError, ValueError) as error:
+        raise ValidationError(f"The file could not be read: {error}")
+
+
+def build_characters(
+    rows: list[Any], campaign: Campaign, creator: User
+) -> list[Character]:
+    """Validate all rows in memory and return the unsaved NPC's.
+
+    Raise a ValidationError with every invalid row so the whole file can be fixed at once.
+    """
+    characters = []
+    errors = []
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append(ValidationError(f"Row {number}: not an object."))
+            continue
+        form = CharacterRowForm(
+            data={field: row.get(field) or "" for field in IMPORT_FIELDS}
+        )
+        if not form.is_valid():
+            errors += [
+                ValidationError(f"Row {number}: {field}: {' '.join(field_errors)}")
+                for field, field_errors in form.errors.items()
+            ]
+            continue
+        character = form.instance
+        character.campaign = campaign
+        character.creator = creator
+        # `bulk_create` does not call `Character.save`, so set the NPC invariant here.
+        character.player = None
+        character.is_npc = True
+        characters.append(character)
+    if errors:
+        raise ValidationError(errors)
+    return characters
+
+
+@transaction.atomic
+def import_characters(
+    characters: list[Character], batch_size: int = BATCH_SIZE
+) -> list[Character]:
+    """Insert the Characters in batches.
+
+    The `vector_column` trigger is a row level BEFORE INSERT trigger, so the search vectors are filled in by the
+        same multi-row INSERT and don't need a separate UPDATE.
+    """
+    characters = Character.objects.bulk_create(characters, batch_size=batch_size)
+    # `bulk_create` does not send the signals that drop the cached searches of the Campaign.
+    for campaign in {
+        character.campaign for character in characters if character.campaign
+    }:
+        search.invalidate(campaign)
+    return characters
+
+
+def export_rows(campaign: Campaign) -> Iterator[dict]:
+    """The Campaign's Characters, fetched in chunks through a server side cursor."""
+    rows = (
+        Character.objects.filter(campaign=campaign)
+        .order_by("pk")
+        .values_list("name", "description", "is_npc", "player__username")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    return (dict(zip(EXPORT_FIELDS, row)) for row in rows)
+
+
+class Echo:
+    """A file-like object that returns what is written instead of buffering it.
+
+    See: https://docs.djangoproject.com/en/4.2/howto/outputting-csv/#streaming-large-csv-files
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def stream_export(campaign: Campaign, format: str) -> Iterator[str]:
+    """Yield the export line by line so memory use doesn't grow with the Campaign."""
+    rows = export_rows(campaign)
+    if format == "json":
+        yield "["
+        for number, row in enumerate(rows):
+            yield ("," if number else "") + json.dumps(row)
+        yield "]"
+        return
+    writer = csv.DictWriter(Echo(), fieldnames=EXPORT_FIELDS)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
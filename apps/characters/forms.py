@@ -1,10 +1,13 @@
+from pathlib import Path
 from uuid import UUID
 
 from django import forms
 from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.files import File
 from django.db.models import Q
 
 from apps.campaigns.models import Campaign
+from apps.characters.bulk import build_characters, import_characters, read_rows
 from apps.characters.models import Character
 
 
@@ -36,7 +39,37 @@ class AddToCampaignForm(forms.Form):
         return data
 
     def save(self) -> None:
-        """Add the Character to the Campaign."""
+        """Add the Character to the Campaign.
+
+        Saved through the Character so its Player's campaign access cache is invalidated.
+        """
         campaign = Campaign.objects.get(invite_code=self.cleaned_data["invite_code"])
         character = Character.objects.get(id=self.cleaned_data["character_pk"])
-        campaign.characters.add(character)
+        character.campaign = campaign
+        character.save(update_fields=["campaign"])
+
+
+class CharacterImportForm(forms.Form):
+    file = forms.FileField(
+        help_text="A CSV file with a header row, or a JSON list of objects, with a name and an optional description "
+        "per NPC."
+    )
+
+    def __init__(self, *args, **kwargs):
+        """Set the Campaign the NPC's are imported into and the User that imports them."""
+        self.campaign = kwargs.pop("campaign", None)
+        self.creator = kwargs.pop("creator", None)
+        super().__init__(*args, **kwargs)
+
+    def clean_file(self) -> File:
+        """Read and validate every row before anything is written."""
+        file = self.cleaned_data["file"]
+        format = Path(file.name).suffix.lstrip(".").lower()
+        self.characters = build_characters(
+            read_rows(file, format), campaign=self.campaign, creator=self.creator
+        )
+        return file
+
+    def save(self) -> list[Character]:
+        """Insert the NPC's into the Campaign."""
+        return import_characters(self.characters)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from apps.campaigns.models import Campaign
+from apps.characters.bulk import FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = "Export the Characters of a Campaign as CSV or JSON."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("campaign", type=int, help="The pk of the Campaign.")
+        parser.add_argument("--format", choices=FORMATS, default="csv")
+        parser.add_argument(
+            "--output", help="The file to write to, defaults to stdout."
+        )
+
+    def handle(self, *args, **options) -> None:
+        campaign = Campaign.objects.filter(pk=options["campaign"]).first()
+        if not campaign:
+            raise CommandError(f"Campaign {options['campaign']} does not exist.")
+
+        lines = stream_export(campaign, format=options["format"])
+        if not options["output"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        with open(options["output"], "w", newline="") as file:
+            file.writelines(lines)
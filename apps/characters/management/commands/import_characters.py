@@ -0,0 +1,51 @@
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from apps.campaigns.models import Campaign
+from apps.characters.bulk import (
+    BATCH_SIZE,
+    build_characters,
+    import_characters,
+    read_rows,
+)
+from apps.users.models import User
+
+
+class Command(BaseCommand):
+    help = "Import NPC's into a Campaign from a CSV file with a header row or a JSON list of objects."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("campaign", type=int, help="The pk of the Campaign.")
+        parser.add_argument("path", type=Path, help="The .csv or .json file.")
+        parser.add_argument(
+            "--creator",
+            help="Username of the creator of the NPC's, defaults to the Campaign's DM.",
+        )
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options) -> None:
+        campaign = (
+            Campaign.objects.select_related("dm").filter(pk=options["campaign"]).first()
+        )
+        if not campaign:
+            raise CommandError(f"Campaign {options['campaign']} does not exist.")
+        creator = campaign.dm
+        if options["creator"]:
+            creator = User.objects.filter(username=options["creator"]).first()
+            if not creator:
+                raise CommandError(f"User {options['creator']} does not exist.")
+
+        path: Path = options["path"]
+        try:
+            with path.open("rb") as file:
+                rows = read_rows(file, format=path.suffix.lstrip(".").lower())
+            characters = build_characters(rows, campaign=campaign, creator=creator)
+        except ValidationError as error:
+            raise CommandError("\n".join(error.messages))
+
+        characters = import_characters(characters, batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Imported {len(characters)} NPC's into {campaign}.")
+        )
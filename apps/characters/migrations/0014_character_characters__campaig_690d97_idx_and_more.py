@@ -0,0 +1,24 @@
+# Generated by Django 4.2.3 on 2026-10-19 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("characters", "0013_remove_character_location"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="character",
+            index=models.Index(
+                fields=["campaign", "is_npc"], name="characters__campaig_690d97_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="character",
+            index=models.Index(
+                fields=["campaign", "player"], name="characters__campaig_4d3504_idx"
+            ),
+        ),
+    ]
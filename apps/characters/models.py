@@ -1,10 +1,13 @@
 from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVectorField
-from django.core.cache import cache
 from django.db import models
+from model_utils import FieldTracker
 from model_utils.models import TimeStampedModel
 from tinymce.models import HTMLField
 
+from apps import memoize
+from apps.users.models import get_read_access_key
+
 
 class Character(TimeStampedModel):
     name = models.CharField(max_length=255)
@@ -32,6 +35,7 @@ class Character(TimeStampedModel):
         default=False
     )  # If no Player was assigned the Character is an NPC
     vector_column = SearchVectorField(null=True)
+    tracker = FieldTracker(fields=["campaign", "player"])
 
     def __str__(self) -> str:
         return self.name
@@ -40,23 +44,31 @@ class Character(TimeStampedModel):
         return f"<Character: {self.name}>"
 
     def save(self, *args, **kwargs) -> None:
-        """Overloaded to set the player to None if is_npc is True.
+        """Overloaded to keep `is_npc` and `player` consistent in a single write.
+
+        An NPC never has a Player and a Character without a Player is an NPC.
 
-        If a Character joins a Campaign; invalidate the user_has_read_access_to_campaign cache
-            so the value is recalculated and the user has access to the Campaign.
+        If a Character joins or leaves a Campaign; invalidate the user_has_read_access_to_campaign cache of both
+            Campaigns so the value is recalculated and the user's access to the Campaign is updated.
         """
-        not_in_campaign = False
-        if not self.campaign_id:
-            not_in_campaign = True
-        super().save(*args, **kwargs)
-        if not_in_campaign and self.campaign_id:
-            cache.delete(f"{self.player_id}.user_has_read_access_to_campaign")
-        if self.is_npc and kwargs.get("update_fields", None) == ["player"]:
+        if self.is_npc:
             self.player = None
-            self.save(update_fields=["player"])
-        if not self.player and not self.is_npc:
+        elif not self.player_id:
             self.is_npc = True
-            self.save(update_fields=["is_npc"])
+        update_fields = kwargs.get("update_fields", None)
+        if update_fields and {"player", "is_npc"} & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"player", "is_npc"}
+        campaign_changed = self.tracker.has_changed("campaign")
+        previous_campaign_id = self.tracker.previous("campaign")
+        super().save(*args, **kwargs)
+        if campaign_changed and self.player_id:
+            memoize.invalidate(
+                *(
+                    get_read_access_key(self.player_id, campaign_id)
+                    for campaign_id in (previous_campaign_id, self.campaign_id)
+                    if campaign_id
+                )
+            )
 
     def get_absolute_url(self) -> str:
         from django.urls import reverse
@@ -66,4 +78,13 @@ class Character(TimeStampedModel):
     class Meta:
         verbose_name = "Character"
         verbose_name_plural = "Characters"
-        indexes = (GinIndex(fields=["vector_column"]), models.Index(fields=["name"]))
+        indexes = (
+            GinIndex(fields=["vector_column"]),
+            models.Index(fields=["name"]),
+            # The Character and NPC lists of a Campaign.
+            models.Index(fields=["campaign", "is_npc"]),
+            # Looking up the Players in a Campaign for the read access check.
+            models.Index(fields=["campaign", "player"]),
+            # The rows that reference a stored file, see `apps.storage.is_referenced`.
+            models.Index(fields=["image"]),
+        )
@@ -1,11 +1,16 @@
+import json
 import tempfile
 from contextlib import nullcontext as does_not_raise
+from io import StringIO
 from pathlib import Path
 from typing import Callable
 
 import pytest
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.core.files.images import ImageFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import override_settings
 from django.test.client import Client, RequestFactory
 from django.urls import reverse
@@ -17,7 +22,7 @@ from apps.characters.views import (
     CharacterDetailView,
     CharacterUpdateView,
 )
-from apps.users.models import User
+from apps.users.models import User, get_read_access_key
 
 
 @pytest.mark.django_db
@@ -95,7 +100,7 @@ def test_character_campaign_list(
     client.force_login(user)
     response = client.get(
         reverse("campaigns:characters:list", kwargs={"campaign_pk": campaign1.pk}),
-        **headers
+        **headers,
     )
     assert response.status_code == status_code
     characters = response.context.get("characters", None)
@@ -269,3 +274,202 @@ def test_user_has_access_cache_invalidation(
         reverse("campaigns:detail", kwargs={"campaign_pk": campaign1.pk})
     )
     assert accepted.status_code == 200
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "player,is_npc", [(pytest.lazy_fixture("player1"), False), (None, True)]
+)
+def test_character_create_single_write(
+    player: User | None, is_npc: bool, django_assert_num_queries: Callable
+) -> None:
+    """A Character without a Player is an NPC, set in the same INSERT."""
+    with django_assert_num_queries(1):
+        character = Character.objects.create(name="Test", player=player)
+    character.refresh_from_db()
+    assert character.is_npc == is_npc
+
+
+@pytest.mark.django_db
+def test_character_update_single_write(
+    character1: Character, django_assert_num_queries: Callable
+) -> None:
+    character1.name = "Update test"
+    with django_assert_num_queries(1):
+        character1.save()
+    character1.refresh_from_db()
+    assert character1.name == "Update test"
+    assert not character1.is_npc
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("update_fields", [None, ["is_npc"]])
+def test_character_npc_toggle_single_write(
+    update_fields: list[str] | None,
+    character1: Character,
+    django_assert_num_queries: Callable,
+) -> None:
+    """Turning a Character into an NPC removes its Player in the same UPDATE."""
+    character1.is_npc = True
+    with django_assert_num_queries(1):
+        character1.save(update_fields=update_fields)
+    character1.refresh_from_db()
+    assert character1.is_npc
+    assert character1.player is None
+
+
+@pytest.mark.django_db
+def test_character_campaign_join_and_leave_single_write(
+    character2: Character,
+    campaign1: Campaign,
+    django_assert_num_queries: Callable,
+) -> None:
+    """Joining and leaving a Campaign is a single UPDATE that invalidates the Player's access cache."""
+    cache_key = get_read_access_key(character2.player_id, campaign1.pk)
+    cache.set(cache_key, False)
+    character2.campaign = campaign1
+    with django_assert_num_queries(1):
+        character2.save(update_fields=["campaign"])
+    assert cache.get(cache_key) is None
+
+    cache.set(cache_key, True)
+    character2.campaign = None
+    with django_assert_num_queries(1):
+        character2.save(update_fields=["campaign"])
+    assert cache.get(cache_key) is None
+    character2.refresh_from_db()
+    assert character2.campaign is None
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "filename,content",
+    [
+        (
+            "npcs.csv",
+            "name,description\n"
+            + "".join(f"NPC {number},<p>Shopkeeper</p>\n" for number in range(500)),
+        ),
+        (
+            "npcs.json",
+            json.dumps(
+                [
+                    {"name": f"NPC {number}", "description": "<p>Shopkeeper</p>"}
+                    for number in range(500)
+                ]
+            ),
+        ),
+    ],
+)
+def test_import_characters(
+    filename: str,
+    content: str,
+    dm: User,
+    campaign1: Campaign,
+    client: Client,
+    django_assert_max_num_queries: Callable,
+) -> None:
+    """The DM can import NPC's, which are inserted in batches."""
+    client.force_login(dm)
+    file = SimpleUploadedFile(filename, content.encode())
+    with django_assert_max_num_queries(10):
+        response = client.post(
+            reverse(
+                "campaigns:import-characters", kwargs={"campaign_pk": campaign1.pk}
+            ),
+            data={"file": file},
+        )
+    assert response.status_code == 204
+    npcs = Character.objects.filter(campaign=campaign1, is_npc=True)
+    assert npcs.count() == 500
+    assert not npcs.filter(player__isnull=False).exists()
+    assert not npcs.filter(vector_column__isnull=True).exists()
+
+
+@pytest.mark.django_db
+def test_import_characters_invalid_rows(
+    dm: User, campaign1: Campaign, client: Client
+) -> None:
+    """Nothing is imported when any row is invalid."""
+    client.force_login(dm)
+    file = SimpleUploadedFile("npcs.csv", b"name,description\nValid,\n,No name\n")
+    response = client.post(
+        reverse("campaigns:import-characters", kwargs={"campaign_pk": campaign1.pk}),
+        data={"file": file},
+    )
+    assert response.status_code == 200
+    assert "Row 2: name" in response.content.decode()
+    assert not Character.objects.filter(name="Valid").exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "user,status_code",
+    [
+        (pytest.lazy_fixture("dm"), 200),
+        (pytest.lazy_fixture("player1"), 404),
+        (pytest.lazy_fixture("player2"), 404),
+    ],
+)
+def test_import_characters_access(
+    user: User, status_code: int, campaign1: Campaign, client: Client
+) -> None:
+    """Only the DM can import NPC's into a Campaign."""
+    client.force_login(user)
+    response = client.get(
+        reverse("campaigns:import-characters", kwargs={"campaign_pk": campaign1.pk})
+    )
+    assert response.status_code == status_code
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "user,status_code",
+    [
+        (pytest.lazy_fixture("dm"), 200),
+        (pytest.lazy_fixture("player1"), 200),
+        (pytest.lazy_fixture("player2"), 403),
+    ],
+)
+def test_export_characters(
+    user: User,
+    status_code: int,
+    campaign1: Campaign,
+    character1: Character,
+    client: Client,
+) -> None:
+    """Anyone with access to the Campaign can export its Characters."""
+    client.force_login(user)
+    url = reverse("campaigns:export-characters", kwargs={"campaign_pk": campaign1.pk})
+    response = client.get(url)
+    assert response.status_code == status_code
+    if status_code == 200:
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        assert lines[0] == "name,description,is_npc,player"
+        assert lines[1].startswith(character1.name)
+
+        response = client.get(url, {"format": "json"})
+        rows = json.loads(b"".join(response.streaming_content))
+        assert rows == [
+            {
+                "name": character1.name,
+                "description": character1.description,
+                "is_npc": False,
+                "player": character1.player.username,
+            }
+        ]
+
+
+@pytest.mark.django_db
+def test_import_and_export_characters_commands(
+    campaign1: Campaign, tmp_path: Path
+) -> None:
+    path = tmp_path / "npcs.json"
+    path.write_text(json.dumps([{"name": "Innkeeper"}, {"name": "Blacksmith"}]))
+    call_command("import_characters", campaign1.pk, str(path), stdout=StringIO())
+    assert campaign1.characters.filter(is_npc=True, creator=campaign1.dm).count() == 2
+
+    out = StringIO()
+    call_command("export_characters", campaign1.pk, stdout=out)
+    assert "Innkeeper" in out.getvalue()
+    assert "Blacksmith" in out.getvalue()
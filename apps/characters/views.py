@@ -6,7 +6,7 @@ from django.contrib.messages import SUCCESS
 from django.core.exceptions import PermissionDenied
 from django.db.models import Q, QuerySet
 from django.forms import BaseForm
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 from django.views.decorators.http import require_http_methods
@@ -18,9 +18,13 @@ from django.views.generic import (
     UpdateView,
 )
 
-from apps.characters.forms import AddToCampaignForm
+from apps.campaigns.models import Campaign
+from apps.characters.bulk import FORMATS, stream_export
+from apps.characters.forms import AddToCampaignForm, CharacterImportForm
 from apps.characters.models import Character
 from apps.mixins import CanCreateMixin
+from apps.oob import changed
+from apps.uploads import DirectUploadMixin
 from apps.users.models import User
 
 
@@ -49,7 +53,7 @@ class CharacterListView(CanCreateMixin, ListView):
             )
         else:
             return (
-                Character.objects.select_related("player")
+                Character.objects.select_related("player", "campaign")
                 .filter(Q(player=user) | Q(creator=user))
                 .distinct()
             )
@@ -87,7 +91,7 @@ def add_to_campaign(request: HttpRequest, character_pk: int) -> HttpResponse:
         for all the logic to remain in the AddToCampaignForm while also being able to set the character in the
         initial form so the User doesn't have to fill it in.
 
-    Return a No-Content and set the HTMX trigger so the modal is closed and the character list refreshed.
+    Respond with the changed fragments and set the HTMX trigger so the modal is closed and the character list refreshed.
     """
     character = get_object_or_404(
         Character, Q(player=request.user) | Q(creator=request.user), id=character_pk
@@ -97,9 +101,7 @@ def add_to_campaign(request: HttpRequest, character_pk: int) -> HttpResponse:
         if form.is_valid():
             form.save()
             messages.add_message(request, SUCCESS, "Character added to campaign.")
-            return HttpResponse(
-                status=204, headers={"HX-Trigger": "characterListChanged"}
-            )
+            return changed(request, "characterListChanged")
     else:
         form = AddToCampaignForm()
         form.initial["character_pk"] = character.id
@@ -128,12 +130,68 @@ def remove_from_campaign(request: HttpRequest, character_pk: int) -> HttpRespons
         or request.user == character.campaign.dm
     ):
         character.campaign = None
-        character.save()
+        character.save(update_fields=["campaign"])
         messages.add_message(request, SUCCESS, "Character removed from campaign.")
-        return HttpResponse(status=204, headers={"HX-Trigger": "characterListChanged"})
+        return changed(request, "characterListChanged")
     raise PermissionDenied
 
 
+@login_required
+@require_http_methods(["GET", "POST"])
+def import_characters(request: HttpRequest, campaign_pk: int) -> HttpResponse:
+    """Import NPC's into a Campaign from a CSV or JSON file.
+
+    Acceptance criteria:
+        - Only the DM of the Campaign
+
+    Respond with the changed fragments and set the HTMX trigger so the modal is closed and the character lists refreshed.
+    """
+    campaign = get_object_or_404(Campaign, id=campaign_pk, dm=request.user)
+    if request.method == "POST":
+        form = CharacterImportForm(
+            request.POST, request.FILES, campaign=campaign, creator=request.user
+        )
+        if form.is_valid():
+            characters = form.save()
+            messages.add_message(
+                request, SUCCESS, f"{len(characters)} NPC's imported into campaign."
+            )
+            return changed(request, "characterListChanged")
+    else:
+        form = CharacterImportForm()
+
+    return render(
+        request=request,
+        template_name="characters/import_form.html",
+        context={"form": form, "campaign": campaign},
+    )
+
+
+@login_required
+@require_http_methods(["GET"])
+def export_characters(request: HttpRequest, campaign_pk: int) -> StreamingHttpResponse:
+    """Stream all Characters of a Campaign as CSV, or as JSON with `?format=json`.
+
+    Acceptance criteria:
+        - Anyone with access to the Campaign
+    """
+    user: User = request.user
+    if not user.has_read_access_to_campaign(campaign_pk=campaign_pk):
+        raise PermissionDenied
+    campaign = get_object_or_404(Campaign, id=campaign_pk)
+    format = request.GET.get("format", "csv")
+    if format not in FORMATS:
+        format = "csv"
+    content_type = "application/json" if format == "json" else "text/csv"
+    return StreamingHttpResponse(
+        stream_export(campaign, format=format),
+        content_type=content_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="characters-{campaign.pk}.{format}"'
+        },
+    )
+
+
 class CharacterDetailView(CanCreateMixin, DetailView):
     model = Character
     template_name = "characters/character_detail.html"
@@ -165,7 +223,7 @@ class CharacterDetailView(CanCreateMixin, DetailView):
         return [self.template_name]
 
 
-class CharacterCreateView(CanCreateMixin, CreateView):
+class CharacterCreateView(CanCreateMixin, DirectUploadMixin, CreateView):
     model = Character
     fields = ["name", "description", "image", "is_npc"]
     template_name = "characters/character_form.html"
@@ -173,17 +231,17 @@ class CharacterCreateView(CanCreateMixin, CreateView):
     def form_valid(self, form: BaseForm) -> HttpResponse:
         """If a character is not an NPC then it follows that there should be a player
 
-        Return a No-Content and set the HTMX trigger so the modal is closed and the character list is refreshed.
+        Respond with the changed fragments and set the HTMX trigger so the modal is closed and the character list is refreshed.
         """
         if form.data.get("is_npc") != "on":
             form.instance.player = self.request.user
         form.instance.creator = self.request.user
         self.object = form.save()
 
-        return HttpResponse(status=204, headers={"HX-Trigger": "characterListChanged"})
+        return changed(self.request, "characterListChanged")
 
 
-class CharacterUpdateView(CanCreateMixin, UpdateView):
+class CharacterUpdateView(CanCreateMixin, DirectUploadMixin, UpdateView):
     model = Character
     fields = ["name", "description", "image", "is_npc"]
     template_name = "characters/character_form.html"
@@ -205,7 +263,7 @@ class CharacterUpdateView(CanCreateMixin, UpdateView):
     def form_valid(self, form: BaseForm) -> HttpResponse:
         """Set character as NPC or Player.
 
-        Return a No-Content and set the HTMX trigger so the modal is closed and the character page is refreshed.
+        Respond with the changed fragments and set the HTMX trigger so the modal is closed and the character page is refreshed.
         """
         if form.data.get("is_npc") != "on":
             form.instance.player = self.request.user
@@ -214,7 +272,7 @@ class CharacterUpdateView(CanCreateMixin, UpdateView):
             form.instance.creator = self.request.user
         self.object = form.save()
 
-        return HttpResponse(status=204, headers={"HX-Trigger": "characterChanged"})
+        return changed(self.request, "characterChanged")
 
 
 class CharacterDeleteView(CanCreateMixin, DeleteView):
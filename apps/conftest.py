@@ -1,10 +1,12 @@
 import tempfile
 
 import pytest
+from django.core.cache import cache
 from django.core.files.images import ImageFile
 from model_bakery import baker
 from PIL import Image
 
+from apps import metrics
 from apps.campaigns.models import Campaign
 from apps.characters.models import Character
 from apps.locations.models import Location
@@ -18,6 +20,17 @@ def media_storage(settings, tmpdir):
     settings.MEDIA_ROOT = tmpdir.strpath
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Every test starts with an empty cache, so rate limits, versions, cached results and counters don't leak
+    between them."""
+    metrics.reset()
+    cache.clear()
+    yield
+    metrics.reset()
+    cache.clear()
+
+
 @pytest.fixture
 def user() -> User:
     return UserFactory()
@@ -0,0 +1,62 @@
+"""Caching of rendered template fragments.
+
+A fragment's key is made of the `(model, pk, modified)` of the objects it shows and the role of the viewer. Every
+    save changes `modified`, also a save with `update_fields` (see `model_utils.models.TimeStampedModel`), so a
+    changed object is never served from a stale fragment. Keying on `modified` costs no cache lookups of its own, a
+    cached fragment is a single `get`. `QuerySet.update()` leaves `modified` alone, like it doesn't send signals.
+
+Every fragment is listed in NAMES, its hits and misses are counted in `metrics`.
+"""
+import hashlib
+from typing import Any
+
+from django.db.models import Model
+
+from apps import metrics
+
+TIMEOUT = 60 * 60 * 24
+# The names of the cached fragments. The map detail is the heaviest, its description is bleached on every render.
+NAMES = ("card_item", "title_image_text", "map_detail")
+
+metrics.register(
+    *(
+        f"fragment_cache.{name}.{outcome}"
+        for name in NAMES
+        for outcome in ("hit", "miss")
+    )
+)
+
+
+def get_viewer_role(user: Any, instance: Model | None) -> str:
+    """The role of the viewer in the instance's Campaign: `owner` of a Character, `dm` or `player`."""
+    from apps.campaigns.models import Campaign
+    from apps.characters.models import Character
+    from apps.locations.models import Location
+    from apps.maps.models import Map
+
+    user_id = getattr(user, "id", None)
+    dm_id = None
+    if isinstance(instance, Campaign):
+        dm_id = instance.dm_id
+    elif isinstance(instance, Map):
+        dm_id = instance.campaign.dm_id
+    elif isinstance(instance, Location):
+        dm_id = instance.map.campaign.dm_id
+    elif isinstance(instance, Character):
+        if user_id and user_id in (instance.player_id, instance.creator_id):
+            return "owner"
+        dm_id = instance.campaign.dm_id if instance.campaign_id else None
+    return "dm" if user_id and user_id == dm_id else "player"
+
+
+def make_key(name: str, vary_on: list[Any], role: str) -> str:
+    """The cache key of a fragment, model instances vary on their identity and `modified`."""
+    parts = [role]
+    for value in vary_on:
+        if isinstance(value, Model):
+            modified = getattr(value, "modified", None)
+            parts.append(f"{value._meta.label_lower}.{value.pk}.{modified}")
+        else:
+            parts.append(str(value))
+    digest = hashlib.md5(":".join(parts).encode(), usedforsecurity=False).hexdigest()
+    return f"fragment.{name}.{digest}"
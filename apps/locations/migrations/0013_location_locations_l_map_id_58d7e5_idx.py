@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-19 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("locations", "0012_alter_location_options_remove_location_order"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="location",
+            index=models.Index(
+                fields=["map", "hidden"], name="locations_l_map_id_58d7e5_idx"
+            ),
+        ),
+    ]
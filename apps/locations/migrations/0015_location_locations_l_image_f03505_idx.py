@@ -0,0 +1,16 @@
+# Generated by Django 4.2.3 on 2026-10-19 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("locations", "0014_weighted_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="location",
+            index=models.Index(fields=["image"], name="locations_l_image_f03505_idx"),
+        ),
+    ]
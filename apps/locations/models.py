@@ -44,4 +44,11 @@ class Location(TimeStampedModel):
     class Meta:
         verbose_name = "Location"
         verbose_name_plural = "Locations"
-        indexes = (models.Index(fields=["name"]), GinIndex(fields=["vector_column"]))
+        indexes = (
+            models.Index(fields=["name"]),
+            GinIndex(fields=["vector_column"]),
+            # The (polled) location list of a Map, filtered on hidden for non-DM's.
+            models.Index(fields=["map", "hidden"]),
+            # The rows that reference a stored file, see `apps.storage.is_referenced`.
+            models.Index(fields=["image"]),
+        )
@@ -0,0 +1,68 @@
+"""Coalesce the location polls of a Map.
+
+Everyone at the table polls the locations of the Map every 30 seconds and they all get the same payload, the only
+    difference being whether hidden Locations are shown to the DM. The payload is rendered once per state of the Map's
+    Locations and role, concurrent polls wait for that render (single-flight, see `apps.memoize`) and the result
+    is kept until a Location of the Map changes, so the database load of a table doesn't grow with the number of
+    players.
+
+The state is read from the database on every poll, the last modified time and the number of the Map's Locations,
+    so a change is seen by every worker process right away. `QuerySet.update()` doesn't set `modified`, set it
+    along in bulk updates of Locations.
+"""
+from typing import Callable, Optional
+
+from django.db.models import Count, Max
+
+from apps import memoize
+
+TIMEOUT = 60 * 60 * 24
+# The DM of a Campaign doesn't change.
+DM_TIMEOUT = 60 * 60 * 24
+
+
+def get_version(map_pk: int) -> str:
+    """The state of the Map's Locations, it changes with every save or delete of one of them."""
+    from apps.locations.models import Location
+
+    state = Location.objects.filter(map_id=map_pk).aggregate(
+        modified=Max("modified"), count=Count("pk")
+    )
+    modified = state["modified"].timestamp() if state["modified"] else 0
+    return f"{modified}.{state['count']}"
+
+
+def get_dm_id(campaign_pk: int) -> Optional[int]:
+    from apps.campaigns.models import Campaign
+
+    return memoize.get_or_compute(
+        f"campaign.dm.{campaign_pk}",
+        lambda: Campaign.objects.filter(pk=campaign_pk)
+        .values_list("dm_id", flat=True)
+        .first(),
+        DM_TIMEOUT,
+    )
+
+
+def get_payload_key(
+    campaign_pk: int, map_pk: int, is_dm: bool, active_location: Optional[int]
+) -> str:
+    # The Campaign is part of the key: the Map of another Campaign has no Locations in this one.
+    version = get_version(map_pk)
+    role = "dm" if is_dm else "player"
+    return f"locations.{campaign_pk}.{map_pk}.{version}.{role}.{active_location}"
+
+
+def get_payload(
+    campaign_pk: int,
+    map_pk: int,
+    is_dm: bool,
+    active_location: Optional[int],
+    render: Callable[[], str],
+) -> str:
+    """The rendered locations of the Map, `render` is only called by the first poll after a change."""
+    return memoize.get_or_compute(
+        get_payload_key(campaign_pk, map_pk, is_dm, active_location),
+        render,
+        TIMEOUT,
+    )
@@ -1,10 +1,16 @@
+import gzip
 from contextlib import nullcontext as does_not_raise
-from typing import Callable
+from typing import Callable, Optional
 
+import brotli
 import pytest
 from django.core.exceptions import PermissionDenied
+from django.db import connection
 from django.test.client import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from model_bakery import baker
 from PIL.ImageFile import ImageFile
 
 from apps.locations.models import Location
@@ -144,3 +150,73 @@ def test_location_create(
     assert response.status_code == status_code
     if not user.username == "player2":
         assert Location.objects.filter(name="Test").exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "accept_encoding,content_encoding,decompress",
+    [
+        ("gzip, deflate, br", "br", brotli.decompress),
+        ("gzip, br;q=0.5", "gzip", gzip.decompress),
+        ("identity", None, bytes),
+    ],
+)
+def test_location_list_compressed(
+    accept_encoding: str,
+    content_encoding: Optional[str],
+    decompress: Callable,
+    dm: User,
+    client: Client,
+    location: Location,
+) -> None:
+    """The location poll is minified and compressed with the encoding the browser prefers."""
+    client.force_login(dm)
+    response = client.get(
+        reverse(
+            "campaigns:maps:locations:list",
+            kwargs={"campaign_pk": location.map.campaign_id, "map_pk": location.map_id},
+        ),
+        headers={"HX-Request": "true", "Accept-Encoding": accept_encoding},
+    )
+    assert response.get("Content-Encoding") == content_encoding
+    assert "Accept-Encoding" in response["Vary"]
+    content = decompress(response.content).decode()
+    assert f'"id": {location.id},\n"name"' in content
+    assert "\n  " not in content
+
+
+@pytest.mark.django_db
+def test_location_list_coalesced(
+    dm: User, player1: User, client: Client, location: Location
+) -> None:
+    """The players poll a payload that is rendered once per change of the Map's Locations and role."""
+    url = reverse(
+        "campaigns:maps:locations:list",
+        kwargs={"campaign_pk": location.map.campaign_id, "map_pk": location.map_id},
+    )
+    hidden = baker.make(Location, map=location.map, hidden=True)
+    client.force_login(player1)
+    first = client.get(url).content.decode()
+    assert f'"id": {location.id},' in first
+    assert f'"id": {hidden.id},' not in first
+
+    # Only the state of the Map's Locations is read, the Locations aren't.
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get(url).content.decode() == first
+    location_queries = [
+        query["sql"] for query in queries if "locations_location" in query["sql"]
+    ]
+    assert len(location_queries) == 1
+    assert location_queries[0].startswith("SELECT MAX")
+
+    client.force_login(dm)
+    assert f'"id": {hidden.id},' in client.get(url).content.decode()
+
+    client.force_login(player1)
+    hidden.hidden = False
+    hidden.save()
+    assert f'"id": {hidden.id},' in client.get(url).content.decode()
+
+    # A change saved by another worker process is seen without a signal in this one.
+    Location.objects.filter(pk=hidden.pk).update(hidden=True, modified=timezone.now())
+    assert f'"id": {hidden.id},' not in client.get(url).content.decode()
@@ -1,4 +1,4 @@
-from typing import Type
+from typing import Optional, Type
 
 from django.core.exceptions import PermissionDenied
 from django.db.models import QuerySet
@@ -13,11 +13,12 @@ from django.views.generic import (
     UpdateView,
 )
 
-from apps.campaigns.models import Campaign
+from apps.locations import polls
 from apps.locations.forms import DMLocationForm, LocationForm
 from apps.locations.models import Location
 from apps.maps.models import Map
 from apps.mixins import CanCreateMixin
+from apps.oob import changed
 from apps.users.models import User
 
 
@@ -56,6 +57,34 @@ class LocationListView(CanCreateMixin, CampaignAndMapIncluded, ListView):
     template_name = "locations/location_list.html"
     context_object_name = "locations"
 
+    def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        """Acceptance criteria:
+        - Everyone polling the same Map with the same role gets the same payload, it is rendered once per change of
+            the Map's Locations.
+        """
+        campaign_pk = self.kwargs["campaign_pk"]
+        user: User = request.user
+        if not user.has_read_access_to_campaign(campaign_pk=campaign_pk):
+            raise PermissionDenied
+        content = polls.get_payload(
+            campaign_pk,
+            self.kwargs["map_pk"],
+            polls.get_dm_id(campaign_pk) == user.id,
+            self.get_active_location(),
+            self.render_payload,
+        )
+        return HttpResponse(content)
+
+    def render_payload(self) -> str:
+        response = super().get(self.request, *self.args, **self.kwargs)
+        return response.render().content.decode(response.charset)
+
+    def get_active_location(self) -> Optional[int]:
+        try:
+            return int(self.request.GET["active_location"])
+        except (KeyError, ValueError):
+            return None
+
     def get_queryset(self) -> QuerySet:
         """Acceptance criteria:
         - Anyone with access to the Campaign can see Locations.
@@ -71,8 +100,7 @@ class LocationListView(CanCreateMixin, CampaignAndMapIncluded, ListView):
                 .filter(map__campaign=campaign_pk)
                 .filter(map=map_pk)
             )
-            campaign = Campaign.objects.get(pk=campaign_pk)
-            if not campaign.dm_id == user.id:
+            if not polls.get_dm_id(campaign_pk) == user.id:
                 locations = locations.exclude(hidden=True)
 
             return locations
@@ -85,7 +113,7 @@ class LocationListView(CanCreateMixin, CampaignAndMapIncluded, ListView):
         This comes from the search modal so the User will know which marker on the map is the one that was searched for.
         """
         context = super().get_context_data(**kwargs)
-        context["active_location"] = self.request.GET.get("active_location")
+        context["active_location"] = self.get_active_location()
         return context
 
 
@@ -105,12 +133,12 @@ class LocationCreateView(
     def form_valid(self, form: LocationForm) -> HttpResponse:
         """Set the Location's Map by retrieving the map pk from the url.
 
-        Return a No-Content and set the HTMX trigger so the modal will be closed and the location list refreshed.
+        Respond with the changed fragments and set the HTMX trigger so the modal will be closed and the location list refreshed.
         """
         map = Map.objects.get(id=self.kwargs["map_pk"])
         form.instance.map = map
         self.object: Location = form.save()
-        return HttpResponse(status=204, headers={"HX-Trigger": "locationListChanged"})
+        return changed(self.request, "locationListChanged")
 
 
 class LocationUpdateView(
@@ -139,12 +167,12 @@ class LocationUpdateView(
         raise PermissionDenied()
 
     def form_valid(self, form: BaseForm) -> HttpResponse:
-        """Return a No-Content and set the HTMX trigger so the modal will be closed.
+        """Respond with the changed fragments and set the HTMX trigger so the modal will be closed.
 
         There is no need to refresh the location list as the marker position cannot be changed.
         """
         self.object = form.save()
-        return HttpResponse(status=204, headers={"HX-Trigger": "locationChanged"})
+        return changed(self.request, "locationChanged")
 
 
 class LocationDeleteView(CanCreateMixin, CampaignAndMapIncluded, DeleteView):
@@ -0,0 +1,207 @@
+"""Read the dimensions of an image from its header, without decoding it or reading the rest of the file.
+
+Supports PNG, JPEG, WebP and TIFF, other formats fall back to PIL.
+"""
+import io
+import struct
+from typing import IO, Any, Optional
+
+from django.core.files.storage import Storage
+from django.db.models.fields.files import FieldFile
+
+# Stop looking for the dimensions after this many bytes, like a JPEG with an enormous Exif block.
+MAX_HEADER_SIZE = 1024 * 1024
+BLOCK_SIZE = 64 * 1024
+
+Dimensions = tuple[int, int]
+
+
+class HeaderReader:
+    """Reads and skips through the start of a file, a file that can't seek is read forward instead."""
+
+    def __init__(self, file: IO[bytes]) -> None:
+        self.file = file
+        self.position = 0
+
+    def read(self, size: int) -> bytes:
+        if self.position + size > MAX_HEADER_SIZE:
+            raise EOFError
+        data = self.file.read(size)
+        if len(data) != size:
+            raise EOFError
+        self.position += size
+        return data
+
+    def unpack(self, format: str) -> tuple[Any, ...]:
+        return struct.unpack(format, self.read(struct.calcsize(format)))
+
+    def skip(self, size: int) -> None:
+        self.seek(self.position + size)
+
+    def seek(self, position: int) -> None:
+        if position > MAX_HEADER_SIZE:
+            raise EOFError
+        if self.file.seekable():
+            self.file.seek(self.start + position)
+            self.position = position
+        elif position < self.position:
+            raise ValueError("Can't seek back in the file.")
+        else:
+            self.read(position - self.position)
+
+    def __enter__(self) -> "HeaderReader":
+        self.start = self.file.tell() if self.file.seekable() else 0
+        return self
+
+    def __exit__(self, *args) -> None:
+        if self.file.seekable():
+            self.file.seek(self.start)
+
+
+def probe_png(reader: HeaderReader) -> Dimensions:
+    reader.skip(4)
+    if reader.read(4) != b"IHDR":
+        raise ValueError("PNG without IHDR chunk.")
+    return reader.unpack(">II")
+
+
+def probe_jpeg(reader: HeaderReader) -> Dimensions:
+    while True:
+        if reader.read(1) != b"\xff":
+            raise ValueError("Expected a JPEG marker.")
+        marker = reader.read(1)[0]
+        while marker == 0xFF:
+            marker = reader.read(1)[0]
+        if marker in (0x01, *range(0xD0, 0xD8)):
+            continue
+        if marker in (0xD9, 0xDA):
+            raise ValueError("JPEG without a frame header.")
+        (length,) = reader.unpack(">H")
+        # Start of frame, except for the DHT, JPG and DAC markers in the same range.
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            _, height, width = reader.unpack(">BHH")
+            return width, height
+        reader.skip(length - 2)
+
+
+def probe_webp(reader: HeaderReader) -> Dimensions:
+    reader.skip(4)
+    if reader.read(4) != b"WEBP":
+        raise ValueError("RIFF file that is not a WebP.")
+    chunk = reader.read(4)
+    reader.skip(4)
+    if chunk == b"VP8 ":
+        reader.skip(3)
+        if reader.read(3) != b"\x9d\x01\x2a":
+            raise ValueError("Invalid VP8 frame.")
+        width, height = reader.unpack("<HH")
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        if reader.read(1) != b"\x2f":
+            raise ValueError("Invalid VP8L signature.")
+        (bits,) = reader.unpack("<I")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        reader.skip(4)
+        data = reader.read(6)
+        return (
+            int.from_bytes(data[:3], "little") + 1,
+            int.from_bytes(data[3:], "little") + 1,
+        )
+    raise ValueError(f"Unknown WebP chunk {chunk!r}.")
+
+
+def probe_tiff(reader: HeaderReader, byte_order: str) -> Dimensions:
+    (version,) = reader.unpack(f"{byte_order}H")
+    if version != 42:
+        raise ValueError("Only classic TIFF is supported.")
+    (offset,) = reader.unpack(f"{byte_order}I")
+    reader.seek(offset)
+    (count,) = reader.unpack(f"{byte_order}H")
+    dimensions = {}
+    for _ in range(count):
+        tag, type, _, value = reader.unpack(f"{byte_order}HHI4s")
+        if tag in (256, 257):
+            # The value is a SHORT or a LONG, left aligned in the value field.
+            format = "H2x" if type == 3 else "I"
+            (dimensions[tag],) = struct.unpack(f"{byte_order}{format}", value)
+        if len(dimensions) == 2:
+            return dimensions[256], dimensions[257]
+    raise ValueError("TIFF without dimensions.")
+
+
+def probe_dimensions(file: IO[bytes]) -> Optional[Dimensions]:
+    """The `(width, height)` of the image from its header, None if the format isn't supported.
+
+    Leaves a seekable file at the position it was in.
+    """
+    with HeaderReader(file) as reader:
+        try:
+            signature = reader.read(2)
+            if signature == b"\x89P":
+                if reader.read(6) != b"NG\r\n\x1a\n":
+                    raise ValueError("Invalid PNG signature.")
+                return probe_png(reader)
+            if signature == b"\xff\xd8":
+                return probe_jpeg(reader)
+            if signature == b"RI" and reader.read(2) == b"FF":
+                return probe_webp(reader)
+            if signature in (b"II", b"MM"):
+                return probe_tiff(reader, "<" if signature == b"II" else ">")
+        except (EOFError, ValueError, struct.error):
+            pass
+    return None
+
+
+class RangedFile(io.RawIOBase):
+    """A read-only S3 object that is fetched in ranges, as far as it is read."""
+
+    def __init__(self, obj: Any) -> None:
+        self.obj = obj
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, position: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            position += self.position
+        elif whence == io.SEEK_END:
+            position += self.obj.content_length
+        self.position = position
+        return position
+
+    def readinto(self, buffer: Any) -> int:
+        end = min(self.position + len(buffer), self.obj.content_length) - 1
+        if end < self.position:
+            return 0
+        data = self.obj.get(Range=f"bytes={self.position}-{end}")["Body"].read()
+        buffer[: len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def open_stored(storage: Storage, name: str) -> IO[bytes]:
+    """Open a stored file for probing, S3 objects are read in ranges instead of downloaded."""
+    if hasattr(storage, "bucket_name"):
+        obj = storage.bucket.Object(storage._normalize_name(name))
+        return io.BufferedReader(RangedFile(obj), buffer_size=BLOCK_SIZE)
+    return storage.open(name, "rb")
+
+
+def get_image_dimensions(image: FieldFile) -> tuple[Optional[int], Optional[int]]:
+    """The dimensions of an uploaded or stored image, read from its header when possible."""
+    if image._committed:
+        with open_stored(image.storage, image.name) as file:
+            dimensions = probe_dimensions(file)
+    else:
+        dimensions = probe_dimensions(image.file)
+    if dimensions:
+        return dimensions
+    return image._get_image_dimensions()
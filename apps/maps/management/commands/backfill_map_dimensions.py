@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandParser
+from django.db.models import Q
+
+from apps.maps.images import get_image_dimensions
+from apps.maps.models import Map
+
+
+class Command(BaseCommand):
+    help = "Set the resolution of Maps that don't have one yet, reading only the header of their images."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only show what would be updated."
+        )
+
+    def handle(self, *args, **options) -> None:
+        maps = (
+            Map.objects.filter(
+                Q(resolution_height__isnull=True) | Q(resolution_width__isnull=True)
+            )
+            .exclude(image="")
+            .only("pk", "name", "image")
+            .order_by("pk")
+        )
+        batch: list[Map] = []
+        updated = failed = 0
+        for map in maps.iterator(chunk_size=options["batch_size"]):
+            try:
+                map.resolution_width, map.resolution_height = get_image_dimensions(
+                    map.image
+                )
+            except (OSError, TypeError) as e:
+                failed += 1
+                self.stderr.write(
+                    f"Failed to read {map.image.name} of Map {map.pk}: {e}"
+                )
+                continue
+            if options["verbosity"] > 1:
+                self.stdout.write(
+                    f"Map {map.pk}: {map.resolution_width}x{map.resolution_height}"
+                )
+            batch.append(map)
+            if len(batch) >= options["batch_size"]:
+                updated += self.update(batch, options["dry_run"])
+                batch = []
+        updated += self.update(batch, options["dry_run"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Updated {updated} Maps, {failed} failed.")
+        )
+
+    def update(self, maps: list[Map], dry_run: bool) -> int:
+        if not dry_run:
+            Map.objects.bulk_update(maps, ["resolution_width", "resolution_height"])
+        return len(maps)
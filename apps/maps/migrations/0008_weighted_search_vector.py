@@ -0,0 +1,37 @@
+# Generated by Django 4.2.3 on 2026-10-19 10:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0009_weighted_search_vector'),
+        ('maps', '0007_alter_map_description'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='''
+              DROP TRIGGER IF EXISTS vector_column_trigger ON maps_map;
+              CREATE TRIGGER vector_column_trigger
+              BEFORE INSERT OR UPDATE OF name, description, vector_column
+              ON maps_map
+              FOR EACH ROW EXECUTE PROCEDURE
+              search_vector_update('pg_catalog.english');
+
+              -- Existing rows are rebuilt in batches by the `rebuild_search_vectors` command.
+            ''',
+
+            reverse_sql='''
+              DROP TRIGGER IF EXISTS vector_column_trigger ON maps_map;
+              CREATE TRIGGER vector_column_trigger
+              BEFORE INSERT OR UPDATE OF name, description, vector_column
+              ON maps_map
+              FOR EACH ROW EXECUTE PROCEDURE
+              tsvector_update_trigger(
+                vector_column, 'pg_catalog.english', name, description
+              );
+            '''
+        ),
+    ]
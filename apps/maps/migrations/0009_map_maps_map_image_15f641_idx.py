@@ -0,0 +1,16 @@
+# Generated by Django 4.2.3 on 2026-10-19 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0008_weighted_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="map",
+            index=models.Index(fields=["image"], name="maps_map_image_15f641_idx"),
+        ),
+    ]
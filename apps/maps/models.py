@@ -4,6 +4,8 @@ from django.db import models
 from model_utils.models import TimeStampedModel
 from tinymce.models import HTMLField
 
+from apps.maps.images import get_image_dimensions
+
 
 class Map(TimeStampedModel):
     """
@@ -35,15 +37,28 @@ class Map(TimeStampedModel):
         )
 
     def save(self, *args, **kwargs) -> None:
-        """Set the resolutions on image save."""
-        super().save(*args, **kwargs)
+        """Set the resolutions on image save, before the row is written.
+
+        The dimensions are read from the header of the image, before an upload is stored.
+        """
         if self.image and not all([self.resolution_height, self.resolution_width]):
-            width, height = self.image._get_image_dimensions()
+            width, height = get_image_dimensions(self.image)
             self.resolution_width = width
             self.resolution_height = height
-            self.save(update_fields=["resolution_height", "resolution_width"])
+            update_fields = kwargs.get("update_fields", None)
+            if update_fields:
+                kwargs["update_fields"] = set(update_fields) | {
+                    "resolution_height",
+                    "resolution_width",
+                }
+        super().save(*args, **kwargs)
 
     class Meta:
         verbose_name = "Map"
         verbose_name_plural = "Maps"
-        indexes = (GinIndex(fields=["vector_column"]), models.Index(fields=["name"]))
+        indexes = (
+            GinIndex(fields=["vector_column"]),
+            models.Index(fields=["name"]),
+            # The rows that reference a stored file, see `apps.storage.is_referenced`.
+            models.Index(fields=["image"]),
+        )
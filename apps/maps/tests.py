@@ -1,4 +1,9 @@
+import base64
+import hashlib
+import io
+import os
 import tempfile
+import time
 from contextlib import nullcontext as does_not_raise
 from pathlib import Path
 from typing import Callable
@@ -6,13 +11,19 @@ from typing import Callable
 import pytest
 from django.core.exceptions import PermissionDenied
 from django.core.files.images import ImageFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
 from django.test import override_settings
 from django.test.client import Client, RequestFactory
 from django.urls import reverse
+from PIL import Image
 
+from apps import uploads
 from apps.campaigns.models import Campaign
+from apps.maps.images import probe_dimensions
 from apps.maps.models import Map
 from apps.maps.views import MapDeleteView, MapDetailView, MapUpdateView
+from apps.uploads import EXPIRES, UploadError, get_presigned_url, verify_upload
 from apps.users.models import User
 
 
@@ -152,3 +163,386 @@ def test_map_create(
     assert response.status_code == status_code
     if response.status_code == 204:
         assert Map.objects.filter(name="Test").exists()
+
+
+@pytest.mark.django_db
+def test_map_create_sets_resolution_in_single_write(
+    campaign1: Campaign, mock_image: ImageFile, django_assert_num_queries: Callable
+) -> None:
+    """The image's dimensions are set in the INSERT instead of a second UPDATE."""
+    with django_assert_num_queries(1):
+        map = Map.objects.create(
+            name="Test",
+            campaign=campaign1,
+            image=ImageFile(mock_image.file, name="test.png"),
+        )
+    map.refresh_from_db()
+    assert (map.resolution_width, map.resolution_height) == (50, 50)
+
+
+def upload_image(client: Client, image: ImageFile, **data) -> dict:
+    """Upload the image like the browser does, returns the upload."""
+    content = image.read()
+    data = {
+        "model": "maps.map",
+        "filename": "map.png",
+        "content_type": "image/png",
+        "size": len(content),
+        "sha256": hashlib.sha256(content).hexdigest(),
+        **data,
+    }
+    upload = client.post(reverse("create-upload"), data=data).json()
+    if "url" in upload:
+        response = client.generic(
+            upload["method"], upload["url"], content, content_type="image/png"
+        )
+        assert response.status_code == 200
+    return upload
+
+
+@pytest.mark.django_db
+def test_map_create_direct_upload(
+    dm: User, client: Client, mock_image: ImageFile, campaign1: Campaign
+) -> None:
+    """The Map is created from the image the browser uploaded straight to the storage."""
+    client.force_login(dm)
+    upload = upload_image(client, mock_image)
+    assert upload["url"].startswith("/uploads/")
+    response = client.post(
+        reverse("campaigns:maps:create", kwargs={"campaign_pk": campaign1.id}),
+        headers={"HX-Request": "true"},
+        data={"name": "Test", "upload": upload["token"]},
+    )
+    assert response.status_code == 204
+    map = Map.objects.get(name="Test")
+    mock_image.seek(0)
+    assert map.image.name == f"maps/{hashlib.sha256(mock_image.read()).hexdigest()}.png"
+    assert (map.resolution_width, map.resolution_height) == (50, 50)
+
+    # Only the content the upload was created for can be PUT.
+    response = client.put(upload["url"], b"", content_type="image/png")
+    assert response.status_code == 460
+    # An image the User already uses isn't uploaded again.
+    mock_image.seek(0)
+    assert upload_image(client, mock_image)["exists"]
+
+
+@pytest.mark.django_db
+def test_direct_upload_stored_by_other_user(
+    player2: User, client: Client, mock_image: ImageFile, map: Map
+) -> None:
+    """Knowing the hash of a stored image isn't enough, a User that doesn't use it has to upload it."""
+    map.image = ImageFile(mock_image.file, name="map.png")
+    map.save()
+    # The image was stored a while before the upload.
+    os.utime(default_storage.path(map.image.name), (time.time() - 60,) * 2)
+    mock_image.seek(0)
+    content = mock_image.read()
+    data = {
+        "model": "maps.map",
+        "filename": "map.png",
+        "content_type": "image/png",
+        "size": len(content),
+        "sha256": hashlib.sha256(content).hexdigest(),
+    }
+    client.force_login(player2)
+    upload = client.post(reverse("create-upload"), data=data).json()
+    assert "exists" not in upload
+    with pytest.raises(UploadError, match="hasn't been uploaded"):
+        verify_upload(upload["token"], user=player2, label="maps.map")
+
+    response = client.put(upload["url"], content, content_type="image/png")
+    assert response.status_code == 200
+    assert verify_upload(upload["token"], user=player2, label="maps.map") == (
+        map.image.name
+    )
+
+
+@pytest.mark.django_db
+def test_direct_upload_checksum_mismatch(
+    dm: User, client: Client, mock_image: ImageFile
+) -> None:
+    """The content of a direct upload has to match the SHA-256 it was created with."""
+    client.force_login(dm)
+    content = mock_image.read()
+    data = {
+        "model": "maps.map",
+        "filename": "map.png",
+        "content_type": "image/png",
+        "size": len(content),
+        "sha256": "0" * 64,
+    }
+    upload = client.post(reverse("create-upload"), data=data).json()
+    response = client.put(upload["url"], content, content_type="image/png")
+    assert response.status_code == 460
+    assert not default_storage.listdir("maps")[1]
+
+
+@pytest.mark.django_db
+def test_map_create_direct_upload_other_user(
+    dm: User,
+    player1: User,
+    client: Client,
+    mock_image: ImageFile,
+    campaign1: Campaign,
+) -> None:
+    """The token of an upload is only valid for the User that started it."""
+    client.force_login(dm)
+    upload = upload_image(client, mock_image)
+    client.force_login(player1)
+    response = client.post(
+        reverse("campaigns:maps:create", kwargs={"campaign_pk": campaign1.id}),
+        headers={"HX-Request": "true"},
+        data={"name": "Test", "upload": upload["token"]},
+    )
+    assert response.status_code == 200
+    assert "The upload is not valid." in response.content.decode()
+    assert not Map.objects.exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"content_type": "text/html"},
+        {"size": 501 * 1024 * 1024},
+        {"model": "campaigns.campaign"},
+    ],
+)
+def test_create_upload_invalid(
+    data: dict, dm: User, client: Client, mock_image: ImageFile
+) -> None:
+    client.force_login(dm)
+    upload = upload_image(client, mock_image, **data)
+    assert "error" in upload
+
+
+def test_presigned_url() -> None:
+    """With S3 the browser PUTs to a presigned URL, with the ACL and Cache-Control of the storage."""
+    from storages.backends.s3boto3 import S3Boto3Storage
+
+    storage = S3Boto3Storage(
+        bucket_name="campaign-alchemy",
+        access_key="key",
+        secret_key="secret",
+        region_name="ams3",
+        endpoint_url="https://ams3.digitaloceanspaces.com",
+        default_acl="public-read",
+        location="static",
+        object_parameters={"CacheControl": "max-age=86400"},
+    )
+    url, headers = get_presigned_url(storage, "maps/abc/map.png", "image/png", "0" * 64)
+    assert url.startswith(
+        "https://campaign-alchemy.ams3.digitaloceanspaces.com/static/maps/abc/map.png?"
+    ) or url.startswith(
+        "https://ams3.digitaloceanspaces.com/campaign-alchemy/static/maps/abc/map.png?"
+    )
+    assert "Signature" in url
+    assert headers == {
+        "Content-Type": "image/png",
+        "x-amz-checksum-sha256": base64.b64encode(bytes(32)).decode(),
+        "x-amz-acl": "public-read",
+        "Cache-Control": "max-age=86400",
+    }
+
+
+def patch_chunk(client: Client, url: str, chunk: bytes, offset: int, checksum=None):
+    checksum = checksum or base64.b64encode(hashlib.sha256(chunk).digest()).decode()
+    return client.generic(
+        "PATCH",
+        url,
+        chunk,
+        content_type="application/offset+octet-stream",
+        headers={"Upload-Offset": str(offset), "Upload-Checksum": f"sha256 {checksum}"},
+    )
+
+
+def wait_until_stored(client: Client, url: str) -> None:
+    for _ in range(50):
+        response = client.head(url)
+        if response.headers.get("Upload-Complete") == "?1":
+            return
+        time.sleep(0.1)
+    pytest.fail("The upload wasn't stored.")
+
+
+@pytest.mark.django_db
+def test_map_create_chunked_upload(
+    dm: User,
+    client: Client,
+    mock_image: ImageFile,
+    campaign1: Campaign,
+    settings,
+    tmpdir,
+    django_capture_on_commit_callbacks: Callable,
+) -> None:
+    """Large images are uploaded in checksummed chunks, an interrupted upload resumes at its offset."""
+    settings.UPLOAD_DIRECT_MAX_SIZE = 10
+    settings.UPLOAD_CHUNK_SIZE = 64
+    chunks_root = tmpdir.mkdir("chunks")
+    settings.UPLOAD_CHUNKS_ROOT = str(chunks_root)
+    content = mock_image.read()
+    client.force_login(dm)
+    upload = client.post(
+        reverse("create-upload"),
+        data={
+            "model": "maps.map",
+            "filename": "map.png",
+            "content_type": "image/png",
+            "size": len(content),
+        },
+    ).json()
+    assert upload["method"] == "PATCH"
+    assert upload["chunk_size"] == 64
+    url = upload["url"]
+
+    assert patch_chunk(client, url, content[:64], 0).status_code == 204
+    # A corrupted chunk is rejected and the upload resumes from the last good chunk.
+    response = patch_chunk(client, url, content[64:128], 64, checksum="corrupt")
+    assert response.status_code == 460
+    assert client.head(url).headers["Upload-Offset"] == "64"
+    # A chunk at the wrong offset returns the offset to continue from.
+    response = patch_chunk(client, url, content[128:192], 128)
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == "64"
+    # Chunks can't be larger than the chunk size.
+    assert patch_chunk(client, url, content[64:200], 64).status_code == 413
+
+    offset = 64
+    while offset < len(content):
+        response = patch_chunk(client, url, content[offset:][:64], offset)
+        assert response.status_code == 204
+        offset = int(response.headers["Upload-Offset"])
+    # The completed upload is stored in the background, the browser waits for it.
+    wait_until_stored(client, url)
+    assert patch_chunk(client, url, b"", len(content)).status_code == 409
+    assert [path.ext for path in chunks_root.listdir()] == [".name"]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post(
+            reverse("campaigns:maps:create", kwargs={"campaign_pk": campaign1.id}),
+            headers={"HX-Request": "true"},
+            data={"name": "Test", "upload": upload["token"]},
+        )
+    assert response.status_code == 204
+    map = Map.objects.get(name="Test")
+    assert map.image.name == f"maps/{hashlib.sha256(content).hexdigest()}.png"
+    assert map.image.read() == content
+    assert (map.resolution_width, map.resolution_height) == (50, 50)
+    # The form consumed the upload, nothing is left of it.
+    assert chunks_root.listdir() == []
+
+
+@pytest.mark.django_db
+def test_chunked_upload_interrupted_store(
+    dm: User,
+    client: Client,
+    mock_image: ImageFile,
+    settings,
+    tmpdir,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A complete upload whose store was interrupted, by a recycled worker, is stored again."""
+    settings.UPLOAD_DIRECT_MAX_SIZE = 10
+    settings.UPLOAD_CHUNK_SIZE = 1024 * 1024
+    settings.UPLOAD_CHUNKS_ROOT = str(tmpdir.mkdir("chunks"))
+    content = mock_image.read()
+    client.force_login(dm)
+    upload = client.post(
+        reverse("create-upload"),
+        data={
+            "model": "maps.map",
+            "filename": "map.png",
+            "content_type": "image/png",
+            "size": len(content),
+        },
+    ).json()
+    with monkeypatch.context() as patch:
+        patch.setattr(uploads, "store_completed", lambda *args: None)
+        assert patch_chunk(client, upload["url"], content, 0).status_code == 204
+        assert "Upload-Complete" not in client.head(upload["url"]).headers
+
+    response = patch_chunk(client, upload["url"], b"", len(content))
+    assert response.status_code == 409
+    wait_until_stored(client, upload["url"])
+    name = verify_upload(upload["token"], user=dm, label="maps.map")
+    assert default_storage.open(name).read() == content
+
+
+@pytest.mark.django_db
+def test_receive_chunk_direct_upload(
+    dm: User, client: Client, mock_image: ImageFile
+) -> None:
+    """The token of a direct upload can't be used for chunks."""
+    client.force_login(dm)
+    upload = upload_image(client, mock_image)
+    token = upload["url"].rstrip("/").rsplit("/", 1)[1]
+    url = reverse("receive-chunk", kwargs={"token": token})
+    assert client.head(url).status_code == 403
+    assert patch_chunk(client, url, b"data", 0).status_code == 403
+
+
+def test_clean_expired_uploads(settings, tmpdir) -> None:
+    """The files of uploads whose token has expired are deleted."""
+    chunks_root = tmpdir.mkdir("chunks")
+    settings.UPLOAD_CHUNKS_ROOT = str(chunks_root)
+    now = time.time()
+    for name, age in (("abandoned", 2 * EXPIRES), ("completed.name", 2 * EXPIRES)):
+        path = chunks_root.join(name)
+        path.write("data")
+        os.utime(path, (now - age, now - age))
+    chunks_root.join("active").write("data")
+    call_command("clean_uploads", stdout=io.StringIO())
+    assert [path.basename for path in chunks_root.listdir()] == ["active"]
+
+
+class CountingBytesIO(io.BytesIO):
+    read_bytes = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = super().read(size)
+        self.read_bytes += len(data)
+        return data
+
+
+@pytest.mark.parametrize(
+    "format,options",
+    [
+        ("PNG", {}),
+        ("JPEG", {}),
+        ("JPEG", {"progressive": True, "exif": b"Exif\x00\x00" + b"\x00" * 4000}),
+        ("WEBP", {}),
+        ("WEBP", {"lossless": True}),
+        ("TIFF", {}),
+        ("TIFF", {"compression": "tiff_lzw"}),
+    ],
+)
+def test_probe_dimensions(format: str, options: dict) -> None:
+    """The dimensions are read from the header, without reading the image data."""
+    file = CountingBytesIO()
+    Image.new("RGB", size=(1234, 567), color=(0, 128, 0)).save(
+        file, format=format, **options
+    )
+    file.seek(0)
+    assert probe_dimensions(file) == (1234, 567)
+    assert file.tell() == 0
+    assert file.read_bytes < 8192
+
+
+def test_probe_dimensions_unsupported() -> None:
+    file = io.BytesIO()
+    Image.new("RGB", size=(12, 34)).save(file, format="GIF")
+    file.seek(0)
+    assert probe_dimensions(file) is None
+    assert probe_dimensions(io.BytesIO(b"\x89PNG\r\n")) is None
+
+
+@pytest.mark.django_db
+def test_backfill_map_dimensions(campaign1: Campaign, mock_image: ImageFile) -> None:
+    map = Map.objects.create(
+        name="Test", campaign=campaign1, image=ImageFile(mock_image, name="test.png")
+    )
+    Map.objects.filter(pk=map.pk).update(resolution_width=None, resolution_height=None)
+    call_command("backfill_map_dimensions", stdout=io.StringIO())
+    map.refresh_from_db()
+    assert (map.resolution_width, map.resolution_height) == (50, 50)
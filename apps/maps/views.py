@@ -16,6 +16,8 @@ from apps.campaigns.models import Campaign
 from apps.locations.forms import LocationForm
 from apps.maps.models import Map
 from apps.mixins import CanCreateMixin
+from apps.oob import changed
+from apps.uploads import DirectUploadMixin
 from apps.users.models import User
 
 
@@ -45,7 +47,7 @@ class MapListView(CampaignIncluded, ListView):
         campaign_pk = self.kwargs["campaign_pk"]
         user: User = self.request.user
         if user.has_read_access_to_campaign(campaign_pk=campaign_pk):
-            return Map.objects.filter(campaign=campaign_pk)
+            return Map.objects.select_related("campaign").filter(campaign=campaign_pk)
         raise PermissionDenied
 
 
@@ -81,7 +83,7 @@ class MapDetailView(CanCreateMixin, DetailView):
         return [self.template_name]
 
 
-class MapCreateView(CampaignIncluded, CreateView):
+class MapCreateView(CampaignIncluded, DirectUploadMixin, CreateView):
     model = Map
     fields = ["name", "description", "image"]
     template_name = "maps/map_form.html"
@@ -101,14 +103,14 @@ class MapCreateView(CampaignIncluded, CreateView):
     def form_valid(self, form: BaseForm) -> HttpResponse:
         """Set the active campaign by retrieving the campaign pk from the url.
 
-        Return a No-Content and HTMX trigger to hide the modal and refresh the map list.
+        Respond with the changed fragments and the HTMX trigger to hide the modal and refresh the map list.
         """
         form.instance.campaign = Campaign.objects.get(id=self.kwargs["campaign_pk"])
         self.object = form.save()
-        return HttpResponse(status=204, headers={"HX-Trigger": "mapListChanged"})
+        return changed(self.request, "mapListChanged")
 
 
-class MapUpdateView(CanCreateMixin, UpdateView):
+class MapUpdateView(CanCreateMixin, DirectUploadMixin, UpdateView):
     model = Map
     fields = ["name", "description", "image"]
     template_name = "maps/map_form.html"
@@ -125,9 +127,9 @@ class MapUpdateView(CanCreateMixin, UpdateView):
         raise PermissionDenied
 
     def form_valid(self, form: BaseForm) -> HttpResponse:
-        """Return a No-Content and HTMX trigger to hide the modal and refresh the map page."""
+        """Respond with the changed fragments and the HTMX trigger to hide the modal and refresh the map page."""
         self.object = form.save()
-        return HttpResponse(status=204, headers={"HX-Trigger": "mapChanged"})
+        return changed(self.request, "mapChanged")
 
 
 class MapDeleteView(CanCreateMixin, DeleteView):
@@ -0,0 +1,95 @@
+"""Cache the results of expensive per-user computations, like permission checks.
+
+- A falsy result, like a denied permission, is a cached value like any other, with its own timeout. A miss is
+    told apart from a cached `False` because entries are stored as `(value, delta, expiry)`.
+- Only one thread computes a missing value, the others wait for it (single-flight) instead of all running the
+    same query when a popular entry expires.
+- An entry is refreshed before it expires, with a probability that grows as the expiry nears and with the time
+    the computation takes, see "Optimal Probabilistic Cache Stampede Prevention" (Vattani et al., 2015).
+    The other threads keep using the cached value while it is refreshed.
+"""
+import math
+import random
+import time
+from typing import Any, Callable, Optional, TypeVar
+
+from django.core.cache import cache
+
+T = TypeVar("T")
+
+# Values above 1 refresh earlier, values below 1 later.
+BETA = 1.0
+# How long a computation may take before the waiting threads compute the value themselves.
+LOCK_TIMEOUT = 5
+POLL_INTERVAL = 0.01
+MISSING = object()
+
+
+def get_lock_key(key: str) -> str:
+    return f"{key}.lock"
+
+
+def should_refresh(delta: float, expiry: float, beta: float = BETA) -> bool:
+    # `1 - random()` is never 0, so the logarithm is defined.
+    return time.time() - delta * beta * math.log(1 - random.random()) >= expiry
+
+
+def compute_and_set(
+    key: str, compute: Callable[[], T], timeout: int, negative_timeout: int
+) -> T:
+    start = time.monotonic()
+    try:
+        value = compute()
+        delta = time.monotonic() - start
+        timeout = timeout if value else negative_timeout
+        cache.set(key, (value, delta, time.time() + timeout), timeout)
+    finally:
+        cache.delete(get_lock_key(key))
+    return value
+
+
+def wait_for(key: str) -> Any:
+    """The value another thread is computing, MISSING if it doesn't show up in time."""
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+        if cache.get(get_lock_key(key)) is None:
+            # The computation failed, like a 404 for a Campaign that doesn't exist.
+            break
+    return MISSING
+
+
+def get_or_compute(
+    key: str,
+    compute: Callable[[], T],
+    timeout: int,
+    negative_timeout: Optional[int] = None,
+) -> T:
+    """The cached result of `compute`, computed when it is missing or about to expire.
+
+    Falsy results are cached for `negative_timeout` seconds, the `timeout` by default.
+    """
+    if negative_timeout is None:
+        negative_timeout = timeout
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expiry = entry
+        if not should_refresh(delta, expiry):
+            return value
+        # Refresh early, unless another thread is refreshing already.
+        if not cache.add(get_lock_key(key), True, LOCK_TIMEOUT):
+            return value
+        return compute_and_set(key, compute, timeout, negative_timeout)
+
+    if not cache.add(get_lock_key(key), True, LOCK_TIMEOUT):
+        value = wait_for(key)
+        if value is not MISSING:
+            return value
+    return compute_and_set(key, compute, timeout, negative_timeout)
+
+
+def invalidate(*keys: str) -> None:
+    cache.delete_many(keys)
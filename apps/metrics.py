@@ -0,0 +1,74 @@
+"""Counters kept in the shared cache, so they add up over all workers and threads.
+
+Every counter is registered with `register` when its module is imported, so the names are known without keeping
+    them in the cache. Increments are summed in the process and added to the shared counters at most every
+    FLUSH_INTERVAL seconds, counting doesn't cost a cache round trip per increment. The counters of a process lag
+    behind by up to that interval, `get_counters` flushes the counts of its own process first.
+
+Read them with the `metrics` management command.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+
+PREFIX = "metrics"
+FLUSH_INTERVAL = 10
+
+NAMES: set[str] = set()
+
+_pending: Counter[str] = Counter()
+_pending_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def register(*names: str) -> None:
+    NAMES.update(names)
+
+
+def flush() -> None:
+    """Add the counts of the process to the shared counters."""
+    global _flushed_at
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _flushed_at = time.monotonic()
+    for name, amount in pending.items():
+        key = f"{PREFIX}.{name}"
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            if not cache.add(key, amount, timeout=None):
+                cache.incr(key, amount)
+
+
+def increment(name: str, amount: int = 1) -> None:
+    """Increment a registered counter."""
+    if name not in NAMES:
+        raise ValueError(f"The counter {name} isn't registered.")
+    with _pending_lock:
+        _pending[name] += amount
+        due = time.monotonic() - _flushed_at >= FLUSH_INTERVAL
+    if due:
+        flush()
+
+
+def get_counters(prefix: str = "") -> dict[str, int]:
+    """All counters whose name starts with the prefix and that have been incremented."""
+    flush()
+    names = sorted(name for name in NAMES if name.startswith(prefix))
+    values = cache.get_many([f"{PREFIX}.{name}" for name in names])
+    return {
+        name: values[f"{PREFIX}.{name}"]
+        for name in names
+        if f"{PREFIX}.{name}" in values
+    }
+
+
+def reset(prefix: str = "") -> None:
+    names = {name for name in NAMES if name.startswith(prefix)}
+    with _pending_lock:
+        for name in names:
+            _pending.pop(name, None)
+    cache.delete_many([f"{PREFIX}.{name}" for name in names])
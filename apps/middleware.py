@@ -1,7 +1,75 @@
 import json
+import re
+import secrets
+import zlib
+from gzip import GzipFile
+from typing import AsyncIterator, Callable, Iterator, Optional, Union
 
+import brotli
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.contrib.messages import get_messages
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import patch_vary_headers
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import StreamingBuffer, compress_string
+
+from apps import admission
+
+# Only text is compressed, images and archives are compressed already.
+COMPRESSIBLE_TYPES = re.compile(
+    r"^(text/|application/(json|javascript|xml|geo\+json)|image/svg\+xml)"
+)
+
+
+class AdmissionControlMiddleware:
+    """
+    Limit the requests of each class a worker process handles at the same time and shed the rest, see `apps.admission`.
+
+    It comes after the AuthenticationMiddleware, the last payload of a poll is kept per User. Under ASGI a request
+    waits for its slot in a thread of its own, so it doesn't hold up the event loop or the thread of the sync views.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        admission_class = admission.get_class(admission.classify(request))
+        release = admission.acquire(admission_class)
+        if release is None:
+            return admission.shed(request, admission_class)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            release()
+            raise
+        admission.release_after(response, release)
+        if admission_class.stale:
+            admission.keep_stale(request, response)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        admission_class = admission.get_class(admission.classify(request))
+        release = await sync_to_async(admission.acquire, thread_sensitive=False)(
+            admission_class
+        )
+        if release is None:
+            return await sync_to_async(admission.shed)(request, admission_class)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            release()
+            raise
+        admission.release_after(response, release)
+        if admission_class.stale:
+            await sync_to_async(admission.keep_stale)(request, response)
+        return response
 
 
 class HtmxMessageMiddleware(MiddlewareMixin):
@@ -42,3 +110,147 @@ class HtmxMessageMiddleware(MiddlewareMixin):
         response.headers["HX-Trigger"] = json.dumps(hx_trigger)
 
         return response
+
+
+def get_encoding(accept_encoding: str) -> Optional[str]:
+    """The encoding to compress with, brotli or gzip, the preferred one of the Accept-Encoding header."""
+    qualities = {}
+    for coding in accept_encoding.lower().split(","):
+        name, _, parameters = coding.partition(";")
+        quality = 1.0
+        match = re.search(r"q=([0-9.]+)", parameters)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                continue
+        qualities[name.strip()] = quality
+    default = qualities.get("*", 0)
+    # Brotli compresses HTML better than gzip at the same speed, so it wins a tie.
+    encoding = max(("br", "gzip"), key=lambda name: qualities.get(name, default))
+    return encoding if qualities.get(encoding, default) > 0 else None
+
+
+class GzipCompressor:
+    """
+    Compress a stream with gzip, with the `process`, `flush` and `finish` of `brotli.Compressor`.
+
+    Like Django's `compress_string`, a random length file name is added to the header against BREACH.
+    """
+
+    def __init__(self, max_random_bytes: int) -> None:
+        self.buffer = StreamingBuffer()
+        self.file = GzipFile(
+            filename=b"a" * secrets.randbelow(max_random_bytes),
+            mode="wb",
+            compresslevel=6,
+            fileobj=self.buffer,
+            mtime=0,
+        )
+
+    def process(self, data: bytes) -> bytes:
+        self.file.write(data)
+        return self.buffer.read()
+
+    def flush(self) -> bytes:
+        self.file.flush(zlib.Z_SYNC_FLUSH)
+        return self.buffer.read()
+
+    def finish(self) -> bytes:
+        self.file.close()
+        return self.buffer.read()
+
+
+Compressor = Union[brotli.Compressor, GzipCompressor]
+
+
+def compress_chunk(compressor: Compressor, item: bytes) -> bytes:
+    # Without a flush the compressor holds on to the chunks until the stream ends, and nothing is streamed.
+    if not item:
+        return b""
+    return compressor.process(item) + compressor.flush()
+
+
+def compress_stream(
+    sequence: Iterator[bytes], compressor: Compressor
+) -> Iterator[bytes]:
+    for item in sequence:
+        data = compress_chunk(compressor, item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def compress_stream_async(
+    sequence: AsyncIterator[bytes], compressor: Compressor
+) -> AsyncIterator[bytes]:
+    async for item in sequence:
+        data = compress_chunk(compressor, item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress text responses, like HTMX partials, with brotli or gzip, whichever the browser prefers.
+
+    Streaming responses are compressed chunk by chunk and every chunk is flushed, so it reaches the browser as it
+    is streamed. Like Django's GZipMiddleware gzip adds random bytes against BREACH. Brotli can't, the CSRF token
+    is masked with a new secret for every response though.
+    """
+
+    min_size = 512
+    max_random_bytes = 100
+
+    def process_response(
+        self, request: HttpRequest, response: HttpResponse
+    ) -> HttpResponse:
+        # It's not worth compressing short responses, the headers weigh more.
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+        if response.has_header("Content-Encoding"):
+            return response
+        if not COMPRESSIBLE_TYPES.match(response.get("Content-Type", "")):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = get_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if encoding == "br":
+                compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=5)
+            else:
+                compressor = GzipCompressor(self.max_random_bytes)
+            if response.is_async:
+                response.streaming_content = compress_stream_async(
+                    response.streaming_content, compressor
+                )
+            else:
+                response.streaming_content = compress_stream(
+                    response.streaming_content, compressor
+                )
+            # The compressed size isn't known until the stream ends.
+            del response.headers["Content-Length"]
+        else:
+            if encoding == "br":
+                compressed_content = brotli.compress(
+                    response.content, mode=brotli.MODE_TEXT, quality=5
+                )
+            else:
+                compressed_content = compress_string(
+                    response.content, max_random_bytes=self.max_random_bytes
+                )
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers["Content-Length"] = str(len(response.content))
+
+        # A compressed response isn't byte for byte the same anymore, see RFC 9110 Section 8.8.1.
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
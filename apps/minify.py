@@ -0,0 +1,66 @@
+"""Minify the whitespace of HTML templates when they are compiled, so it isn't paid for on every render.
+
+Only whitespace that doesn't change the page is removed: the indentation of lines, blank lines and the line
+    breaks after lines with nothing but template tags or comments that don't output anything, like `{% for %}`
+    and `{% endif %}`. Other lines aren't joined, so inline scripts without semicolons keep working. `<pre>` and
+    `<textarea>` are left alone.
+"""
+import re
+
+from django.template import Origin
+from django.template.loaders import app_directories, filesystem
+
+PRESERVE = re.compile(r"(<(pre|textarea)\b.*?</\2>)", re.DOTALL | re.IGNORECASE)
+# Lines with only tags that don't output anything, other tags might render inline content.
+TAG_LINE = re.compile(
+    r"^(?:{%\s*(?:(?:end)?(?:if|for|block|with|comment|fragment_cache)|elif|else|empty|load|extends)\b[^%]*%}"
+    r"|{%[^%]*\bas \w+\s*%}|{#.*?#})+$"
+)
+
+
+def minify(source: str) -> str:
+    """The source of an HTML template without the whitespace that doesn't render."""
+    parts = PRESERVE.split(source)
+    # The split gives text, preserved block, tag name, text, ...
+    for index in range(0, len(parts), 3):
+        parts[index] = minify_text(parts[index])
+    return "".join(part for index, part in enumerate(parts) if index % 3 != 2)
+
+
+def minify_text(text: str) -> str:
+    lines = []
+    for line in text.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        if lines and TAG_LINE.match(lines[-1]):
+            lines[-1] += line
+        else:
+            lines.append(line)
+    minified = "\n".join(lines)
+    # Keep a line break at the edges, the text might continue the line of a preserved block.
+    if not minified:
+        return "\n" if text else ""
+    if text[0].isspace():
+        minified = "\n" + minified
+    if text[-1].isspace():
+        minified += "\n"
+    return minified
+
+
+class MinifyMixin:
+    """Minifies the `.html` templates the loader loads."""
+
+    def get_contents(self, origin: Origin) -> str:
+        contents = super().get_contents(origin)
+        if origin.template_name and origin.template_name.endswith(".html"):
+            return minify(contents)
+        return contents
+
+
+class FilesystemLoader(MinifyMixin, filesystem.Loader):
+    pass
+
+
+class AppDirectoriesLoader(MinifyMixin, app_directories.Loader):
+    pass
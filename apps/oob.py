@@ -0,0 +1,166 @@
+"""Refresh the fragments a change affects in the response to the change, as out of band swaps.
+
+Elements that show a list or detail declare themselves with `data-fragment` and `data-fragment-url` and every
+    HTMX request sends the fragments on the page along in the `HX-Fragments` header, see `project.js`. A view that
+    changes something responds with `changed(request, event)`: the fragments registered for the event that are on
+    the page are rendered by their own views and swapped in with `hx-swap-oob`, so the browser doesn't have to
+    fetch them again after the event.
+"""
+import copy
+import json
+import logging
+import re
+from typing import Iterator, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import Http404, HttpRequest, HttpResponse, QueryDict
+from django.urls import Resolver404, resolve
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+logger = logging.getLogger(__name__)
+
+HEADER = "HX-Fragments"
+# A page doesn't have more than a handful of fragments, don't render whatever a client sends.
+MAX_FRAGMENTS = 10
+# The target is used as a selector in the response.
+TARGET = re.compile(r"^[A-Za-z][\w-]*$")
+
+# The fragments to refresh after an HX-Trigger event, by their `data-fragment` name.
+REGISTRY: dict[str, tuple[str, ...]] = {
+    "campaignListChanged": ("campaign-list",),
+    "campaignChanged": ("campaign-detail",),
+    "mapListChanged": ("campaign-maps",),
+    "mapChanged": ("map-detail",),
+    "characterListChanged": (
+        "campaign-characters",
+        "campaign-npcs",
+        "character-list",
+    ),
+    "characterChanged": ("character-detail",),
+    "locationListChanged": ("location-list",),
+    "locationChanged": ("location-list",),
+    "userChanged": ("user-detail",),
+}
+# The views that render each fragment, by their view name. The URL of a fragment comes from the client, only these
+# views are run for it: they only read, unlike views that change something on a GET.
+FRAGMENTS: dict[str, tuple[str, ...]] = {
+    "campaign-list": ("campaigns:list",),
+    "campaign-detail": ("campaigns:detail",),
+    "campaign-maps": ("campaigns:maps:list",),
+    "campaign-characters": ("campaigns:characters:list",),
+    "campaign-npcs": ("campaigns:characters:npcs",),
+    "map-detail": ("campaigns:maps:detail",),
+    "character-list": ("characters:list",),
+    "character-detail": ("characters:detail",),
+    "location-list": ("campaigns:maps:locations:list",),
+    "user-detail": ("users:detail",),
+}
+
+
+class Fragment(NamedTuple):
+    name: str
+    target: str
+    url: str
+
+
+def get_fragments(request: HttpRequest) -> list[Fragment]:
+    """The fragments on the page of the request, invalid ones are left out."""
+    try:
+        data = json.loads(request.headers.get(HEADER, "[]"))
+    except json.JSONDecodeError:
+        return []
+    if not isinstance(data, list):
+        return []
+    fragments = []
+    for item in data[:MAX_FRAGMENTS]:
+        try:
+            fragment = Fragment(str(item["name"]), str(item["target"]), item["url"])
+        except (KeyError, TypeError):
+            continue
+        if TARGET.match(fragment.target) and isinstance(fragment.url, str):
+            fragments.append(fragment)
+    return fragments
+
+
+def get_affected_fragments(request: HttpRequest, event: str) -> Iterator[Fragment]:
+    names = REGISTRY.get(event, ())
+    targets = set()
+    for fragment in get_fragments(request):
+        if fragment.name in names and fragment.target not in targets:
+            targets.add(fragment.target)
+            yield fragment
+
+
+def render_fragment(request: HttpRequest, fragment: Fragment) -> Optional[str]:
+    """Render the URL of the fragment with its view like HTMX would GET it, with the user of the request.
+
+    Returns None when the URL isn't a path of this site, isn't one of the views of the fragment in FRAGMENTS or
+        the view doesn't respond with content. The view is called directly, without the middleware, and in a
+        savepoint: a fragment that fails is left out and doesn't undo the change it would show.
+    """
+    parts = urlsplit(fragment.url)
+    if parts.scheme or parts.netloc:
+        return None
+    try:
+        match = resolve(parts.path)
+    except Resolver404:
+        return None
+    if match.view_name not in FRAGMENTS.get(fragment.name, ()):
+        return None
+    fragment_request = copy.copy(request)
+    fragment_request.method = "GET"
+    fragment_request.path = fragment_request.path_info = parts.path
+    fragment_request.META = {
+        **request.META,
+        "REQUEST_METHOD": "GET",
+        "QUERY_STRING": parts.query,
+    }
+    fragment_request.GET = QueryDict(parts.query)
+    fragment_request.POST = QueryDict()
+    fragment_request.resolver_match = match
+    try:
+        with transaction.atomic():
+            response = match.func(fragment_request, *match.args, **match.kwargs)
+            if hasattr(response, "render"):
+                response.render()
+    except (PermissionDenied, Http404):
+        return None
+    except Exception:
+        logger.exception(
+            "Fragment %s failed to render from %s.", fragment.name, fragment.url
+        )
+        return None
+    if response.status_code != 200 or response.streaming:
+        return None
+    return response.content.decode(response.charset)
+
+
+def changed(request: HttpRequest, event: str) -> HttpResponse:
+    """The response to a change: the HX-Trigger event and the fragments it affects, swapped in out of band.
+
+    Without affected fragments on the page this is the No-Content the views used to respond with.
+    """
+    headers = {"HX-Trigger": event}
+    content = []
+    for fragment in get_affected_fragments(request, event):
+        html = render_fragment(request, fragment)
+        if html is None:
+            logger.info(
+                "Fragment %s can't be rendered from %s.", fragment.name, fragment.url
+            )
+            continue
+        content.append(
+            format_html(
+                '<div hx-swap-oob="innerHTML:#{}">{}</div>',
+                fragment.target,
+                mark_safe(html),
+            )
+        )
+    if not content:
+        return HttpResponse(status=204, headers=headers)
+    # Only the out of band fragments are swapped, the element that made the request stays as it is.
+    headers["HX-Reswap"] = "none"
+    return HttpResponse("".join(content), headers=headers)
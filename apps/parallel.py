@@ -0,0 +1,45 @@
+"""Run the independent queries of a request at the same time, each in a thread with a database connection of its own.
+
+The queries of a view run one after the other on the connection of the request, so a view with four independent
+    queries waits for the sum of them. Submitted to the pool it waits for the slowest one instead.
+
+A query in the pool doesn't see the uncommitted changes of the request's transaction, only use it for reads.
+    The connections of the pool are closed like the connection of a request, when they are older than CONN_MAX_AGE.
+"""
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import AsyncIterator, Callable, Iterable, Iterator, TypeVar
+
+from django.db import close_old_connections
+
+T = TypeVar("T")
+
+# Bounds the database connections a worker process opens on top of one per thread.
+MAX_WORKERS = 8
+
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="parallel")
+
+
+def call(func: Callable[[], T]) -> T:
+    close_old_connections()
+    try:
+        return func()
+    finally:
+        close_old_connections()
+
+
+def submit(funcs: Iterable[Callable[[], T]]) -> list[Future]:
+    """Start the functions in the pool."""
+    return [executor.submit(call, func) for func in funcs]
+
+
+def iter_completed(futures: list[Future]) -> Iterator[T]:
+    """The results of the futures in the order they complete."""
+    for future in as_completed(futures):
+        yield future.result()
+
+
+async def aiter_completed(futures: list[Future]) -> AsyncIterator[T]:
+    """The results of the futures in the order they complete, without blocking the event loop."""
+    for future in asyncio.as_completed([asyncio.wrap_future(f) for f in futures]):
+        yield await future
@@ -0,0 +1,73 @@
+"""Token bucket rate limiting, with the buckets in the shared cache so the limits hold over all workers and threads.
+
+A bucket holds up to `capacity` tokens and gains `rate` tokens per second. An action costs tokens and is only
+    allowed when the bucket has enough of them, so short bursts are allowed and a sustained rate is not.
+
+The read and write of a bucket aren't atomic, concurrent requests can get a few tokens more than the limit.
+"""
+import math
+import time
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpRequest
+
+PREFIX = "ratelimit"
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Rate limited, retry after {retry_after:.1f}s.")
+        self.retry_after = retry_after
+
+
+class Bucket(NamedTuple):
+    capacity: float
+    # Tokens per second.
+    rate: float
+
+
+def take(name: str, bucket: Bucket, cost: float) -> float:
+    """Take the cost from the bucket. Returns 0 when the tokens are taken, otherwise the seconds until they can be."""
+    key = f"{PREFIX}.{name}"
+    now = time.time()
+    tokens, updated = cache.get(key, (bucket.capacity, now))
+    tokens = min(bucket.capacity, tokens + (now - updated) * bucket.rate)
+    # An action that costs more than the capacity is allowed when the bucket is full.
+    cost = min(cost, bucket.capacity)
+    if tokens < cost:
+        return (cost - tokens) / bucket.rate
+    # A bucket that is full again is the same as a missing one.
+    timeout = math.ceil((bucket.capacity - tokens + cost) / bucket.rate) + 1
+    cache.set(key, (tokens - cost, now), timeout)
+    return 0
+
+
+def limit(names: list[str], bucket: Bucket, cost: float) -> None:
+    """Take the cost from every bucket, raises RateLimited when one of them doesn't have the tokens."""
+    for name in names:
+        retry_after = take(name, bucket, cost)
+        if retry_after:
+            raise RateLimited(retry_after)
+
+
+def get_client_ip(request: HttpRequest) -> str:
+    """The IP address of the client, to rate limit by.
+
+    Behind a proxy REMOTE_ADDR is the address of the proxy. With the `CLIENT_IP_HEADER` setting the address is
+        taken from that header instead, `CLIENT_IP_PROXIES` hops from the end: every proxy appends the address it
+        got the request from to `X-Forwarded-For`, the hops before those of the trusted proxies are sent by the
+        client and can't be trusted.
+    """
+    remote_addr = request.META.get("REMOTE_ADDR", "")
+    if not settings.CLIENT_IP_HEADER:
+        return remote_addr
+    hops = [
+        hop.strip()
+        for hop in request.META.get(settings.CLIENT_IP_HEADER, "").split(",")
+        if hop.strip()
+    ]
+    if len(hops) < settings.CLIENT_IP_PROXIES:
+        return remote_addr
+    return hops[-settings.CLIENT_IP_PROXIES]
@@ -1,62 +1,454 @@
-from itertools import chain
+"""Full text search across Campaigns, Characters, Maps and Locations.
 
-from django.db.models import Q
-from django.http import HttpRequest, HttpResponse
-from django.shortcuts import render
+The results of a search are cached per User, normalized query and page, as the pks and ranks of the results. The
+    key includes the version of the User's permissions and of every Campaign the User has access to. Saving or
+    deleting a Campaign, or a Character, Map or Location in it, bumps the version of the Campaign (see
+    `invalidate`), so a repeated search only fetches the results by their pks to render them. The versions are
+    in the shared cache, and the access of the User is checked again when the cached results are fetched, so a
+    Location that was hidden or a Campaign the User left since isn't shown either way.
+"""
+import hashlib
+import logging
+import math
+import re
+import uuid
+from functools import partial, reduce
+from operator import or_
+from typing import AsyncIterator, Callable, Iterator, NamedTuple, Optional
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, Func, Model, Q, QuerySet
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+
+from apps import memoize, metrics, parallel, ratelimit
 from apps.campaigns.models import Campaign
 from apps.characters.models import Character
 from apps.locations.models import Location
 from apps.maps.models import Map
-from apps.users.models import User
 
+MODELS: list[type[Model]] = [Character, Campaign, Map, Location]
+# The results of a model on a page, ranked by the weights of the search vectors.
+RESULTS_PER_MODEL = 10
+CONFIG = "english"
+# ts_headline marks the matched words with these, the `highlight` filter escapes the snippet and turns them into
+# <mark> elements.
+START_SEL = "\x02"
+STOP_SEL = "\x03"
+HEADLINE_OPTIONS = {"max_words": 25, "min_words": 10, "max_fragments": 2}
+# The values of the `type:` filter, an NPC is a Character.
+TYPES = ("character", "npc", "campaign", "map", "location")
+FILTER = re.compile(r'(?<!\S)(type|in):(?:"([^"]*)"|(\S+))', re.IGNORECASE)
+TIMEOUT = 60 * 10
+VERSION_TIMEOUT = None
 
-def search_all(request: HttpRequest) -> HttpResponse:
-    """Full text search across all models.
+# Searches of text shorter than this cost more, see `get_cost`.
+SHORT_QUERY = 4
+# The SQLSTATE of a statement cancelled by the statement timeout.
+QUERY_CANCELED = "57014"
 
-    See: https://pganalyze.com/blog/full-text-search-django-postgres
+logger = logging.getLogger(__name__)
+
+metrics.register("search.timeout", "search.rate_limited")
+
+# The pk and rank of the results on a page per model label, None when the search of the model timed out.
+Hits = dict[str, Optional[list[tuple[int, float]]]]
+# The label of a model, its hits and its rendered results.
+Result = tuple[str, Optional[list[tuple[int, float]]], str]
+
+
+def get_user_version_key(user_pk: int) -> str:
+    return f"search.version.user.{user_pk}"
+
+
+def get_campaign_version_key(campaign_pk: int) -> str:
+    return f"search.version.campaign.{campaign_pk}"
+
+
+def bump_versions(keys: set[str]) -> None:
+    cache.set_many({key: uuid.uuid4().hex for key in keys}, VERSION_TIMEOUT)
+
+
+def invalidate(instance: Model) -> None:
+    """Drop the cached searches that could have the instance as a result, or that it gives access to."""
+    campaign_pks = set()
+    user_pks = set()
+    if isinstance(instance, Campaign):
+        campaign_pks.add(instance.pk)
+        user_pks.add(instance.dm_id)
+    elif isinstance(instance, Character):
+        campaign_pks.update(
+            (instance.campaign_id, instance.tracker.previous("campaign"))
+        )
+        user_pks.update(
+            (
+                instance.player_id,
+                instance.creator_id,
+                instance.tracker.previous("player"),
+            )
+        )
+    elif isinstance(instance, Map):
+        campaign_pks.add(instance.campaign_id)
+    elif isinstance(instance, Location):
+        campaign_pks.add(instance.map.campaign_id)
+    keys = {get_campaign_version_key(pk) for pk in campaign_pks if pk} | {
+        get_user_version_key(pk) for pk in user_pks if pk
+    }
+    bump_versions(keys)
+    # Bumped again on commit, the searches run on connections of their own and don't see the open transaction.
+    transaction.on_commit(partial(bump_versions, keys))
+
+
+def get_accessible_campaigns(user_pk: int) -> list[int]:
+    user_version = cache.get(get_user_version_key(user_pk), "")
+    return memoize.get_or_compute(
+        f"search.campaigns.{user_pk}.{user_version}",
+        lambda: sorted(
+            Campaign.objects.filter(Q(dm=user_pk) | Q(characters__player=user_pk))
+            .values_list("pk", flat=True)
+            .distinct()
+        ),
+        TIMEOUT,
+    )
+
+
+def normalize(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def get_hits_key(user_pk: int, query: str, page: int) -> str:
+    version_keys = [get_user_version_key(user_pk)] + [
+        get_campaign_version_key(pk) for pk in get_accessible_campaigns(user_pk)
+    ]
+    versions = cache.get_many(version_keys)
+    parts = [str(user_pk), normalize(query), str(page)]
+    parts.extend(f"{key}={versions.get(key, '')}" for key in version_keys)
+    digest = hashlib.md5(":".join(parts).encode(), usedforsecurity=False).hexdigest()
+    return f"search.hits.{digest}"
+
+
+class ParsedQuery(NamedTuple):
+    """A search query: the text to search for and the filters on the types and Campaigns of the results."""
+
+    text: str
+    types: frozenset[str]
+    campaigns: tuple[str, ...]
+    # The values of `type:` filters that aren't one of TYPES.
+    unknown_types: tuple[str, ...] = ()
+
+
+def parse(query: str) -> ParsedQuery:
+    """Split the `type:` and `in:` filters from the text, which is searched with `websearch_to_tsquery`.
+
+    The text supports "quoted phrases", `or` and `-exclusion`. `type:` is one of TYPES, a plural works too,
+        and `in:` is the pk or the name of a Campaign, quoted when it has spaces. Repeated filters widen the search.
+    """
+    types = set()
+    unknown_types = []
+    campaigns = []
+    for name, quoted, value in FILTER.findall(query):
+        value = quoted or value
+        if name.lower() == "type":
+            kind = value.lower()
+            kind = kind if kind in TYPES else kind.removesuffix("s")
+            if kind in TYPES:
+                types.add(kind)
+            else:
+                unknown_types.append(value)
+        else:
+            campaigns.append(value)
+    text = " ".join(FILTER.sub(" ", query).split())
+    return ParsedQuery(text, frozenset(types), tuple(campaigns), tuple(unknown_types))
+
+
+def get_search_query(parsed: ParsedQuery) -> SearchQuery:
+    return SearchQuery(parsed.text, config=CONFIG, search_type="websearch")
+
+
+def resolve_campaigns(user_pk: int, campaigns: tuple[str, ...]) -> list[int]:
+    """The pks of the Campaigns of `in:` filters that the User has access to."""
+    accessible = get_accessible_campaigns(user_pk)
+    pks = {int(campaign) for campaign in campaigns if campaign.isdigit()}
+    names = [campaign for campaign in campaigns if not campaign.isdigit()]
+    if names:
+        pks.update(
+            Campaign.objects.filter(pk__in=accessible)
+            .filter(reduce(or_, (Q(name__iexact=name) for name in names)))
+            .values_list("pk", flat=True)
+        )
+    return sorted(pks.intersection(accessible))
+
+
+def get_accessible(
+    user_pk: int, campaign_pks: Optional[list[int]] = None
+) -> dict[str, QuerySet]:
+    """The rows the User has access to per model name, only those in the Campaigns of `campaign_pks` if given."""
+    # Subqueries instead of joins, so the matches aren't duplicated and don't have to be made distinct.
+    scope = Campaign.objects.filter(Q(dm=user_pk) | Q(characters__player=user_pk))
+    if campaign_pks is not None:
+        scope = scope.filter(pk__in=campaign_pks)
+    scope = scope.values("pk")
+    characters = Character.objects.filter(campaign__in=scope)
+    if campaign_pks is None:
+        characters = Character.objects.filter(
+            Q(player=user_pk) | Q(creator=user_pk) | Q(campaign__in=scope)
+        )
+    return {
+        "character": characters,
+        "campaign": Campaign.objects.filter(pk__in=scope),
+        "map": Map.objects.filter(campaign__in=scope),
+        "location": (
+            Location.objects.select_related("map").filter(map__campaign__in=scope)
+            # Only the DM of the Campaign sees its hidden Locations.
+            .exclude(Q(hidden=True) & ~Q(map__campaign__dm=user_pk))
+        ),
+    }
+
+
+def get_matches(
+    user_pk: int,
+    search_query: SearchQuery,
+    types: frozenset[str] = frozenset(),
+    campaign_pks: Optional[list[int]] = None,
+) -> list[QuerySet]:
+    """The matches of the query the User has access to, per model.
+
+    Only the models of the `types` are searched, all of them when there are none. With `campaign_pks` only those
+        Campaigns are searched.
+    """
+    querysets = get_accessible(user_pk, campaign_pks)
+    if types and types & {"character", "npc"} != {"character", "npc"}:
+        querysets["character"] = querysets["character"].filter(is_npc="npc" in types)
+    searched = {"character" if kind == "npc" else kind for kind in types}
+    return [
+        queryset.filter(vector_column=search_query)
+        for kind, queryset in querysets.items()
+        if not types or kind in searched
+    ]
+
+
+def get_querysets(user_pk: int, query: str, page: int = 1) -> list[QuerySet]:
+    """The results on the page per model, see `rank`."""
+    parsed = parse(query)
+    if not parsed.text:
+        return []
+    campaign_pks = None
+    if parsed.campaigns:
+        campaign_pks = resolve_campaigns(user_pk, parsed.campaigns)
+        if not campaign_pks:
+            return []
+    search_query = get_search_query(parsed)
+    return [
+        rank(queryset, search_query, page)
+        for queryset in get_matches(user_pk, search_query, parsed.types, campaign_pks)
+    ]
+
+
+def with_snippets(queryset: QuerySet, search_query: SearchQuery) -> QuerySet:
+    """Annotate a snippet of the description, the matched words highlighted."""
+    return queryset.annotate(
+        snippet=SearchHeadline(
+            Func(F("description"), function="search_strip_html"),
+            search_query,
+            config=CONFIG,
+            start_sel=START_SEL,
+            stop_sel=STOP_SEL,
+            **HEADLINE_OPTIONS,
+        )
+    )
+
+
+def rank(queryset: QuerySet, search_query: SearchQuery, page: int = 1) -> QuerySet:
+    """The top ranked matches on the page, with snippets.
+
+    Postgres computes the snippets after sorting and limiting the matches, so only for the results on the page.
+    """
+    start = (page - 1) * RESULTS_PER_MODEL
+    end = start + RESULTS_PER_MODEL
+    queryset = queryset.annotate(rank=SearchRank(F("vector_column"), search_query))
+    return with_snippets(queryset, search_query).order_by("-rank", "pk")[start:end]
+
+
+def get_cost(parsed: ParsedQuery, cached: bool) -> int:
+    """The tokens a search costs, see `apps.ratelimit`.
+
+    A cached search costs 1, otherwise a search costs 1 for every model it searches. That is doubled when it
+        isn't scoped to Campaigns with `in:` and doubled again when the text is short, broad searches match more.
     """
-    query = request.GET.get("search")
-    user: User = request.user
-    characters = (
-        Character.objects.filter(vector_column=query)
-        .filter(
-            Q(player=request.user)
-            | Q(creator=request.user)
-            | Q(campaign__dm=request.user)
-            | Q(campaign__characters__player=request.user)
-        )
-        .distinct()
+    if cached or not parsed.text:
+        return 1
+    searched = {"character" if kind == "npc" else kind for kind in parsed.types}
+    cost = len(searched) if parsed.types else len(MODELS)
+    if not parsed.campaigns:
+        cost *= 2
+    if len(parsed.text) < SHORT_QUERY:
+        cost *= 2
+    return max(cost, 1)
+
+
+def render_results(results: list[Model]) -> str:
+    return render_to_string("search_results.html", {"results": results})
+
+
+def search(queryset: QuerySet) -> Result:
+    """The label of the model, the hits and the rendered results of a queryset of `get_querysets`."""
+    results = list(queryset)
+    hits = [(result.pk, result.rank) for result in results]
+    return queryset.model._meta.label, hits, render_results(results)
+
+
+def hydrate(
+    user_pk: int,
+    model: type[Model],
+    hits: list[tuple[int, float]],
+    search_query: SearchQuery,
+) -> Result:
+    """Like `search`, fetching the cached hits of the model by their pks.
+
+    The hits the User has no access to anymore are left out, like a Location that has been hidden since.
+    """
+    queryset = get_accessible(user_pk)[model._meta.model_name]
+    results = with_snippets(queryset, search_query).in_bulk([pk for pk, _ in hits])
+    return (
+        model._meta.label,
+        hits,
+        render_results([results[pk] for pk, _ in hits if pk in results]),
+    )
+
+
+def guard(job: Callable[[], Result], label: str) -> Result:
+    """Run a job of `search` or `hydrate` with the statement timeout.
+
+    A query that is cancelled by the timeout has no results, and None for hits so the search isn't cached.
+    """
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config('statement_timeout', %s, true)",
+                [str(settings.SEARCH_STATEMENT_TIMEOUT)],
+            )
+            return job()
+    except OperationalError as error:
+        if getattr(error.__cause__, "pgcode", None) != QUERY_CANCELED:
+            raise
+    logger.warning("The search of %s timed out.", label)
+    metrics.increment("search.timeout")
+    return label, None, ""
+
+
+def stream_results(futures: list, key: Optional[str]) -> Iterator[str]:
+    yield render_to_string("search_results_header.html")
+    hits: Hits = {}
+    for label, model_hits, html in parallel.iter_completed(futures):
+        hits[label] = model_hits
+        yield html
+    yield render_footer(hits, key)
+
+
+async def astream_results(futures: list, key: Optional[str]) -> AsyncIterator[str]:
+    yield render_to_string("search_results_header.html")
+    hits: Hits = {}
+    async for label, model_hits, html in parallel.aiter_completed(futures):
+        hits[label] = model_hits
+        yield html
+    yield await sync_to_async(render_footer)(hits, key)
+
+
+def render_footer(hits: Hits, key: Optional[str]) -> str:
+    """Cache the hits of a complete search and render the end of the results."""
+    timed_out = any(model_hits is None for model_hits in hits.values())
+    if key and not timed_out:
+        cache.set(key, hits, TIMEOUT)
+    return render_to_string(
+        "search_results_footer.html",
+        {"found": any(hits.values()), "timed_out": timed_out},
     )
-    campaigns = (
-        Campaign.objects.filter(vector_column=query)
-        .filter(Q(dm=request.user) | Q(characters__player=request.user))
-        .distinct()
+
+
+def render_unknown_types(unknown_types: tuple[str, ...]) -> str:
+    return render_to_string("search_results_header.html") + render_to_string(
+        "search_results_footer.html",
+        {"found": False, "unknown_types": unknown_types, "types": TYPES},
     )
-    maps = (
-        Map.objects.filter(vector_column=query)
-        .filter(
-            Q(campaign__dm=request.user) | Q(campaign__characters__player=request.user)
-        )
-        .distinct()
+
+
+def get_page(request: HttpRequest) -> int:
+    try:
+        return max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        return 1
+
+
+def submit(user_pk: int, ip: str, query: str, page: int) -> tuple[list, Optional[str]]:
+    """Start the searches, or the hydration of the cached hits, in `apps.parallel`.
+
+    Returns the futures and the key to cache the hits with, None when they are cached already. Raises
+        RateLimited when the User or IP address has searched too much.
+    """
+    parsed = parse(query)
+    key = get_hits_key(user_pk, query, page)
+    hits: Optional[Hits] = cache.get(key)
+    cost = get_cost(parsed, cached=hits is not None)
+    ratelimit.limit(
+        [f"search.user.{user_pk}", f"search.ip.{ip}"],
+        ratelimit.Bucket(**settings.SEARCH_RATE_LIMIT),
+        cost,
     )
-    locations = (
-        Location.objects.filter(vector_column=query)
-        .filter(
-            Q(map__campaign__dm=request.user)
-            | Q(map__campaign__characters__player=request.user)
+    if hits is None:
+        futures = parallel.submit(
+            partial(guard, partial(search, queryset), queryset.model._meta.label)
+            for queryset in get_querysets(user_pk, query, page)
+        )
+        return futures, key
+    search_query = get_search_query(parsed)
+    futures = parallel.submit(
+        partial(
+            guard,
+            partial(hydrate, user_pk, model, hits[model._meta.label], search_query),
+            model._meta.label,
         )
-        .distinct()
+        for model in MODELS
+        if hits.get(model._meta.label)
     )
-    if not user.is_dm:
-        # TODO: I would rather do this in the query itself but it would become exceedingly complex,
-        #   if it could be done at all.
-        locations = locations.exclude(hidden=True)
+    return futures, None
 
-    results = chain(characters, campaigns, maps, locations)
 
-    return render(
-        request=request,
-        context={"results": results},
-        template_name="search_results.html",
-    )
+@transaction.non_atomic_requests
+async def search_all(request: HttpRequest) -> HttpResponse:
+    """Full text search across all models.
+
+    The query of every model runs at the same time in `apps.parallel` and its results are streamed as it
+        completes, so the search takes as long as the slowest query rather than the sum of them. Served by the
+        ASGI worker (`apps.utils.UvicornWorker`) the stream doesn't hold up a thread while the queries run.
+
+    Searches are rate limited per User and IP address, a search that is limited gets a `429 Too Many Requests`.
+        A search with an unknown `type:` isn't run, the User is told which types there are instead.
+
+    See: https://pganalyze.com/blog/full-text-search-django-postgres
+    """
+    user_pk = await sync_to_async(lambda: request.user.pk)()
+    if user_pk is None:
+        raise PermissionDenied
+    query = request.GET.get("search", "")
+    unknown_types = parse(query).unknown_types
+    if unknown_types:
+        # Without the filter the search would be another one than the User asked for, it isn't run or charged.
+        return HttpResponse(await sync_to_async(render_unknown_types)(unknown_types))
+    try:
+        futures, key = await sync_to_async(submit)(
+            user_pk, ratelimit.get_client_ip(request), query, get_page(request)
+        )
+    except ratelimit.RateLimited as error:
+        metrics.increment("search.rate_limited")
+        return HttpResponse(
+            status=429, headers={"Retry-After": str(math.ceil(error.retry_after))}
+        )
+    if isinstance(request, ASGIRequest):
+        return StreamingHttpResponse(astream_results(futures, key))
+    return StreamingHttpResponse(stream_results(futures, key))
@@ -0,0 +1,158 @@
+// Upload images straight to the storage, the form is submitted with the token of the upload instead of the file.
+// Images that are stored already aren't uploaded again.
+// Large images are uploaded in chunks, an interrupted upload resumes from the last chunk the server received,
+// also after reloading the page.
+const RETRIES = 5
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms))
+
+const sha256 = async (blob) => new Uint8Array(await crypto.subtle.digest("SHA-256", await blob.arrayBuffer()))
+
+const toBase64 = (bytes) => btoa(String.fromCharCode(...bytes))
+
+const toHex = (bytes) => Array.from(bytes, (byte) => byte.toString(16).padStart(2, "0")).join("")
+
+const getOffset = async (upload) => {
+  const response = await fetch(upload.url, {method: "HEAD", cache: "no-store"})
+  if (!response.ok) {
+    throw new Error("The upload has expired, please upload the image again.")
+  }
+  return parseInt(response.headers.get("Upload-Offset"))
+}
+
+const uploadChunks = async (upload, file, progress) => {
+  let offset = await getOffset(upload)
+  let failures = 0
+  while (offset < file.size) {
+    progress(offset / file.size)
+    const chunk = file.slice(offset, offset + upload.chunk_size)
+    try {
+      const response = await fetch(upload.url, {
+        method: "PATCH",
+        body: chunk,
+        headers: {
+          "Content-Type": "application/offset+octet-stream",
+          "Upload-Offset": offset,
+          "Upload-Checksum": `sha256 ${toBase64(await sha256(chunk))}`,
+        },
+      })
+      if (response.status === 403) {
+        throw new Error("The upload has expired, please upload the image again.")
+      }
+      if (response.ok || response.status === 409) {
+        offset = parseInt(response.headers.get("Upload-Offset"))
+        failures = 0
+        continue
+      }
+    } catch (error) {
+      if (error.message.startsWith("The upload has expired")) {
+        throw error
+      }
+    }
+    if (++failures > RETRIES) {
+      throw new Error("The upload failed, please try again.")
+    }
+    await sleep(1000 * 2 ** failures)
+    offset = await getOffset(upload)
+  }
+  progress(1)
+}
+
+// The server stores a completed upload in the background, the form can be submitted once it is stored.
+const waitUntilStored = async (upload, size) => {
+  for (let attempt = 0; attempt < 60; attempt++) {
+    const response = await fetch(upload.url, {method: "HEAD", cache: "no-store"})
+    if (!response.ok) {
+      throw new Error("The upload has expired, please upload the image again.")
+    }
+    if (response.headers.get("Upload-Complete") === "?1") {
+      return
+    }
+    if (parseInt(response.headers.get("Upload-Offset")) < size) {
+      throw new Error("The upload failed, please try again.")
+    }
+    await sleep(Math.min(500 * 2 ** attempt, 5000))
+  }
+  throw new Error("Storing the upload takes too long, please try again later.")
+}
+
+const uploadFile = async (upload, file) => {
+  const response = await fetch(upload.url, {method: upload.method, headers: upload.headers, body: file})
+  if (!response.ok) {
+    throw new Error("The upload failed, please try again.")
+  }
+}
+
+const createUpload = async (input, form, file) => {
+  // Resume the upload of the same file.
+  const key = `upload:${input.dataset.model}:${file.name}:${file.size}:${file.lastModified}`
+  const stored = localStorage.getItem(key)
+  if (stored) {
+    return [key, JSON.parse(stored)]
+  }
+  const data = new FormData()
+  data.append("model", input.dataset.model)
+  data.append("filename", file.name)
+  data.append("content_type", file.type)
+  data.append("size", file.size)
+  // Media is named after its content, small images are named before they are uploaded.
+  if (file.size <= parseInt(input.dataset.directMaxSize)) {
+    data.append("sha256", toHex(await sha256(file)))
+  }
+  const response = await fetch(input.dataset.directUpload, {
+    method: "POST",
+    body: data,
+    headers: {"X-CSRFToken": form.querySelector("input[name=csrfmiddlewaretoken]").value},
+  })
+  const upload = await response.json()
+  if (!response.ok) {
+    throw new Error(upload.error)
+  }
+  if (upload.method === "PATCH") {
+    localStorage.setItem(key, JSON.stringify(upload))
+  }
+  return [key, upload]
+}
+
+document.addEventListener("change", async (e) => {
+  const input = e.target
+  if (!input.matches("input[type=file][data-direct-upload]") || !input.files.length) {
+    return
+  }
+  const form = input.form
+  const file = input.files[0]
+  const submit = form.querySelector("[type=submit]")
+  const label = submit.textContent
+  const token = form.querySelector("input[name=upload]")
+  submit.disabled = true
+  try {
+    const [key, upload] = await createUpload(input, form, file)
+    if (upload.method === "PATCH") {
+      try {
+        await uploadChunks(upload, file, (done) => {
+          submit.textContent = `Uploading ${Math.floor(done * 100)}%`
+        })
+        submit.textContent = "Storing"
+        await waitUntilStored(upload, file.size)
+      } catch (error) {
+        if (error.message.startsWith("The upload has expired")) {
+          localStorage.removeItem(key)
+        }
+        throw error
+      }
+      localStorage.removeItem(key)
+    } else if (!upload.exists) {
+      await uploadFile(upload, file)
+    }
+    token.value = upload.token
+    // The file is uploaded already, don't send it along with the form.
+    input.value = ""
+  } catch (error) {
+    token.value = ""
+    input.value = ""
+    alert(error.message)
+  } finally {
+    submit.textContent = label
+    submit.disabled = false
+  }
+})
@@ -15,6 +15,18 @@ htmx.on("htmx:beforeSwap", (e) => {
   }
 })
 
+htmx.on("htmx:configRequest", (e) => {
+  // Send the fragments on the page along, a change responds with the ones it affects, see apps/oob.py.
+  const fragments = Array.from(document.querySelectorAll("[data-fragment]"), (element) => ({
+    name: element.dataset.fragment,
+    target: element.id,
+    url: element.dataset.fragmentUrl,
+  }))
+  if (fragments.length) {
+    e.detail.headers["HX-Fragments"] = JSON.stringify(fragments)
+  }
+})
+
 htmx.on("hidden.bs.modal", () => {
   // When modal is hidden => reset the form
   document.getElementById("dialog").innerHTML = ""
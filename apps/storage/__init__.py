@@ -0,0 +1,126 @@
+"""Content addressed storage of media.
+
+Files are stored under the SHA-256 of their content, like `maps/<sha256>.png`. A name never gets other content,
+    so the files can be cached forever, and identical uploads are stored once and shared. A shared file is only
+    deleted once no row references it anymore, see `apps.campaigns.signals.keep_shared_files`.
+
+A transaction that is going to reference a stored file holds a lock on its name until it commits, see
+    `lock_until_commit`, and a file is only checked for references and deleted while holding that lock. So a
+    file that is saved again, and found stored already, isn't deleted before the row referencing it is committed.
+"""
+import hashlib
+import posixpath
+import tempfile
+from typing import IO, Any, Optional
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import connection, models
+
+CHUNK_SIZE = 64 * 1024
+
+
+def get_hashed_name(name: str, digest: str) -> str:
+    """The content addressed name for a file with the name and the hex SHA-256 digest."""
+    directory, filename = posixpath.split(name)
+    extension = posixpath.splitext(filename)[1].lower()
+    return posixpath.join(directory, f"{digest}{extension}")
+
+
+def hash_content(content: IO[bytes]) -> tuple[str, IO[bytes]]:
+    """The hex SHA-256 digest of the content and the content to save.
+
+    Content that can't seek, like a request body, is spooled to a temporary file while it is hashed.
+    """
+    digest = hashlib.sha256()
+    try:
+        content.seek(0)
+    except (AttributeError, OSError):
+        spooled = tempfile.SpooledTemporaryFile(max_size=10 * 1024 * 1024)
+        while chunk := content.read(CHUNK_SIZE):
+            digest.update(chunk)
+            spooled.write(chunk)
+        spooled.seek(0)
+        return digest.hexdigest(), File(spooled)
+    while chunk := content.read(CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest(), content
+
+
+class HashedNameMixin:
+    """Save files under the hash of their content, a file that is stored already isn't saved again."""
+
+    def save(
+        self, name: Optional[str], content: Any, max_length: Optional[int] = None
+    ) -> str:
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        digest, content = hash_content(content)
+        name = get_hashed_name(name, digest)
+        lock_until_commit(name)
+        try:
+            return super().save(name, content, max_length)  # type: ignore[misc]
+        except FileExistsError:
+            return name
+
+    def get_available_name(self, name: str, max_length: Optional[int] = None) -> str:
+        """The same name means the same content, so there is no need to save it again."""
+        if self.exists(name):  # type: ignore[attr-defined]
+            raise FileExistsError(name)
+        return name
+
+
+class HashedFileSystemStorage(HashedNameMixin, FileSystemStorage):
+    pass
+
+
+def lock_until_commit(name: str) -> None:
+    """Keep the stored file from being deleted until the transaction commits, outside one this does nothing."""
+    if not connection.in_atomic_block:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [name])
+
+
+def lock(name: str) -> None:
+    """Wait until no transaction that may reference the stored file is open, and keep new ones waiting."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(hashtext(%s))", [name])
+
+
+def unlock(name: str) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", [name])
+
+
+def get_file_fields() -> list[tuple[type[models.Model], str]]:
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.get_fields()
+        if isinstance(field, models.FileField)
+    ]
+
+
+def is_referenced(name: str) -> bool:
+    """Whether any row of any model still references the stored file, the file fields are indexed for it."""
+    return any(
+        model._default_manager.filter(**{field: name}).exists()
+        for model, field in get_file_fields()
+    )
+
+
+def delete_unreferenced(name: str) -> bool:
+    """Delete the stored file unless a row references it, returns whether it was deleted."""
+    lock(name)
+    try:
+        if is_referenced(name):
+            return False
+        default_storage.delete(name)
+        return True
+    finally:
+        unlock(name)
@@ -0,0 +1,7 @@
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from apps.storage import HashedNameMixin
+
+
+class HashedS3Storage(HashedNameMixin, S3Boto3Storage):
+    pass
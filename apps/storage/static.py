@@ -0,0 +1,10 @@
+from compressor.storage import BrotliCompressorFileStorage, GzipCompressorFileStorage
+
+
+class PrecompressedCompressorStorage(
+    GzipCompressorFileStorage, BrotliCompressorFileStorage
+):
+    """Stores a gzip and a brotli variant next to every file django-compressor writes.
+
+    Whitenoise serves the variant the browser accepts, it compresses the files collectstatic writes itself.
+    """
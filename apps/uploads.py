@@ -0,0 +1,483 @@
+"""Uploads that go straight from the browser to the storage, without passing through a worker.
+
+1. The browser asks `create_upload` for an upload, with the SHA-256 of the file. It returns a URL to PUT the
+    file to and a signed token. Media is content addressed (see `apps.storage`), so a file the user already uses
+    for an image isn't uploaded again.
+2. The browser PUTs the file to the URL. In production that is a presigned S3 URL. With local storage it is
+    `receive_upload`, which stands in for S3 during development and tests.
+3. The browser submits the form with the token instead of the file, `DirectUploadForm` checks the token and
+    the uploaded object and stores its name on the instance.
+
+Stored names are public, so knowing a hash doesn't prove having the file. The upload of a file the user doesn't
+    use yet is required even when the file is stored already, the token is only accepted once the file has been
+    written after the token was issued. A chunked upload is named after the content the server received, so it
+    proves itself.
+
+Images larger than `UPLOAD_DIRECT_MAX_SIZE` are PATCHed to `receive_chunk` in chunks instead, so a flaky
+    connection only has to resend a chunk. The server appends the chunks to a file in `UPLOAD_CHUNKS_ROOT`. Once it
+    is complete the file is saved to the storage under its hash in the background, by at most STORE_WORKERS
+    threads per process, so the request of the last chunk doesn't wait for the transfer. The browser resumes an
+    upload from the offset `receive_chunk` returns for a HEAD request, and waits for its `Upload-Complete` before
+    the form is submitted. A store holds a lock on the chunks, a complete upload without a store holding the lock
+    was interrupted by a recycled or killed worker and is stored again.
+
+The chunks are assembled on the local disk, so all requests of a chunked upload have to reach the same host. With
+    more than one host `UPLOAD_CHUNKS_ROOT` has to be a shared volume that supports `flock`, or the requests have
+    to be routed to a host by their upload.
+
+The files of uploads that are abandoned, or completed and never submitted, are deleted by the `clean_uploads`
+    command once their token has expired.
+"""
+import base64
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Optional
+
+from django import forms
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core import signing
+from django.core.files import File
+from django.core.files.storage import Storage, default_storage
+from django.db import transaction
+from django.db.models import Model, Q
+from django.forms import modelform_factory
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.text import get_valid_filename
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods, require_POST
+
+from apps.storage import delete_unreferenced, get_hashed_name, lock_until_commit
+
+SALT = "apps.uploads"
+EXPIRES = 60 * 60
+# The models whose `image` can be uploaded directly.
+MODELS = ("maps.map", "characters.character")
+# The lookups from the models with an image to the Users that use it.
+OWNERS = {
+    "campaigns.campaign": ("dm",),
+    "maps.map": ("campaign__dm",),
+    "locations.location": ("map__campaign__dm",),
+    "characters.character": ("creator", "player"),
+}
+# The seconds the clock of the storage may be behind, when checking a file was written after its token was issued.
+CLOCK_SKEW = 5
+# Bounds the completed chunked uploads a worker process saves to the storage at the same time.
+STORE_WORKERS = 2
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=STORE_WORKERS, thread_name_prefix="uploads")
+
+
+class UploadError(Exception):
+    pass
+
+
+def get_image_field(label: str) -> Any:
+    if label not in MODELS:
+        raise UploadError(f"Uploading to {label} is not allowed.")
+    return apps.get_model(label)._meta.get_field("image")
+
+
+def get_presigned_url(
+    storage: Storage, name: str, content_type: str, sha256: str
+) -> tuple[str, dict[str, str]]:
+    """A presigned S3 PUT URL for the name and the headers the browser has to send along.
+
+    The storage rejects content that doesn't match the SHA-256, so the content matches its name.
+    """
+    from storages.utils import clean_name
+
+    params = storage.get_object_parameters(name)
+    params.update(
+        Bucket=storage.bucket_name,
+        Key=storage._normalize_name(clean_name(name)),
+        ContentType=content_type,
+        ChecksumSHA256=base64.b64encode(bytes.fromhex(sha256)).decode(),
+    )
+    headers = {
+        "Content-Type": content_type,
+        "x-amz-checksum-sha256": params["ChecksumSHA256"],
+    }
+    if storage.default_acl:
+        params["ACL"] = storage.default_acl
+        headers["x-amz-acl"] = storage.default_acl
+    if "CacheControl" in params:
+        headers["Cache-Control"] = params["CacheControl"]
+    url = storage.connection.meta.client.generate_presigned_url(
+        "put_object", Params=params, ExpiresIn=EXPIRES
+    )
+    return url, headers
+
+
+def is_used_by(user: Any, name: str) -> bool:
+    """Whether the stored file is the image of any row of the user."""
+    for label, lookups in OWNERS.items():
+        owned = Q()
+        for lookup in lookups:
+            owned |= Q(**{lookup: user})
+        if apps.get_model(label)._default_manager.filter(owned, image=name).exists():
+            return True
+    return False
+
+
+def prepare_upload(
+    user: Any, label: str, filename: str, content_type: str, size: int, sha256: str = ""
+) -> dict[str, Any]:
+    """Reserve the name for the upload and sign it for the user.
+
+    A direct upload is named after its SHA-256 right away. A chunked upload gets a unique id for its chunks, the
+        server names it after its content once all chunks are in.
+    """
+    field = get_image_field(label)
+    if not content_type.startswith("image/"):
+        raise UploadError("Only images can be uploaded.")
+    if not 0 < size <= settings.UPLOAD_MAX_SIZE:
+        raise UploadError(
+            f"Images can be at most {settings.UPLOAD_MAX_SIZE // 1024 // 1024} MB."
+        )
+    filename = get_valid_filename(filename)
+    upload = {"label": label, "user": user.pk, "size": size, "issued": time.time()}
+    if size > settings.UPLOAD_DIRECT_MAX_SIZE:
+        upload.update(
+            name=field.generate_filename(None, filename), chunked=uuid.uuid4().hex
+        )
+        token = signing.dumps(upload, salt=SALT)
+        return {
+            "url": reverse("receive-chunk", kwargs={"token": token}),
+            "method": "PATCH",
+            "chunk_size": settings.UPLOAD_CHUNK_SIZE,
+            "token": token,
+        }
+
+    if not re.fullmatch("[0-9a-f]{64}", sha256):
+        raise UploadError("The upload needs the SHA-256 of the image.")
+    upload["name"] = get_hashed_name(field.generate_filename(None, filename), sha256)
+    if is_used_by(user, upload["name"]) and default_storage.exists(upload["name"]):
+        upload["used"] = True
+        return {"token": signing.dumps(upload, salt=SALT), "exists": True}
+    token = signing.dumps(upload, salt=SALT)
+    if hasattr(default_storage, "bucket_name"):
+        url, headers = get_presigned_url(
+            default_storage, upload["name"], content_type, sha256
+        )
+    else:
+        url = reverse("receive-upload", kwargs={"token": token})
+        headers = {"Content-Type": content_type}
+    return {"url": url, "method": "PUT", "headers": headers, "token": token}
+
+
+def load_token(token: str) -> dict[str, Any]:
+    return signing.loads(token, salt=SALT, max_age=EXPIRES)
+
+
+def verify_upload(token: str, user: Any, label: str) -> str:
+    """The name of the object the token was issued for, once it has been uploaded."""
+    try:
+        upload = load_token(token)
+    except signing.BadSignature:
+        raise UploadError("The upload has expired, please upload the image again.")
+    if upload["user"] != user.pk or upload["label"] != label:
+        raise UploadError("The upload is not valid.")
+    name = upload["name"]
+    if upload.get("chunked"):
+        try:
+            name = get_completed_path(upload["chunked"]).read_text()
+        except FileNotFoundError:
+            raise UploadError("The image hasn't been stored yet, please try again.")
+    # The file of a deleted row may be deleted until the form's transaction commits, check it exists after.
+    lock_until_commit(name)
+    if not default_storage.exists(name):
+        raise UploadError("The image hasn't been uploaded yet.")
+    if not (upload.get("chunked") or upload.get("used")):
+        written = default_storage.get_modified_time(name).timestamp()
+        if written < upload["issued"] - CLOCK_SKEW:
+            raise UploadError("The image hasn't been uploaded yet.")
+    if default_storage.size(name) != upload["size"]:
+        delete_unreferenced(name)
+        raise UploadError("The image doesn't match the upload, please upload it again.")
+    return name
+
+
+@login_required
+@require_POST
+def create_upload(request: HttpRequest) -> HttpResponse:
+    """Acceptance criteria:
+    - Any User that can create Maps or Characters can upload their image.
+    """
+    if not request.user.can_create:
+        return JsonResponse({"error": "You can't upload images."}, status=403)
+    try:
+        upload = prepare_upload(
+            request.user,
+            label=request.POST.get("model", ""),
+            filename=request.POST.get("filename", ""),
+            content_type=request.POST.get("content_type", ""),
+            size=int(request.POST.get("size", 0)),
+            sha256=request.POST.get("sha256", ""),
+        )
+    except (UploadError, ValueError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(upload)
+
+
+@csrf_exempt
+@require_http_methods(["PUT"])
+def receive_upload(request: HttpRequest, token: str) -> HttpResponse:
+    """Stand-in for the presigned URL of S3 when the media is stored locally, the token authorizes the PUT."""
+    try:
+        upload = load_token(token)
+    except signing.BadSignature:
+        return HttpResponse(status=403)
+    if upload.get("chunked"):
+        return HttpResponse(status=403)
+    if int(request.headers.get("Content-Length", 0)) > upload["size"]:
+        return HttpResponse(status=413)
+    name = default_storage.save(upload["name"], File(request, name=upload["name"]))
+    if name != upload["name"]:
+        # The content doesn't match the SHA-256 the upload was created with.
+        delete_unreferenced(name)
+        return HttpResponse(status=460)
+    # A file that is stored already isn't written again, like S3 overwriting an object its modified time shows the
+    # upload happened.
+    os.utime(default_storage.path(name))
+    return HttpResponse(status=200)
+
+
+def get_chunks_path(upload_id: str) -> Path:
+    """The file the chunks of an upload are appended to."""
+    path = Path(settings.UPLOAD_CHUNKS_ROOT)
+    path.mkdir(parents=True, exist_ok=True)
+    return path / upload_id
+
+
+def get_completed_path(upload_id: str) -> Path:
+    """The file with the storage name of a completed chunked upload, until a form consumes the upload."""
+    return get_chunks_path(upload_id).with_suffix(".name")
+
+
+def store_chunks(upload_id: str, name: str) -> None:
+    """Save the completed chunks of an upload to the storage under its hash, in a thread of the `executor`.
+
+    Does nothing while another store of the upload holds the lock on its chunks, or once they have been stored.
+        When the store fails the chunks are deleted, so the browser starts the upload over.
+    """
+    path = get_chunks_path(upload_id)
+    try:
+        f = path.open("rb")
+    except FileNotFoundError:
+        return
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        # The store that held the lock before deleted the chunks once it was done.
+        if os.fstat(f.fileno()).st_nlink == 0:
+            return
+        try:
+            stored_name = default_storage.save(name, File(f, name=name))
+            get_completed_path(upload_id).write_text(stored_name)
+        except Exception:
+            logger.exception("The upload %s couldn't be stored.", upload_id)
+        finally:
+            path.unlink(missing_ok=True)
+
+
+def store_completed(upload_id: str, name: str) -> Future:
+    return executor.submit(store_chunks, upload_id, name)
+
+
+def is_complete(upload: dict[str, Any], path: Path) -> bool:
+    """Whether all chunks of the upload are in but it hasn't been stored yet."""
+    try:
+        return path.stat().st_size == upload["size"]
+    except FileNotFoundError:
+        return False
+
+
+def is_storing(path: Path) -> bool:
+    """Whether a store holds the lock on the chunks, the lock is released when the worker of the store exits."""
+    try:
+        with path.open("rb") as f:
+            fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    except FileNotFoundError:
+        pass
+    return False
+
+
+def restore_interrupted(upload: dict[str, Any], path: Path) -> None:
+    """Store a complete upload again whose store was interrupted."""
+    if is_complete(upload, path) and not is_storing(path):
+        logger.warning("Storing the interrupted upload %s again.", upload["chunked"])
+        store_completed(upload["chunked"], upload["name"])
+
+
+def consume(token: str) -> None:
+    """Delete the file with the storage name of a chunked upload, once the form that used it is saved."""
+    upload = load_token(token)
+    if upload.get("chunked"):
+        get_completed_path(upload["chunked"]).unlink(missing_ok=True)
+
+
+def clean_expired(now: Optional[float] = None) -> int:
+    """Delete the chunks and storage names of uploads whose token has expired, returns the number of files.
+
+    A file is changed by every chunk, so its token was issued before it was last changed.
+    """
+    now = time.time() if now is None else now
+    deleted = 0
+    for path in get_chunks_path("").iterdir():
+        try:
+            if now - path.stat().st_mtime > EXPIRES:
+                path.unlink()
+                deleted += 1
+        except FileNotFoundError:
+            continue
+    return deleted
+
+
+def append_chunk(
+    request: HttpRequest, upload: dict[str, Any], path: Path, offset: int
+) -> tuple[int, int]:
+    """Append the chunk in the request body to the file at the offset.
+
+    Returns the status and the offset after the chunk. The body is copied in 64 kB pieces, so memory use doesn't
+        depend on the size of the chunk. A chunk that doesn't match its `Upload-Checksum` is truncated again.
+    """
+    algorithm, _, checksum = request.headers.get("Upload-Checksum", "").partition(" ")
+    if algorithm != "sha256":
+        return 400, offset
+    with path.open("ab") as f:
+        # Concurrent requests for the same upload append one after the other.
+        fcntl.flock(f, fcntl.LOCK_EX)
+        current = f.seek(0, 2)
+        # A complete upload is being stored already.
+        if offset != current or current == upload["size"]:
+            return 409, current
+        limit = min(settings.UPLOAD_CHUNK_SIZE, upload["size"] - current)
+        digest = hashlib.sha256()
+        written = 0
+        while piece := request.read(64 * 1024):
+            written += len(piece)
+            if written > limit:
+                f.truncate(current)
+                return 413, current
+            digest.update(piece)
+            f.write(piece)
+        if base64.b64encode(digest.digest()).decode() != checksum:
+            f.truncate(current)
+            return 460, current
+        return 204, current + written
+
+
+@csrf_exempt
+@require_http_methods(["HEAD", "PATCH"])
+def receive_chunk(request: HttpRequest, token: str) -> HttpResponse:
+    """Receives the chunks of an upload, following the core of the tus protocol (https://tus.io).
+
+    HEAD returns the `Upload-Offset` to resume from, and `Upload-Complete: ?1` once the completed upload is
+        stored. PATCH appends a chunk at its `Upload-Offset`, the chunk has to match its
+        `Upload-Checksum: sha256 <base64 digest>`. The completed upload is saved to the storage in the background.
+    """
+    try:
+        upload = load_token(token)
+    except signing.BadSignature:
+        return HttpResponse(status=403)
+    if not upload.get("chunked"):
+        return HttpResponse(status=403)
+    path = get_chunks_path(upload["chunked"])
+    headers = {"Upload-Length": str(upload["size"]), "Cache-Control": "no-store"}
+    completed = get_completed_path(upload["chunked"])
+    if request.method == "HEAD":
+        if completed.exists():
+            offset = upload["size"]
+            headers["Upload-Complete"] = "?1"
+        else:
+            restore_interrupted(upload, path)
+            offset = path.stat().st_size if path.exists() else 0
+        return HttpResponse(headers={**headers, "Upload-Offset": str(offset)})
+
+    try:
+        offset = int(request.headers["Upload-Offset"])
+    except (KeyError, ValueError):
+        return HttpResponse(status=400, headers=headers)
+    if completed.exists() or is_complete(upload, path):
+        # The response to the last chunk got lost, the upload is complete already.
+        restore_interrupted(upload, path)
+        return HttpResponse(
+            status=409, headers={**headers, "Upload-Offset": str(upload["size"])}
+        )
+    status, offset = append_chunk(request, upload, path, offset)
+    if status == 204 and offset == upload["size"]:
+        store_completed(upload["chunked"], upload["name"])
+    return HttpResponse(
+        status=status, headers={**headers, "Upload-Offset": str(offset)}
+    )
+
+
+class DirectUploadForm(forms.ModelForm):
+    """Accepts the token of an image uploaded directly to the storage instead of the image itself."""
+
+    upload = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    def __init__(self, *args, user: Any = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.user = user
+        self.label = self._meta.model._meta.label_lower
+        self.image_required = self.fields["image"].required
+        self.fields["image"].required = False
+        self.fields["image"].widget.attrs.update(
+            {
+                "data-direct-upload": reverse("create-upload"),
+                "data-direct-max-size": settings.UPLOAD_DIRECT_MAX_SIZE,
+                "data-model": self.label,
+            }
+        )
+
+    def clean(self) -> dict[str, Any]:
+        cleaned_data = super().clean()
+        if cleaned_data.get("upload"):
+            try:
+                cleaned_data["image"] = verify_upload(
+                    cleaned_data["upload"], user=self.user, label=self.label
+                )
+            except UploadError as e:
+                self.add_error("image", str(e))
+            else:
+                transaction.on_commit(partial(consume, cleaned_data["upload"]))
+        elif (
+            self.image_required
+            and not cleaned_data.get("image")
+            and not self.instance.image
+        ):
+            self.add_error("image", self.fields["image"].error_messages["required"])
+        return cleaned_data
+
+
+class DirectUploadMixin:
+    """For Create and UpdateViews of a model whose image can be uploaded directly."""
+
+    model: type[Model]
+    fields: list[str]
+
+    def get_form_class(self) -> type[forms.ModelForm]:
+        return modelform_factory(self.model, form=DirectUploadForm, fields=self.fields)
+
+    def get_form_kwargs(self) -> dict[str, Any]:
+        kwargs = super().get_form_kwargs()  # type: ignore[misc]
+        kwargs["user"] = self.request.user  # type: ignore[attr-defined]
+        return kwargs
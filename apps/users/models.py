@@ -1,6 +1,5 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.core.cache import cache
 from django.core.mail import send_mail
 from django.db import models
 from django.db.models import BooleanField, CharField
@@ -9,6 +8,16 @@ from django.urls import reverse
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
+from apps import memoize
+
+READ_ACCESS_TIMEOUT = 600
+# Access is mostly denied to Users following an old link, they get access by joining, which invalidates the entry.
+READ_ACCESS_DENIED_TIMEOUT = 60
+
+
+def get_read_access_key(user_id: int, campaign_pk: int) -> str:
+    return f"{user_id}.user_has_read_access_to_campaign.{campaign_pk}"
+
 
 class User(AbstractUser):
     """
@@ -37,27 +46,31 @@ class User(AbstractUser):
         """Determine whether a User has read access to a Campaign.
 
         If any of the User's Characters is in a Campaign then the User has access.
+
+        Denials are cached too, for a shorter time, so Users without access don't run the queries on every request.
         """
-        has_read_access = cache.get(f"{self.id}.user_has_read_access_to_campaign")
-        if not has_read_access:
-            from apps.campaigns.models import Campaign
+        return memoize.get_or_compute(
+            get_read_access_key(self.id, campaign_pk),
+            lambda: self._has_read_access_to_campaign(campaign_pk),
+            timeout=READ_ACCESS_TIMEOUT,
+            negative_timeout=READ_ACCESS_DENIED_TIMEOUT,
+        )
 
-            campaign = get_object_or_404(Campaign, id=campaign_pk)
+    def _has_read_access_to_campaign(self, campaign_pk: int) -> bool:
+        from apps.campaigns.models import Campaign
 
-            if self.id == campaign.dm_id:
-                return True
+        campaign = get_object_or_404(Campaign, id=campaign_pk)
 
-            player_characters = self.player_characters.values_list("player_id")
-            creator_characters = self.creator_characters.values_list("player_id")
-            all_characters = player_characters.union(creator_characters)
-            campaign_characters = campaign.characters.values_list("player_id")
-            has_read_access = any(
-                character_id in campaign_characters for character_id in all_characters
-            )
-            cache.set(
-                f"{self.id}.user_has_read_access_to_campaign", has_read_access, 600
-            )
-        return has_read_access
+        if self.id == campaign.dm_id:
+            return True
+
+        player_characters = self.player_characters.values_list("player_id")
+        creator_characters = self.creator_characters.values_list("player_id")
+        all_characters = player_characters.union(creator_characters)
+        campaign_characters = campaign.characters.values_list("player_id")
+        return any(
+            character_id in campaign_characters for character_id in all_characters
+        )
 
     def save(self, *args, **kwargs) -> None:
         """Overloaded in order to send the Admin an email when a new User is created."""
@@ -1,5 +1,9 @@
+from typing import Callable
+
 import pytest
+from model_bakery import baker
 
+from apps.campaigns.models import Campaign
 from apps.users.models import User
 
 pytestmark = pytest.mark.django_db
@@ -7,3 +11,19 @@ pytestmark = pytest.mark.django_db
 
 def test_user_get_absolute_url(user: User):
     assert user.get_absolute_url() == f"/users/{user.username}/"
+
+
+def test_has_read_access_to_campaign_caches_denial(
+    player1: User,
+    player2: User,
+    campaign1: Campaign,
+    django_assert_num_queries: Callable,
+):
+    """Both the access and the denial are cached, per Campaign."""
+    assert player1.has_read_access_to_campaign(campaign1.pk)
+    assert not player2.has_read_access_to_campaign(campaign1.pk)
+    with django_assert_num_queries(0):
+        assert player1.has_read_access_to_campaign(campaign1.pk)
+        assert not player2.has_read_access_to_campaign(campaign1.pk)
+    other_campaign = baker.make(Campaign)
+    assert not player1.has_read_access_to_campaign(other_campaign.pk)
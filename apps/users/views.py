@@ -5,6 +5,8 @@ from django.http import HttpResponse
 from django.urls import reverse
 from django.views.generic import DetailView, RedirectView, UpdateView
 
+from apps.oob import changed
+
 User = get_user_model()
 
 
@@ -28,7 +30,7 @@ class UserUpdateView(LoginRequiredMixin, UpdateView):
 
     def form_valid(self, form: BaseForm) -> HttpResponse:
         self.object = form.save()
-        return HttpResponse(status=204, headers={"HX-Trigger": "userChanged"})
+        return changed(self.request, "userChanged")
 
     def get_object(self) -> User:
         return self.request.user
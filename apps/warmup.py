@@ -0,0 +1,47 @@
+"""Compile the templates up front, so the first requests of a worker don't pay for it.
+
+With the cached template loader a compiled template is kept for the lifetime of the process.
+"""
+import logging
+from pathlib import Path
+
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+
+logger = logging.getLogger(__name__)
+
+
+def get_template_names(engine) -> list[str]:
+    """The names of all templates in the project and app template directories, the first directory wins."""
+    names = set()
+    for loader in engine.template_loaders:
+        for directory in map(Path, loader.get_dirs()):
+            if directory.is_dir():
+                names.update(
+                    path.relative_to(directory).as_posix()
+                    for path in directory.rglob("*")
+                    if path.is_file() and not path.name.startswith(".")
+                )
+    return sorted(names)
+
+
+def warm_templates() -> tuple[int, list[str]]:
+    """Compile every template of the Django template engines.
+
+    Returns the number of compiled templates and the names of the ones that failed to compile,
+        like templates of apps that aren't installed.
+    """
+    compiled = 0
+    failed = []
+    for backend in engines.all():
+        engine = getattr(backend, "engine", None)
+        if engine is None:
+            continue
+        for name in get_template_names(engine):
+            try:
+                engine.get_template(name)
+            except (TemplateDoesNotExist, TemplateSyntaxError, UnicodeDecodeError):
+                failed.append(name)
+            else:
+                compiled += 1
+    logger.info("Compiled %s templates, %s failed.", compiled, len(failed))
+    return compiled, failed
@@ -1,6 +1,7 @@
 """
 Base settings to build other settings files upon.
 """
+import tempfile
 from pathlib import Path
 
 import environ
@@ -73,7 +74,6 @@ THIRD_PARTY_APPS = [
     "django_htmx",
     "tinymce",
     "django_bleach",
-    "anymail",
 ]
 
 LOCAL_APPS = [
@@ -131,11 +131,14 @@ AUTH_PASSWORD_VALIDATORS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    # Static files are compressed up front, whitenoise serves them before they get here.
+    "apps.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "apps.middleware.AdmissionControlMiddleware",
     "django_htmx.middleware.HtmxMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.common.BrokenLinkEmailsMiddleware",
@@ -144,6 +147,33 @@ MIDDLEWARE = [
     "apps.middleware.HtmxMessageMiddleware",
 ]
 
+# ADMISSION CONTROL
+# ------------------------------------------------------------------------------
+# The requests of each class a worker process handles at the same time (see GUNICORN_THREADS), the seconds a
+# request waits for a slot and the Retry-After of a request that doesn't get one, see `apps.admission`.
+# Writes and uploads wait for a slot, the background polls and search are shed right away. The limits only apply
+# once a worker handles ADMISSION_CAPACITY requests, until then a request borrows a free thread.
+ADMISSION_CAPACITY = env.int("GUNICORN_THREADS", default=4)
+ADMISSION_CLASSES = {
+    "write": {"limit": 4, "timeout": 10, "retry_after": 5},
+    "upload": {"limit": 2, "timeout": 10, "retry_after": 10},
+    "page": {"limit": 3, "timeout": 2, "retry_after": 2},
+    "search": {"limit": 2, "timeout": 0, "retry_after": 1},
+    "poll": {"limit": 2, "timeout": 0, "retry_after": 30, "stale": True},
+}
+
+# SEARCH
+# ------------------------------------------------------------------------------
+# Search is rate limited per User and IP address with token buckets in the cache (see `apps.ratelimit`), a search
+# costs more tokens the broader it is, see `apps.search.get_cost`. Search queries that take longer than the
+# statement timeout in milliseconds are cancelled and left out of the results.
+SEARCH_RATE_LIMIT = {"capacity": 64, "rate": 4}
+# Behind a proxy the IP address of the client is taken from the header the proxy sets, the number of trusted
+# proxies from the end of it, see `apps.ratelimit.get_client_ip`. Without a header REMOTE_ADDR is used.
+CLIENT_IP_HEADER = env("DJANGO_CLIENT_IP_HEADER", default=None)
+CLIENT_IP_PROXIES = env.int("DJANGO_CLIENT_IP_PROXIES", default=1)
+SEARCH_STATEMENT_TIMEOUT = env.int("SEARCH_STATEMENT_TIMEOUT", default=2000)
+
 # STATIC
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#static-root
@@ -164,6 +194,21 @@ STATICFILES_FINDERS = [
 MEDIA_ROOT = str(APPS_DIR / "media")
 # https://docs.djangoproject.com/en/dev/ref/settings/#media-url
 MEDIA_URL = "/media/"
+# https://docs.djangoproject.com/en/dev/ref/settings/#storages
+STORAGES = {
+    # Media is stored under the hash of its content, see `apps.storage`.
+    "default": {"BACKEND": "apps.storage.HashedFileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+# Images are uploaded directly to the storage, see `apps.uploads`. Images larger than UPLOAD_DIRECT_MAX_SIZE
+# are uploaded in resumable chunks instead, which the server assembles in UPLOAD_CHUNKS_ROOT. It is on the local disk,
+# with more than one host it has to be a shared volume.
+UPLOAD_DIRECT_MAX_SIZE = env.int("UPLOAD_DIRECT_MAX_SIZE", default=50 * 1024 * 1024)
+UPLOAD_MAX_SIZE = env.int("UPLOAD_MAX_SIZE", default=500 * 1024 * 1024)
+UPLOAD_CHUNK_SIZE = env.int("UPLOAD_CHUNK_SIZE", default=8 * 1024 * 1024)
+UPLOAD_CHUNKS_ROOT = env(
+    "UPLOAD_CHUNKS_ROOT", default=str(Path(tempfile.gettempdir()) / "uploads")
+)
 
 # TEMPLATES
 # ------------------------------------------------------------------------------
@@ -175,8 +220,20 @@ TEMPLATES = [
         # https://docs.djangoproject.com/en/dev/ref/settings/#dirs
         "DIRS": [str(APPS_DIR / "templates")],
         # https://docs.djangoproject.com/en/dev/ref/settings/#app-dirs
-        "APP_DIRS": True,
+        "APP_DIRS": False,
         "OPTIONS": {
+            # https://docs.djangoproject.com/en/dev/ref/templates/api/#django.template.loaders.cached.Loader
+            # Compiled templates are kept for the lifetime of the process, they are compiled up front by
+            # `apps.warmup` and minified once by `apps.minify` when they are compiled.
+            "loaders": [
+                (
+                    "django.template.loaders.cached.Loader",
+                    [
+                        "apps.minify.FilesystemLoader",
+                        "apps.minify.AppDirectoriesLoader",
+                    ],
+                )
+            ],
             # https://docs.djangoproject.com/en/dev/ref/settings/#template-context-processors
             "context_processors": [
                 "django.template.context_processors.debug",
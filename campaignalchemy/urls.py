@@ -8,6 +8,7 @@ from django.views import defaults as default_views
 from django.views.generic import TemplateView
 
 from apps.search import search_all
+from apps.uploads import create_upload, receive_chunk, receive_upload
 
 
 def trigger_error(request: HttpRequest) -> None:
@@ -27,6 +28,9 @@ urlpatterns = [
     path("users/", include("apps.users.urls", namespace="users")),
     path("accounts/", include("allauth.urls")),
     path("search/", search_all, name="full-search"),
+    path("uploads/", create_upload, name="create-upload"),
+    path("uploads/<str:token>/", receive_upload, name="receive-upload"),
+    path("uploads/<str:token>/chunks/", receive_chunk, name="receive-chunk"),
     path("campaigns/", include("apps.campaigns.urls", namespace="campaigns")),
     path("characters/", include("apps.characters.urls", namespace="characters")),
     # Your stuff: custom urls includes go here
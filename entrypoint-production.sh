@@ -12,10 +12,11 @@ set -e
 
 python manage.py migrate --noinput --verbosity 0
 
+# Both steps store a gzip and a brotli variant next to every file, whitenoise serves them without compressing per request.
 echo "Collecting static files"
 python manage.py collectstatic --noinput --verbosity 0
 
 echo "Compressing files"
 python manage.py compress
 
-gunicorn campaignalchemy.wsgi:application --bind 0.0.0.0:8000 --workers 2 --threads 4 --worker-tmp-dir /dev/shm --log-file -
+gunicorn campaignalchemy.wsgi:application --config gunicorn.conf.py
@@ -0,0 +1,81 @@
+"""Gunicorn configuration, see https://docs.gunicorn.org/en/stable/settings.html
+
+The application is loaded and warmed up once in the master process and shared with the workers through
+    copy-on-write. Set `GUNICORN_PRELOAD=false` to load it in every worker instead, to compare the boot time
+    and memory use the workers log.
+"""
+import gc
+import os
+import time
+from pathlib import Path
+
+bind = "0.0.0.0:8000"
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_tmp_dir = "/dev/shm"
+errorlog = "-"
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+# Recycle workers to bound the growth of their memory, the jitter keeps them from restarting all at once.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+
+def get_memory() -> dict[str, int]:
+    """The resident and proportional set size of this process in kB, PSS divides shared pages over the sharers."""
+    memory = {}
+    try:
+        lines = Path("/proc/self/smaps_rollup").read_text().splitlines()
+    except OSError:
+        return memory
+    for line in lines:
+        name, _, value = line.partition(":")
+        if name in ("Rss", "Pss"):
+            memory[name] = int(value.split()[0])
+    return memory
+
+
+def warm_up() -> None:
+    """Do the work every worker would otherwise do on its first requests."""
+    from django.core.files.storage import default_storage
+    from django.db import connections
+    from django.urls import get_resolver
+
+    # Image processing is imported on first use, the workers can share it though.
+    from PIL import Image  # noqa F401
+
+    from apps.warmup import warm_templates
+
+    get_resolver().reverse_dict  # noqa B018 populates the URL resolver
+    warm_templates()
+    # Import the storage backend (boto3 in production), the clients themselves are created per thread.
+    default_storage._setup()
+    # Forked workers must not share the database connections of the master.
+    connections.close_all()
+
+
+def when_ready(server) -> None:
+    if preload_app:
+        start = time.perf_counter()
+        warm_up()
+        server.log.info(
+            "Warmed up in %.2fs, %s", time.perf_counter() - start, get_memory()
+        )
+
+
+def pre_fork(server, worker) -> None:
+    # Move everything allocated so far out of reach of the garbage collector, so it doesn't touch (and copy)
+    # the pages it shares with the master.
+    gc.freeze()
+    worker.fork_time = time.perf_counter()
+
+
+def post_worker_init(worker) -> None:
+    if not preload_app:
+        warm_up()
+    worker.log.info(
+        "Worker %s booted in %.2fs, %s",
+        worker.pid,
+        time.perf_counter() - worker.fork_time,
+        get_memory(),
+    )